@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Benchmarks the work done for a burst of color changes in one frame.
+
+Builds the app without running it, sets the `LookupScreen` color many
+times in a row, as rapid taps or typing would, and then ticks the
+clock once to run the frame.  Reports the time spent setting colors,
+the time spent in the frame and the conversions that ran.
+
+Usage:
+    python benchmarks/bench_color_burst.py [updates]
+"""
+
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+
+import grapefruit
+from kivy.clock import Clock
+from kivy.uix.behaviors.knspace import knspace
+
+from colorstk.main import ColorsTKApp
+
+
+def main(updates=100):
+    app = ColorsTKApp()
+    app.load_config()
+    app.root = app.build()
+    lookup_screen = knspace.lookup_screen
+    # Run pending initial refreshes before measuring
+    Clock.tick()
+
+    colors = [grapefruit.Color(
+        tuple(random.random() for _ in range(3)),
+        wref=lookup_screen.white_point) for _ in range(updates)]
+    lookup_screen.bundle_cache.reset_counters()
+
+    start = time.time()
+    for color in colors:
+        lookup_screen.add_to_history(lookup_screen.color)
+        lookup_screen.color = color
+    burst_time = time.time() - start
+
+    start = time.time()
+    Clock.tick()
+    frame_time = time.time() - start
+
+    conversions = lookup_screen.bundle_cache.conversions
+    print('{} color updates in one frame'.format(updates))
+    print('  setting colors: {:.2f} ms'.format(burst_time * 1000))
+    print('  frame refresh:  {:.2f} ms'.format(frame_time * 1000))
+    print('  conversions:    {} ({})'.format(
+        sum(conversions.values()),
+        ', '.join('{} {}'.format(count, kind)
+                  for kind, count in sorted(conversions.items()))))
+    print('  history length: {}'.format(len(lookup_screen.history)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Benchmarks the colorstk-convert batch converter.
+
+Writes random hex colors to a file and converts them with
+`cli.convert_stream`, in this process and with a pool of worker
+processes, to the default color spaces with names, variants and
+schemes.  Reports colors per minute and the peak memory of this
+process, which stays about the same for more colors, since the input
+is read in chunks.
+
+Also checks the tetradic scheme columns of `colorstk-convert --schemes
+rgb` for pure red, which are at 60, 180 and 240 degrees of hue like
+grapefruit's, and exits non-zero if they differ.
+
+Usage:
+    python benchmarks/bench_convert.py [colors] [jobs]
+"""
+
+import csv
+import os
+from os.path import join
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from colorstk import cli
+from colorstk.core import batch, get_white_point, names
+
+# The tetradic scheme of pure red on the RGB color wheel
+RED_TETRADIC = ['#ffff00', '#00ffff', '#0000ff']
+
+
+def check_schemes(directory):
+    """Returns whether the converter writes the expected tetradic
+    scheme of pure red."""
+    path = join(directory, 'red.hex')
+    output_path = join(directory, 'red.csv')
+    with open(path, 'w') as hex_file:
+        hex_file.write('#ff0000\n')
+    if cli.main([path, '--schemes', 'rgb', '-o', output_path]) != 0:
+        return False
+    with open(output_path) as csv_file:
+        row = next(csv.DictReader(csv_file))
+    tetradic = [row['tetradic {}'.format(index)] for index in (1, 2, 3)]
+    if tetradic != RED_TETRADIC:
+        print('FAIL: tetradic scheme of #ff0000 is {}, expected {}'.format(
+            ','.join(tetradic), ','.join(RED_TETRADIC)))
+        return False
+    return True
+
+
+def main(colors=1000000, jobs=0):
+    jobs = jobs or os.cpu_count() or 1
+    directory = tempfile.mkdtemp()
+    try:
+        if not check_schemes(directory):
+            return 1
+        path = join(directory, 'colors.hex')
+        random = np.random.RandomState(0)
+        with open(path, 'w') as hex_file:
+            for start in range(0, colors, cli.CHUNK_SIZE):
+                rgb = random.random_sample(
+                    (min(cli.CHUNK_SIZE, colors - start), 3))
+                hex_file.write('\n'.join(batch.rgb_to_html(rgb).tolist()))
+                hex_file.write('\n')
+
+        for extras in (False, True):
+            options = cli.Options(
+                from_space=None, to_spaces=cli.DEFAULT_SPACES,
+                white_point=get_white_point('D65', 'CIE 1931'),
+                value_range='0-255', digits=3, names=extras,
+                name_index=names.default_index() if extras else None,
+                variants=extras,
+                schemes='ryb' if extras else None, output_format='csv')
+            for pool_size in sorted({1, jobs}):
+                with open(os.devnull, 'w') as output:
+                    start = time.time()
+                    count = cli.convert_stream(
+                        cli.read_chunks([path]), options, output, pool_size)
+                    elapsed = time.time() - start
+                print('{} colors{} {} job{}  {:7.2f} s  {:10,.0f} '
+                      'colors/min'.format(
+                          count, ' with names, variants, schemes'
+                          if extras else '', pool_size,
+                          's' if pool_size > 1 else ' ', elapsed,
+                          count * 60 / elapsed))
+    finally:
+        shutil.rmtree(directory)
+    print('peak memory {:.0f} MB'.format(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Benchmarks finding near-duplicate colors and removing colors.
+
+Times `core.dedupe.find_duplicates` on random colors of growing size,
+to show that it scales about linearly, and checks its result against a
+brute-force search that compares each color with every kept color.
+Also times removing half of the colors of a palette from a
+`core.store.SQLitePaletteStore`, and merging palettes with a dry run.
+Exits with a non-zero status if a result differs from brute force.
+
+Usage:
+    python benchmarks/bench_dedupe.py [colors] [palettes]
+"""
+
+from os.path import join
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from colorstk.core import dedupe, store
+from colorstk.core.batch import rgb_to_cielab
+from timing import timed
+
+
+def brute_force(rgb, tolerance):
+    """Returns the kept color each color duplicates, or -1."""
+    lab = rgb_to_cielab(rgb)
+    kept = []
+    originals = []
+    for index in range(len(lab)):
+        if kept:
+            dists = np.sqrt(((lab.take(kept, axis=0) - lab[index]) ** 2).sum(
+                axis=1))
+            nearest = int(dists.argmin())
+            if dists[nearest] <= tolerance:
+                originals.append(kept[nearest])
+                continue
+        kept.append(index)
+        originals.append(-1)
+    return np.array(originals)
+
+
+def main(colors=1000000, palettes=20):
+    random = np.random.RandomState(0)
+    failures = 0
+    for tolerance in (dedupe.TOLERANCE, 10.0):
+        rgb = random.random_sample((2000, 3))
+        # Exact duplicates as well
+        rgb = np.concatenate((rgb, rgb[::7]))
+        originals, _ = dedupe.find_duplicates(rgb, tolerance)
+        if not np.array_equal(originals, brute_force(rgb, tolerance)):
+            print('tolerance {} differs from brute force'.format(tolerance))
+            failures += 1
+
+    size = 10000
+    while size <= colors:
+        rgb = random.random_sample((size, 3))
+        (originals, _), elapsed = timed(
+            lambda: dedupe.find_duplicates(rgb))
+        print('{:>8} colors {:9.1f} ms  {:6.2f} us/color  {:>7} '
+              'duplicates'.format(size, elapsed * 1000, elapsed * 1e6 / size,
+                                  int((originals != -1).sum())))
+        size *= 10
+
+    directory = tempfile.mkdtemp()
+    try:
+        palette_store = store.SQLitePaletteStore(
+            join(directory, store.DATABASE_NAME))
+        values = random.random_sample((50000, 3)).tolist()
+        palette_store.create('large', values)
+        _, elapsed = timed(
+            lambda: palette_store.remove_colors('large', values[::2]))
+        print('remove {} of {} colors {:9.1f} ms'.format(
+            len(values[::2]), len(values), elapsed * 1000))
+
+        names = ['palette{}'.format(index) for index in range(palettes)]
+        with palette_store.transaction():
+            for name in names:
+                palette_store.create(name, random.random_sample(
+                    (5000, 3)).tolist())
+        result, elapsed = timed(lambda: dedupe.merge_palettes(
+            palette_store, names, 'merged', dry_run=True))
+        print('merge {} palettes of 5000 colors {:9.1f} ms  removes {}'
+              .format(palettes, elapsed * 1000, len(result.duplicates)))
+        palette_store.close()
+    finally:
+        shutil.rmtree(directory)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""Benchmarks the vectorized Delta-E functions against scalar code.
+
+Compares `core.deltae` with straightforward per-pair implementations
+for speed and agreement, then streams a large CIEDE2000 matrix in
+tiles.
+
+Usage:
+    python benchmarks/bench_delta_e.py [pairs] [matrix_size]
+"""
+
+import math
+import sys
+import time
+
+import numpy as np
+
+from colorstk.core import deltae
+
+
+def scalar_cie76(lab1, lab2):
+    return math.sqrt(sum((u - v) ** 2 for u, v in zip(lab1, lab2)))
+
+
+def scalar_cie94(lab1, lab2):
+    l1, a1, b1 = lab1
+    l2, a2, b2 = lab2
+    c1 = math.hypot(a1, b1)
+    c2 = math.hypot(a2, b2)
+    delta_c = c1 - c2
+    delta_h_sq = max((a1 - a2) ** 2 + (b1 - b2) ** 2 - delta_c ** 2, 0.0)
+    return math.sqrt((l1 - l2) ** 2 + (delta_c / (1 + 0.045 * c1)) ** 2 +
+                     delta_h_sq / (1 + 0.015 * c1) ** 2)
+
+
+def scalar_ciede2000(lab1, lab2):
+    l1, a1, b1 = lab1
+    l2, a2, b2 = lab2
+    c_mean_7 = ((math.hypot(a1, b1) + math.hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - math.sqrt(c_mean_7 / (c_mean_7 + 25.0 ** 7)))
+    a1, a2 = (1 + g) * a1, (1 + g) * a2
+    c1, c2 = math.hypot(a1, b1), math.hypot(a2, b2)
+    h1 = math.degrees(math.atan2(b1, a1)) % 360
+    h2 = math.degrees(math.atan2(b2, a2)) % 360
+    if c1 * c2 == 0:
+        delta_h = 0.0
+        h_mean = h1 + h2
+    else:
+        delta_h = h2 - h1
+        if delta_h > 180:
+            delta_h -= 360
+        elif delta_h < -180:
+            delta_h += 360
+        if abs(h1 - h2) <= 180:
+            h_mean = (h1 + h2) / 2
+        elif h1 + h2 < 360:
+            h_mean = (h1 + h2 + 360) / 2
+        else:
+            h_mean = (h1 + h2 - 360) / 2
+    delta_big_h = 2 * math.sqrt(c1 * c2) * math.sin(math.radians(delta_h / 2))
+    l_mean = (l1 + l2) / 2
+    c_mean = (c1 + c2) / 2
+    t = (1 - 0.17 * math.cos(math.radians(h_mean - 30)) +
+         0.24 * math.cos(math.radians(2 * h_mean)) +
+         0.32 * math.cos(math.radians(3 * h_mean + 6)) -
+         0.20 * math.cos(math.radians(4 * h_mean - 63)))
+    delta_theta = 30 * math.exp(-((h_mean - 275) / 25) ** 2)
+    r_c = 2 * math.sqrt(c_mean ** 7 / (c_mean ** 7 + 25.0 ** 7))
+    s_l = 1 + 0.015 * (l_mean - 50) ** 2 / math.sqrt(20 + (l_mean - 50) ** 2)
+    s_c = 1 + 0.045 * c_mean
+    s_h = 1 + 0.015 * c_mean * t
+    r_t = -math.sin(math.radians(2 * delta_theta)) * r_c
+    term_l = (l2 - l1) / s_l
+    term_c = (c2 - c1) / s_c
+    term_h = delta_big_h / s_h
+    return math.sqrt(term_l ** 2 + term_c ** 2 + term_h ** 2 +
+                     r_t * term_c * term_h)
+
+
+SCALAR = {'cie76': scalar_cie76, 'cie94': scalar_cie94,
+          'ciede2000': scalar_ciede2000}
+
+
+def main(pairs=200000, matrix_size=20000):
+    random = np.random.RandomState(0)
+    lab1 = deltae.lab_values(random.random_sample((pairs, 3)))
+    lab2 = deltae.lab_values(random.random_sample((pairs, 3)))
+    scalar_pairs = min(pairs, 20000)
+
+    for method in deltae.METHODS:
+        start = time.time()
+        vectorized = deltae.delta_e(lab1, lab2, method)
+        vector_time = time.time() - start
+
+        function = SCALAR[method]
+        start = time.time()
+        scalar = [function(u, v) for u, v in
+                  zip(lab1[:scalar_pairs].tolist(),
+                      lab2[:scalar_pairs].tolist())]
+        scalar_time = (time.time() - start) * pairs / scalar_pairs
+
+        error = np.abs(vectorized[:scalar_pairs] - scalar).max()
+        print('{:<10} vectorized {:8.1f} ms  scalar {:9.1f} ms  '
+              '{:6.0f}x  max diff {:.2e}'.format(
+                  method, vector_time * 1000, scalar_time * 1000,
+                  scalar_time / vector_time, error))
+
+    lab = deltae.lab_values(random.random_sample((matrix_size, 3)))
+    start = time.time()
+    minimum = np.inf
+    for row, column, tile in deltae.iter_matrix(lab, method='ciede2000'):
+        minimum = min(minimum, tile[tile > 0].min(initial=np.inf))
+    print('ciede2000 {0}x{0} matrix streamed in {1:.1f} s '
+          '(closest pair {2:.3f})'.format(
+              matrix_size, time.time() - start, minimum))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Benchmarks the import time of `colorstk.core`.
+
+Each import is timed in a fresh interpreter, so nothing is cached in
+`sys.modules`.  Exits with a non-zero status if the median import time
+exceeds the limit or if Kivy was imported.
+
+Usage:
+    python benchmarks/bench_import.py [runs]
+"""
+
+import os
+from os.path import abspath, dirname
+import subprocess
+import sys
+
+LIMIT = 0.05
+
+CODE = '''
+import sys, time
+start = time.time()
+import colorstk.core
+print(time.time() - start)
+print(any(name.split('.')[0] == 'kivy' for name in sys.modules))
+'''
+
+
+def time_import():
+    """Returns the import time and whether Kivy was imported."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [dirname(dirname(abspath(__file__))), env.get('PYTHONPATH', '')])
+    output = subprocess.check_output([sys.executable, '-c', CODE], env=env)
+    seconds, kivy_imported = output.decode().split()
+    return float(seconds), kivy_imported == 'True'
+
+
+def main(runs=11):
+    results = [time_import() for _ in range(runs)]
+    times = sorted(seconds for seconds, _ in results)
+    median = times[len(times) // 2]
+    print('colorstk.core import: median {:.1f} ms, min {:.1f} ms, '
+          'max {:.1f} ms ({} runs)'.format(
+              median * 1000, times[0] * 1000, times[-1] * 1000, runs))
+
+    failed = False
+    if any(kivy_imported for _, kivy_imported in results):
+        print('FAIL: importing colorstk.core imported Kivy')
+        failed = True
+    if median > LIMIT:
+        print('FAIL: median import time exceeds {:.0f} ms'.format(
+            LIMIT * 1000))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
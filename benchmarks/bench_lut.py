@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+"""Benchmarks the 3D LUT conversions against the exact conversions.
+
+For each table size, space and interpolation, measures the maximum
+Delta-E over all 8 bit colors and the time to convert random colors.
+Exits with a non-zero status if an error exceeds `lut.MAX_DELTA_E`, or
+if a table with the default tetrahedral interpolation is slower than
+the exact conversion.
+
+Usage:
+    python benchmarks/bench_lut.py [colors] [step]
+"""
+
+import sys
+
+import numpy as np
+
+from colorstk.core import batch, lut
+from timing import best_time, timed
+
+
+def main(colors=1000000, step=1):
+    random = np.random.RandomState(0)
+    rgb = random.random_sample((colors, 3))
+    rgb_bytes = np.rint(rgb * 255).astype(np.uint8)
+
+    failed = False
+    for color_space in lut.SPACES:
+        exact_time = best_time(lambda: batch.from_rgb(rgb, color_space))
+        print('{} exact: {:.1f} ms'.format(color_space, exact_time * 1000))
+        for size in lut.SIZES:
+            table, build_time = timed(
+                lambda: lut.ColorLUT(color_space, size))
+            for interpolation in lut.INTERPOLATIONS:
+                error = table.measure_error(interpolation, step=step)
+                float_time = best_time(
+                    lambda: table.apply(rgb, interpolation))
+                byte_time = best_time(
+                    lambda: table.apply(rgb_bytes, interpolation))
+                print('  {:>2}^3 {:<11} build {:5.1f} ms  float {:6.1f} ms '
+                      '({:3.1f}x)  uint8 {:6.1f} ms ({:3.1f}x)  '
+                      'max dE {:.3f}'.format(
+                          size, interpolation, build_time * 1000,
+                          float_time * 1000, exact_time / float_time,
+                          byte_time * 1000, exact_time / byte_time, error))
+                if error > lut.MAX_DELTA_E[size]:
+                    print('FAIL: max Delta-E {:.3f} exceeds {}'.format(
+                        error, lut.MAX_DELTA_E[size]))
+                    failed = True
+                if (interpolation == 'tetrahedral' and
+                        float_time > exact_time):
+                    print('FAIL: {}^3 table is slower than the exact '
+                          'conversion'.format(size))
+                    failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
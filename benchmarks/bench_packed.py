@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Benchmarks opening a large palette as lists and as packed colors.
+
+Compares reading the colors of one palette from a
+`core.store.SQLitePaletteStore` as lists, and parsing them from JSON,
+with `packed_colors`, which writes a packed file the first time and
+memory-maps it afterwards.  Also reports the size per color of packed
+files of each dtype and of the lists in memory.
+
+Usage:
+    python benchmarks/bench_packed.py [colors]
+"""
+
+import json
+import os
+from os.path import join
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from colorstk.core import packed, store
+from timing import timed
+
+
+def main(colors=1000000):
+    directory = tempfile.mkdtemp()
+    try:
+        values = np.random.RandomState(0).random_sample((colors, 3))
+        palette_store = store.SQLitePaletteStore(
+            join(directory, store.DATABASE_NAME))
+        palette_store.create('palette', values.tolist())
+        json_text = json.dumps(values.tolist())
+
+        _, list_time = timed(lambda: palette_store.get_colors('palette'))
+        _, json_time = timed(lambda: json.loads(json_text))
+        _, first_time = timed(lambda: palette_store.packed_colors('palette'))
+        packed_colors, open_time = timed(
+            lambda: palette_store.packed_colors('palette'))
+        _, read_time = timed(lambda: packed_colors[colors // 2])
+        tracemalloc.start()
+        color_lists = json.loads(json_text)
+        list_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del color_lists
+
+        print('{} colors'.format(colors))
+        print('read lists from sqlite   {:9.1f} ms'.format(list_time * 1000))
+        print('parse lists from json    {:9.1f} ms'.format(json_time * 1000))
+        print('pack on first open       {:9.1f} ms'.format(first_time * 1000))
+        print('open packed              {:9.3f} ms'.format(open_time * 1000))
+        print('read one packed color    {:9.3f} ms'.format(read_time * 1000))
+        print('lists in memory          {:9.1f} bytes/color'.format(
+            list_memory / float(colors)))
+        for dtype in packed.DTYPES:
+            path = join(directory, dtype + '.cpal')
+            packed.write_packed(path, values, dtype)
+            print('{:<24} {:9.1f} bytes/color'.format(
+                dtype + ' file', os.path.getsize(path) / float(colors)))
+        palette_store.close()
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Benchmarks opening large palette stores for the palette overview.
+
+Compares reading the `PaletteSummary` index of every palette with
+reading the colors of every palette, as `PalettesScreen` did before the
+index existed, for the time to open the store and the memory allocated.
+`BackgroundPaletteStore` is timed until its index is loaded.
+
+Usage:
+    python benchmarks/bench_palette_index.py [palettes] [colors_per_palette]
+"""
+
+from os.path import join
+import random
+import shutil
+import sys
+import tempfile
+
+from colorstk.core import store
+from timing import time_and_peak, timed
+
+
+def main(palettes=10000, colors_per_palette=50):
+    random.seed(0)
+    directory = tempfile.mkdtemp()
+    path = join(directory, store.DATABASE_NAME)
+    try:
+        palette_store = store.SQLitePaletteStore(path)
+        with palette_store.transaction():
+            for index in range(palettes):
+                palette_store.create('palette{}'.format(index), [
+                    [random.random(), random.random(), random.random()]
+                    for _ in range(colors_per_palette)])
+        palette_store.close()
+
+        def read_colors():
+            palette_store = store.SQLitePaletteStore(path)
+            colors = [palette_store.get_colors(name)
+                      for name in palette_store.names()]
+            palette_store.close()
+            return colors
+
+        def read_index():
+            palette_store = store.SQLitePaletteStore(path)
+            summaries = palette_store.summaries()
+            palette_store.close()
+            return summaries
+
+        def open_background():
+            palette_store = store.BackgroundPaletteStore(
+                lambda: store.SQLitePaletteStore(path))
+            summaries = palette_store.summaries()
+            palette_store.close()
+            return summaries
+
+        print('{} palettes of {} colors'.format(palettes, colors_per_palette))
+        for label, function in (('all colors', read_colors),
+                                ('index', read_index),
+                                ('background index', open_background)):
+            elapsed, peak = time_and_peak(function)
+            print('{:>16} {:8.1f} ms  peak {:8.1f} kB'.format(
+                label, elapsed * 1000, peak / 1024.0))
+
+        palette_store = store.BackgroundPaletteStore(
+            lambda: store.SQLitePaletteStore(path))
+        name = 'palette{}'.format(palettes // 2)
+        _, first = timed(lambda: palette_store.get_colors(name))
+        _, cached = timed(lambda: palette_store.get_colors(name))
+        palette_store.close()
+        print('open one palette {:8.2f} ms  cached {:6.3f} ms'.format(
+            first * 1000, cached * 1000))
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""Benchmarks appending colors to palette stores of increasing size.
+
+Compares `core.store.SQLitePaletteStore` with rewriting one JSON file of
+all palettes on every change, as `kivy.storage.jsonstore.JsonStore`
+does.  The time of a single append should stay constant for the SQLite
+store as the number of palettes grows.  For `BackgroundPaletteStore`,
+only the time an append blocks the calling thread is counted, plus the
+time to flush all appends.
+
+Usage:
+    python benchmarks/bench_palette_store.py [colors_per_palette] [appends]
+"""
+
+import json
+import os
+from os.path import join
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from colorstk.core import store
+
+SIZES = (10, 100, 1000, 10000)
+
+
+def random_color():
+    return [random.random(), random.random(), random.random()]
+
+
+def fill(palette_store, size, colors_per_palette):
+    """Adds `size` palettes of random colors to a store in one transaction."""
+    with palette_store.transaction():
+        for index in range(size):
+            palette_store.create(
+                'palette{}'.format(index),
+                [random_color() for _ in range(colors_per_palette)])
+
+
+def time_sqlite(directory, size, colors_per_palette, appends):
+    """Returns the mean time of one append and of one batched append."""
+    palette_store = store.SQLitePaletteStore(
+        join(directory, 'palettes{}.db'.format(size)))
+    fill(palette_store, size, colors_per_palette)
+    names = palette_store.names()
+
+    start = time.time()
+    for _ in range(appends):
+        palette_store.append_colors(random.choice(names), [random_color()])
+    single = (time.time() - start) / appends
+
+    start = time.time()
+    with palette_store.transaction():
+        for _ in range(appends):
+            palette_store.append_colors(random.choice(names),
+                                        [random_color()])
+    batched = (time.time() - start) / appends
+    palette_store.close()
+    return single, batched
+
+
+def time_background(directory, size, colors_per_palette, appends):
+    """Returns the mean time an append blocks the calling thread with a
+    `BackgroundPaletteStore`, and the time to flush all of them."""
+    path = join(directory, 'background{}.db'.format(size))
+    palette_store = store.BackgroundPaletteStore(
+        lambda: store.SQLitePaletteStore(path))
+    fill(palette_store, size, colors_per_palette)
+    palette_store.flush()
+    names = palette_store.names()
+
+    start = time.time()
+    for _ in range(appends):
+        palette_store.append_colors(random.choice(names), [random_color()])
+    blocking = (time.time() - start) / appends
+    start = time.time()
+    palette_store.flush()
+    flush = time.time() - start
+    palette_store.close()
+    return blocking, flush
+
+
+def time_json(directory, size, colors_per_palette, appends):
+    """Returns the mean time of one append with whole file rewrites."""
+    path = join(directory, 'palettes{}.json'.format(size))
+    palettes = {'palette{}'.format(index): {'colors': [
+        random_color() for _ in range(colors_per_palette)]}
+        for index in range(size)}
+    names = list(palettes)
+    start = time.time()
+    for _ in range(appends):
+        palettes[random.choice(names)]['colors'].append(random_color())
+        with open(path, 'w') as json_file:
+            json.dump(palettes, json_file)
+    return (time.time() - start) / appends
+
+
+def main(colors_per_palette=20, appends=200):
+    random.seed(0)
+    directory = tempfile.mkdtemp()
+    try:
+        for size in SIZES:
+            single, batched = time_sqlite(directory, size,
+                                          colors_per_palette, appends)
+            blocking, flush = time_background(directory, size,
+                                              colors_per_palette, appends)
+            json_time = time_json(directory, size, colors_per_palette,
+                                  max(appends // (size // 10 or 1), 5))
+            print('{:>6} palettes  sqlite {:7.1f} us/append  '
+                  'batched {:6.1f} us/append  background {:5.1f} us/append '
+                  '(flush {:5.1f} ms)  json rewrite {:9.1f} us/append'.format(
+                      size, single * 1e6, batched * 1e6, blocking * 1e6,
+                      flush * 1000, json_time * 1e6))
+        path = join(directory, 'palettes{}.db'.format(SIZES[-1]))
+        print('database size for {} palettes: {:.1f} kB'.format(
+            SIZES[-1], os.path.getsize(path) / 1024.0))
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""Benchmarks rendering palette previews and color grid textures.
+
+Times rendering the preview images of many palettes with
+`core.previews.PreviewCache`, the first time and again from its
+directory as on the next start, and packing the colors of a large
+palette into one texture image with `core.previews.color_texels`.
+
+Usage:
+    python benchmarks/bench_previews.py [palettes] [colors]
+"""
+
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from colorstk.core import packed, previews
+from timing import timed
+
+WIDTH, HEIGHT = 300, 200
+
+
+def main(palettes=1000, colors=1000000):
+    random = np.random.RandomState(0)
+    preview_colors = random.random_sample((palettes, 3, 3)).tolist()
+    directory = tempfile.mkdtemp()
+    try:
+        cache = previews.PreviewCache(directory, WIDTH, HEIGHT)
+        _, render_time = timed(
+            lambda: [cache.get(colors) for colors in preview_colors])
+        cache = previews.PreviewCache(directory, WIDTH, HEIGHT)
+        _, cached_time = timed(
+            lambda: [cache.get(colors) for colors in preview_colors])
+    finally:
+        shutil.rmtree(directory)
+    print('{} previews of {}x{}'.format(palettes, WIDTH, HEIGHT))
+    print('render     {:8.3f} ms/preview'.format(
+        render_time * 1000 / palettes))
+    print('cached     {:8.3f} ms/preview'.format(
+        cached_time * 1000 / palettes))
+
+    values = packed.PackedColors(
+        random.random_sample((colors, 3)).astype(np.float32))
+    texels, texels_time = timed(lambda: previews.color_texels(values))
+    print('{} colors to a {}x{} texture {:8.1f} ms'.format(
+        colors, texels.shape[1], texels.shape[0], texels_time * 1000))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Benchmarks batched color schemes against grapefruit's schemes.
+
+Compares `core.wheel.make_schemes` over an array of colors with
+`core.make_schemes` called for one `grapefruit.Color` at a time, for
+speed and agreement, and checks the tetradic schemes against
+`grapefruit.Color.make_tetradic_scheme` on both color wheels.  The exit
+status is non-zero if they differ.
+
+Usage:
+    python benchmarks/bench_schemes.py [colors]
+"""
+
+import sys
+import time
+
+import grapefruit
+import numpy as np
+
+from colorstk import core
+from colorstk.core import wheel
+
+# Largest difference of an RGB value from grapefruit's
+TOLERANCE = 1e-6
+
+
+def tetradic_error(rgb, grapefruit_colors, mode):
+    """Returns the largest difference of the batched tetradic schemes
+    from grapefruit's."""
+    expected = np.array([
+        [scheme_color.rgb
+         for scheme_color in color.make_tetradic_scheme(mode=mode)]
+        for color in grapefruit_colors])
+    schemes = wheel.make_schemes(rgb[:len(grapefruit_colors)], mode)
+    return np.abs(schemes['tetradic'] - expected).max()
+
+
+def main(colors=100000):
+    random = np.random.RandomState(0)
+    rgb = random.random_sample((colors, 3))
+    single_colors = min(colors, 5000)
+    grapefruit_colors = [grapefruit.Color(tuple(value))
+                         for value in rgb[:single_colors].tolist()]
+
+    for mode in ('ryb', 'rgb'):
+        start = time.time()
+        schemes = wheel.make_schemes(rgb, mode)
+        batch_time = time.time() - start
+
+        start = time.time()
+        single = [core.make_schemes(color, mode)
+                  for color in grapefruit_colors]
+        single_time = (time.time() - start) * colors / single_colors
+
+        error = max(
+            np.abs(np.array([[color.rgb for color in scheme[name]]
+                             for scheme in single]) -
+                   schemes[name][:single_colors]).max()
+            for name in core.SCHEMES)
+        print('{} batched {:8.1f} ms  per color {:9.1f} ms  {:5.0f}x  '
+              'max diff {:.2e}'.format(
+                  mode, batch_time * 1000, single_time * 1000,
+                  single_time / batch_time, error))
+
+    status = 0
+    for mode in ('rgb', 'ryb'):
+        error = tetradic_error(rgb, grapefruit_colors, mode)
+        if error > TOLERANCE:
+            print('FAIL: {} tetradic schemes differ from grapefruit by '
+                  '{:.2e}'.format(mode, error))
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
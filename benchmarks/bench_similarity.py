@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""Benchmarks similarity queries over a large `ColorIndex`.
+
+Builds an index of random colors spread over palettes, then times
+nearest, radius and palette queries for single colors against a
+brute-force search of all colors, and the time to add and remove
+colors incrementally.  Exits with a non-zero status if a query result
+differs from the brute-force one.
+
+Usage:
+    python benchmarks/bench_similarity.py [colors] [queries]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from colorstk.core import similarity
+from colorstk.core.batch import rgb_to_cielab
+
+PALETTES = 100
+DELTA_E = 5.0
+
+
+def main(colors=1000000, queries=200):
+    random = np.random.RandomState(0)
+    rgb = random.random_sample((colors, 3))
+    start = time.time()
+    index = similarity.ColorIndex()
+    for palette, chunk in enumerate(np.array_split(rgb, PALETTES)):
+        index.add('palette{}'.format(palette), chunk)
+    # The grid is built by the first query
+    index.nearest(rgb[0])
+    build_time = time.time() - start
+    print('{} colors in {} palettes, built in {:.1f} ms'.format(
+        colors, PALETTES, build_time * 1000))
+
+    lab = rgb_to_cielab(rgb)
+    points = random.random_sample((queries, 3)).tolist()
+    failures = 0
+    start = time.time()
+    for point in points:
+        dists = np.sqrt(((lab - index._query_lab(point)) ** 2).sum(axis=1))
+        dists.sort()
+    brute_time = (time.time() - start) / queries
+
+    for label, query in (
+            ('nearest 1', lambda point: index.nearest(point)),
+            ('nearest 10', lambda point: index.nearest(point, 10)),
+            ('within {}'.format(DELTA_E / 2),
+             lambda point: index.within(point, DELTA_E / 2)),
+            ('palettes near {}'.format(DELTA_E),
+             lambda point: index.palettes_near(point, DELTA_E))):
+        start = time.time()
+        results = [query(point) for point in points]
+        query_time = (time.time() - start) / queries
+        print('{:>18} {:7.3f} ms/query  brute force {:7.3f} ms  {:5.0f}x'
+              .format(label, query_time * 1000, brute_time * 1000,
+                      brute_time / query_time))
+        if label.startswith('nearest'):
+            for point, matches in zip(points[:20], results):
+                dists = np.sqrt(((lab - index._query_lab(point)) ** 2).sum(
+                    axis=1))
+                dists.sort()
+                if not np.allclose([match.delta_e for match in matches],
+                                   dists[:len(matches)]):
+                    failures += 1
+
+    added = random.random_sample((1000, 3))
+    start = time.time()
+    for color in added.tolist():
+        index.add('added', [color])
+    add_time = (time.time() - start) / len(added)
+    start = time.time()
+    for color in added.tolist():
+        index.remove('added', [color])
+    remove_time = (time.time() - start) / len(added)
+    print('add {:.1f} us/color  remove {:.1f} us/color'.format(
+        add_time * 1e6, remove_time * 1e6))
+    if failures:
+        print('{} nearest queries differ from brute force'.format(failures))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+"""Runs the hot path benchmarks and compares them with a baseline.
+
+Times, with fixed random colors:
+
+- `core.get_value` for every color space and sRGB value range
+- `core.make_color`, which `ValueDisplay.update_color` calls, for the
+  same color spaces
+- `core.make_schemes` in RGB and RYB modes, `core.color_info`, which
+  `LookupScreen.set_color_info` calls, and `core.blend_colors`
+- creating and deleting palettes of 10, 1000 and 100000 colors in a
+  `core.store.SQLitePaletteStore`
+- with Kivy installed, setting the `LookupScreen` color and running
+  the frame that refreshes the values, info and schemes tabs, with the
+  app built but not run
+
+Each benchmark is run in rounds of enough calls to take about
+`ROUND_TIME`, and the median and fastest time per call are written to
+a JSON file.  With a baseline file, the fastest times are compared with
+it, since they vary the least between runs, and the exit status is
+non-zero if one is slower by more than the tolerance.  Slower
+benchmarks are run again first, keeping their fastest time.  Baselines
+should be saved on the machine that checks against them, so the default
+baseline, benchmarks/baseline.json, is not committed: save it with
+--save-baseline before a change, and run the suite again after it.
+
+Usage:
+    python benchmarks/bench_suite.py [--output FILE] [--baseline FILE]
+        [--save-baseline] [--tolerance FRACTION] [--repeat ROUNDS]
+        [--retries RUNS]
+"""
+
+import argparse
+from collections import OrderedDict
+import functools
+import json
+import os
+from os.path import abspath, dirname, exists, join
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import grapefruit
+
+import colorstk
+from colorstk import core
+from colorstk.core import store
+
+BASELINE = join(dirname(abspath(__file__)), 'baseline.json')
+ROUND_TIME = 0.1
+STORE_SIZES = (10, 1000, 100000)
+# Colors of each benchmark call
+COLORS = 64
+
+
+def measure(function, repeat):
+    """Returns the median and fastest seconds per call of function."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= ROUND_TIME:
+            break
+        loops *= 2
+    times = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        times.append((time.perf_counter() - start) / loops)
+    return summarize(times, loops)
+
+
+def summarize(times, loops):
+    times = sorted(times)
+    return {'median': times[len(times) // 2], 'min': times[0],
+            'loops': loops}
+
+
+def timer(function):
+    """Returns a benchmark that measures calls of function."""
+    return lambda repeat: measure(function, repeat)
+
+
+def cycle(values):
+    """Returns a function returning the values in turn, forever."""
+    state = {'index': -1}
+
+    def next_value():
+        state['index'] = (state['index'] + 1) % len(values)
+        return values[state['index']]
+    return next_value
+
+
+def random_colors(rng, count):
+    return [grapefruit.Color((rng.random(), rng.random(), rng.random()))
+            for _ in range(count)]
+
+
+def core_cases():
+    """Returns (name, benchmark) pairs of the color functions.
+
+    A benchmark is called with the number of rounds and returns its
+    result.
+
+    """
+    cases = []
+    rng = random.Random(0)
+    next_color = cycle(random_colors(rng, COLORS))
+    for color_space in core.COLOR_SPACES:
+        ranges = ('0-1', '0-255') if color_space == 'sRGB' else ('0-255',)
+        for value_range in ranges:
+            suffix = '[{}]'.format(color_space) if len(ranges) == 1 else (
+                '[{} {}]'.format(color_space, value_range))
+            cases.append(('get_value' + suffix, timer(
+                functools.partial(_get_value, next_color, color_space,
+                                  value_range))))
+            next_value = cycle([core.get_value(color, color_space,
+                                               value_range)
+                                for color in random_colors(rng, COLORS)])
+            cases.append(('make_color' + suffix, timer(
+                functools.partial(_make_color, next_value, color_space,
+                                  value_range))))
+
+    for mode in ('rgb', 'ryb'):
+        cases.append(('make_schemes[{}]'.format(mode), timer(
+            functools.partial(_make_schemes, next_color, mode))))
+    cases.append(('color_info', timer(
+        lambda: core.color_info(next_color()))))
+    next_other = cycle(random_colors(rng, COLORS - 1))
+    cases.append(('blend_colors', timer(
+        lambda: core.blend_colors(next_color(), next_other()))))
+    return cases
+
+
+def _get_value(next_color, color_space, value_range):
+    return core.get_value(next_color(), color_space, value_range)
+
+
+def _make_color(next_value, color_space, value_range):
+    return core.make_color(color_space, next_value(),
+                           core.DEFAULT_WHITE_POINT, value_range)
+
+
+def _make_schemes(next_color, mode):
+    return core.make_schemes(next_color(), mode)
+
+
+def store_cases():
+    """Returns (name, benchmark) pairs of creating and deleting
+    palettes."""
+    cases = []
+    for size in STORE_SIZES:
+        cases.append(('store create[{}]'.format(size),
+                      functools.partial(time_store, size, 'create')))
+        cases.append(('store delete[{}]'.format(size),
+                      functools.partial(time_store, size, 'delete')))
+    return cases
+
+
+def time_store(size, method, repeat):
+    """Returns the times of creating or deleting palettes of a size in
+    a new `core.store.SQLitePaletteStore`."""
+    rng = random.Random(size)
+    colors = [[rng.random() for _ in range(3)] for _ in range(size)]
+    # Enough palettes per round to time small ones
+    count = max(1, min(50, 10000 // size))
+    names = ['new{}'.format(index) for index in range(count)]
+    times = []
+    directory = tempfile.mkdtemp()
+    try:
+        palette_store = store.SQLitePaletteStore(
+            join(directory, store.DATABASE_NAME))
+        # Other palettes, so the store is not empty
+        with palette_store.transaction():
+            for index in range(100):
+                palette_store.create('palette{}'.format(index), [
+                    [rng.random() for _ in range(3)] for _ in range(20)])
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for name in names:
+                palette_store.create(name, colors)
+            if method == 'create':
+                times.append((time.perf_counter() - start) / count)
+            start = time.perf_counter()
+            for name in names:
+                palette_store.delete(name)
+            if method == 'delete':
+                times.append((time.perf_counter() - start) / count)
+        palette_store.close()
+    finally:
+        shutil.rmtree(directory)
+    return summarize(times, count)
+
+
+def ui_cases():
+    """Returns (name, benchmark) pairs of color refreshes in the built
+    app, or an empty list and why they were skipped."""
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+    try:
+        from kivy.clock import Clock
+        from kivy.uix.behaviors.knspace import knspace
+
+        from colorstk.main import ColorsTKApp
+    except ImportError as error:
+        return [], str(error)
+
+    app = ColorsTKApp()
+    app.load_config()
+    app.root = app.build()
+    lookup_screen = knspace.lookup_screen
+    Clock.tick()
+    rng = random.Random(0)
+    next_color = cycle([grapefruit.Color(
+        (rng.random(), rng.random(), rng.random()),
+        wref=lookup_screen.white_point) for _ in range(COLORS)])
+
+    def refresh():
+        lookup_screen.color = next_color()
+        Clock.tick()
+
+    def refresh_tab(tab, repeat):
+        lookup_screen.tabbed_panel.switch_to(tab)
+        Clock.tick()
+        return measure(refresh, repeat)
+
+    cases = []
+    for name in ('values', 'info', 'schemes'):
+        tab = getattr(lookup_screen, name + '_tab')
+        # The values are not a tab if they are detached
+        if tab in lookup_screen.tabbed_panel.tab_list:
+            cases.append(('on_color refresh[{}]'.format(name),
+                          functools.partial(refresh_tab, tab)))
+    return cases, None
+
+
+def slower(results, baseline, tolerance):
+    """Returns the names of the benchmarks slower than the baseline by
+    more than the tolerance."""
+    return [name for name, result in sorted(results.items())
+            if name in baseline and
+            result['min'] > baseline[name]['min'] * (1 + tolerance)]
+
+
+def compare(results, baseline, tolerance):
+    """Prints the change of each fastest time from the baseline."""
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            print('{:<32} {:>12}  new'.format(
+                name, format_time(result['min'])))
+            continue
+        ratio = result['min'] / base['min']
+        status = ''
+        if ratio > 1 + tolerance:
+            status = 'SLOWER'
+        elif ratio < 1 / (1 + tolerance):
+            status = 'faster'
+        print('{:<32} {:>12} {:>12} {:7.2f}x  {}'.format(
+            name, format_time(base['min']),
+            format_time(result['min']), ratio, status))
+    for name in sorted(set(baseline) - set(results)):
+        print('{:<32} {:>12}  missing'.format(
+            name, format_time(baseline[name]['min'])))
+
+
+def format_time(seconds):
+    if seconds >= 1e-3:
+        return '{:.2f} ms'.format(seconds * 1e3)
+    return '{:.2f} us'.format(seconds * 1e6)
+
+
+def environment():
+    return {'colorstk': colorstk.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def write(path, data):
+    with open(path + '.tmp', 'w') as results_file:
+        json.dump(data, results_file, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks hot paths and compares them with a '
+                    'baseline.')
+    parser.add_argument('--output', default='bench_results.json',
+                        help='the JSON file to write results to')
+    parser.add_argument('--baseline', default=BASELINE,
+                        help='the JSON results to compare with')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='write the results to the baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='the fraction a benchmark may be slower')
+    parser.add_argument('--repeat', type=int, default=7,
+                        help='the number of rounds of each benchmark')
+    parser.add_argument('--retries', type=int, default=2,
+                        help='the times to run a slower benchmark again')
+    args = parser.parse_args(argv)
+
+    cases = core_cases() + store_cases()
+    ui, skipped = ui_cases()
+    cases = OrderedDict(cases + ui)
+    if skipped is not None:
+        print('UI benchmarks skipped: {}'.format(skipped))
+    results = OrderedDict((name, benchmark(args.repeat))
+                          for name, benchmark in cases.items())
+
+    baseline = None
+    if not args.save_baseline and exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        # A slower benchmark is run again, in case something else was
+        # running at the time
+        for _ in range(args.retries):
+            for name in slower(results, baseline['results'],
+                               args.tolerance):
+                result = cases[name](args.repeat)
+                if result['min'] < results[name]['min']:
+                    results[name] = result
+
+    data = {'environment': environment(), 'results': results}
+    write(args.output, data)
+    if args.save_baseline:
+        write(args.baseline, data)
+        print('Baseline saved to {}'.format(args.baseline))
+        return 0
+    if baseline is None:
+        for name, result in results.items():
+            print('{:<32} {:>12}'.format(name, format_time(result['min'])))
+        print('No baseline at {}, save one with --save-baseline'.format(
+            args.baseline))
+        return 0
+
+    if baseline['environment']['platform'] != data['environment'][
+            'platform']:
+        print('Baseline is from {}'.format(
+            baseline['environment']['platform']))
+    compare(results, baseline['results'], args.tolerance)
+    regressions = slower(results, baseline['results'], args.tolerance)
+    if regressions:
+        print('FAIL: {} slower than the baseline by more than {:.0%}'
+              .format(', '.join(regressions), args.tolerance))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
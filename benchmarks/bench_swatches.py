@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""Benchmarks importing and exporting large swatch files.
+
+Exports one palette of random colors in each format of
+`core.swatches`, then imports the file into a new SQLite palette store.
+The peak memory allocated while importing is measured in a separate
+run and should stay bounded by `swatches.BATCH_SIZE`, not by the size
+of the file.  'aco' files hold at most 65535 colors.
+
+Also checks that CIE-LAB colors of 'ase' and 'aco' files are read as
+the expected sRGB color, and exits non-zero if they are not.
+
+Usage:
+    python benchmarks/bench_swatches.py [colors]
+"""
+
+import io
+import os
+from os.path import join
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from colorstk.core import store, swatches
+
+# A CIE-LAB swatch and its sRGB values in range 0-255
+LAB_SWATCH = (50.0, 20.0, -30.0)
+LAB_RGB = (127, 109, 170)
+
+
+def lab_files():
+    """Returns 'ase' and 'aco' files holding `LAB_SWATCH`."""
+    lightness, a, b = LAB_SWATCH
+    # Lightness is stored in range 0-1
+    color = (struct.pack('>H', 1) + b'\0\0' + b'LAB ' +
+             struct.pack('>3fH', lightness / 100.0, a, b, 2))
+    ase = (b'ASEF' + struct.pack('>HHI', 1, 0, 1) +
+           struct.pack('>HI', 1, len(color)) + color)
+    aco = struct.pack('>HH5H', 1, 1, 7, int(lightness * 100),
+                      *struct.unpack('>2H', struct.pack(
+                          '>2h', int(a * 100), int(b * 100))) + (0,))
+    return {'ase': ase, 'aco': aco}
+
+
+def check_lab():
+    """Returns whether the CIE-LAB swatches are read as `LAB_RGB`."""
+    passed = True
+    for swatch_format, data in sorted(lab_files().items()):
+        colors = [color for _, color in swatches.read_swatches(
+            io.BytesIO(data), swatch_format) if color is not None]
+        rgb = tuple(int(round(value * 255)) for value in colors[0])
+        if rgb != LAB_RGB:
+            print('FAIL: {} CIE-LAB {} read as {}, expected {}'.format(
+                swatch_format, LAB_SWATCH, rgb, LAB_RGB))
+            passed = False
+    return passed
+
+
+def main(colors=100000):
+    if not check_lab():
+        return 1
+    random.seed(0)
+    directory = tempfile.mkdtemp()
+    try:
+        source = store.SQLitePaletteStore(join(directory, 'source.db'))
+        source.create('palette', [
+            [random.random(), random.random(), random.random()]
+            for _ in range(colors)])
+        source.create('short', [[random.random(), random.random(),
+                                 random.random()]
+                                for _ in range(min(colors, 65535))])
+
+        for swatch_format in swatches.FORMATS:
+            name = 'short' if swatch_format == 'aco' else 'palette'
+            path = join(directory, 'swatches.' + swatch_format)
+            start = time.time()
+            swatches.export_palettes(source, [name], path)
+            export_time = time.time() - start
+
+            def import_file(database):
+                target = store.SQLitePaletteStore(join(directory, database))
+                swatches.import_palettes(target, path)
+                target.close()
+
+            start = time.time()
+            import_file('timed.db')
+            import_time = time.time() - start
+            tracemalloc.start()
+            import_file('traced.db')
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            for database in ('timed.db', 'traced.db'):
+                os.remove(join(directory, database))
+
+            count = source.summary(name).color_count
+            print('{:>4} {:6d} colors {:8.1f} kB  export {:7.1f} ms  '
+                  'import {:7.1f} ms ({:5.2f} us/color)  '
+                  'import peak {:7.1f} kB'.format(
+                      swatch_format, count, os.path.getsize(path) / 1024.0,
+                      export_time * 1000, import_time * 1000,
+                      import_time / count * 1e6, peak / 1024.0))
+        source.close()
+    finally:
+        shutil.rmtree(directory)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,39 @@
+"""Implements the timing helpers shared by the benchmark scripts.
+
+The scripts are run as `python benchmarks/<script>.py`, which puts this
+directory first on the import path, so they import it as `timing`.
+"""
+
+import time
+import tracemalloc
+
+
+def timed(function):
+    """Returns the result of calling a function and the seconds it
+    took."""
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def best_time(function, runs=5):
+    """Returns the fastest of several runs of a function, in seconds."""
+    return min(timed(function)[1] for _ in range(runs))
+
+
+def time_and_peak(function):
+    """Returns the seconds and peak allocated bytes of calling a
+    function.
+
+    Tracing allocations slows Python down, so the time is measured in a
+    separate call.
+
+    """
+    _, elapsed = timed(function)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
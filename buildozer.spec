@@ -37,7 +37,7 @@ version.filename = %(source.dir)s/__init__.py
 # (list) Application requirements
 # comma seperated e.g. requirements = sqlite3,kivy
 #requirements = python3crystax==3.6,kivy,git+https://github.com/xav/grapefruit.git
-requirements = kivy,android,git+https://github.com/xav/grapefruit.git
+requirements = kivy,android,numpy,sqlite3,git+https://github.com/xav/grapefruit.git
 
 # (str) Custom source folders for requirements
 # Sets custom source for any requirements with recipes
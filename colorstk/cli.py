@@ -0,0 +1,487 @@
+"""Implements the colorstk-convert command line batch converter.
+
+Colors are read from files or stdin, one per line, as hex strings, CSV
+rows of values, or JSON lines of values or hex strings.  They are
+converted with `core.batch` in chunks of `CHUNK_SIZE` lines, so memory
+stays constant however long the input is, and written as CSV or JSON
+lines in the order they were read.  Chunks can be converted by a pool
+of worker processes.
+
+Besides the values in each color space, the nearest color name, the
+websafe and greyscale variants, and the color schemes of each color can
+be added.
+"""
+
+import argparse
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import io
+import itertools
+import json
+import os
+from os.path import exists, splitext
+import sys
+import zipfile
+
+import numpy as np
+
+try:
+    from core import batch, names, wheel
+    from core.schemes import SCHEMES
+    from core.spaces import COLOR_SPACES, OBSERVERS, WHITE_POINTS
+    from core.spaces import get_white_point
+except ImportError:
+    from colorstk.core import batch, names, wheel
+    from colorstk.core.schemes import SCHEMES
+    from colorstk.core.spaces import COLOR_SPACES, OBSERVERS, WHITE_POINTS
+    from colorstk.core.spaces import get_white_point
+
+FORMATS = ('hex', 'csv', 'jsonl')
+OUTPUT_FORMATS = ('csv', 'jsonl')
+# The color spaces shown by default in the app settings
+DEFAULT_SPACES = ('Hex', 'sRGB', 'HSL', 'HSV', 'CIE-XYZ', 'CIE-LAB')
+CHUNK_SIZE = 16384
+
+# Names of the CSV columns of the values in each color space
+_CHANNELS = {
+    'Hex': ('hex',), 'sRGB': ('r', 'g', 'b'), 'HSL': ('h', 's', 'l'),
+    'HSV': ('h', 's', 'v'), 'YIQ': ('y', 'i', 'q'), 'YUV': ('y', 'u', 'v'),
+    'CIE-XYZ': ('x', 'y', 'z'), 'CIE-LAB': ('l', 'a', 'b'),
+    'CMY': ('c', 'm', 'y'), 'CMYK': ('c', 'm', 'y', 'k')
+}
+_EXTENSIONS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+# Chunks being converted or waiting to be written, per worker process
+_CHUNKS_PER_JOB = 2
+
+Options = namedtuple('Options', 'from_space to_spaces white_point '
+                                'value_range digits names name_index '
+                                'variants schemes output_format')
+Options.__doc__ = """What to convert colors to and how to write them.
+
+Attributes:
+    from_space: The color space of CSV and JSON values, or None for
+        'Hex' for hex input and JSON strings and 'sRGB' otherwise.
+    to_spaces: A sequence of the color spaces to convert to.
+    white_point: The white reference of CIE-LAB values.
+    value_range: The range of sRGB values, '0-1' or '0-255'.
+    digits: The decimal places to round values to.
+    names: Whether to add the nearest color name and its Delta-E.
+    name_index: The `core.names.NameIndex` to name colors with, or None
+        if names are not added.
+    variants: Whether to add the websafe and greyscale colors.
+    schemes: The color wheel of the schemes to add, 'rgb' or 'ryb', or
+        None for no schemes.
+    output_format: 'csv' or 'jsonl'.
+"""
+
+Chunk = namedtuple('Chunk', 'source line_numbers input_format lines')
+Chunk.__doc__ = """Lines of input to convert together.
+
+Attributes:
+    source: The name of the file the lines are from.
+    line_numbers: A list of the line number in the file of each line.
+    input_format: The format of the lines, one of `FORMATS`.
+    lines: A list of non-blank lines without line endings.
+"""
+
+
+def read_chunks(paths, input_format=None, from_space=None,
+                chunk_size=CHUNK_SIZE):
+    """Yields the lines of files in chunks.
+
+    Blank lines are skipped, as is a header in the first line of a CSV
+    file.
+
+    Args:
+        paths: A sequence of file paths, where '-' is stdin.
+        input_format: One of `FORMATS`, or None to guess the format of
+            each file from its extension or first line.
+        from_space: The color space of CSV values, used to recognize a
+            header.
+        chunk_size: The number of lines of each chunk.
+
+    Yields:
+        `Chunk` tuples.
+
+    """
+    for path in paths:
+        if path == '-':
+            lines = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+            source = '<stdin>'
+        else:
+            lines = io.open(path, encoding='utf-8')
+            source = path
+        with lines:
+            numbered = ((number, line.strip())
+                        for number, line in enumerate(lines, 1))
+            numbered = ((number, line) for number, line in numbered if line)
+            first = next(numbered, None)
+            if first is None:
+                continue
+            file_format = input_format or _guess_format(path, first[1])
+            if not (file_format == 'csv' and
+                    _is_header(first[1], from_space)):
+                numbered = itertools.chain([first], numbered)
+            while True:
+                chunk = list(itertools.islice(numbered, chunk_size))
+                if not chunk:
+                    break
+                line_numbers, chunk_lines = zip(*chunk)
+                yield Chunk(source, list(line_numbers), file_format,
+                            list(chunk_lines))
+
+
+def _guess_format(path, first_line):
+    """Returns the format of a file from its extension or first line."""
+    file_format = _EXTENSIONS.get(splitext(path)[1].lower())
+    if file_format is not None:
+        return file_format
+    if first_line[0] in '["':
+        return 'jsonl'
+    if ',' in first_line:
+        return 'csv'
+    return 'hex'
+
+
+def _is_header(line, from_space):
+    """Returns whether the first line of a CSV file is a header."""
+    field = line.split(',', 1)[0].strip()
+    if from_space == 'Hex':
+        return not names.is_hex(field)
+    try:
+        float(field)
+    except ValueError:
+        return True
+    return False
+
+
+def convert_chunk(chunk, options):
+    """Converts a chunk of input.
+
+    Returns:
+        A tuple of the CSV header, or None for JSON lines, and the
+        output text of the chunk.
+
+    Raises:
+        ValueError: If a line is not a valid color, with its line
+            number.
+
+    """
+    from_space = options.from_space
+    if from_space is None:
+        hex_input = chunk.input_format == 'hex' or (
+            chunk.input_format == 'jsonl' and chunk.lines[0][0] == '"')
+        from_space = 'Hex' if hex_input else 'sRGB'
+    try:
+        rgb, alpha = _parse(chunk.lines, chunk.input_format, from_space,
+                            options)
+    except ValueError:
+        # Parsed again one line at a time to find the invalid line
+        for index, line in enumerate(chunk.lines):
+            try:
+                _parse([line], chunk.input_format, from_space, options)
+            except ValueError as error:
+                raise ValueError('{}, line {}: invalid {} color {!r}: {}'
+                                 .format(chunk.source,
+                                         chunk.line_numbers[index],
+                                         from_space, line, error))
+        raise ValueError('{}, lines {}-{}: colors have different numbers '
+                         'of values'.format(chunk.source,
+                                            chunk.line_numbers[0],
+                                            chunk.line_numbers[-1]))
+
+    columns = _columns(chunk.lines, rgb, alpha, options)
+    if options.output_format == 'csv':
+        return _csv_output(columns, options.digits)
+
+    keys = [name for name, _, _ in columns]
+    records = zip(*[_json_values(values, options.digits)
+                    for _, _, values in columns])
+    return None, ''.join(json.dumps(dict(zip(keys, record))) + '\n'
+                         for record in records)
+
+
+def _csv_output(columns, digits):
+    """Returns the CSV header and rows of output columns.
+
+    Rows are formatted with one format string, which is much faster
+    than `csv.writer` with many float fields.  Only string fields that
+    need it are quoted.
+
+    """
+    header = []
+    formats = []
+    fields = []
+    for name, channels, values in columns:
+        header.extend(channels or [name])
+        if values.dtype.kind == 'f':
+            field_format = '%.{}f'.format(digits)
+        elif values.dtype.kind == 'i':
+            field_format = '%d'
+        else:
+            field_format = '%s'
+        if channels is None:
+            formats.append(field_format)
+            values = values.tolist()
+            if field_format == '%s' and any(
+                    ',' in value or '"' in value for value in values):
+                values = [_quote(value) for value in values]
+            fields.append(values)
+        else:
+            formats.extend([field_format] * len(channels))
+            # A field per channel
+            fields.extend(values.T.tolist())
+    row_format = ','.join(formats) + '\n'
+    return header, ''.join([row_format % row for row in zip(*fields)])
+
+
+def _quote(value):
+    return '"{}"'.format(value.replace('"', '""'))
+
+
+def _json_values(values, digits):
+    """Returns a list of the values of a column for JSON output."""
+    if values.dtype.kind == 'f':
+        values = np.round(values, digits)
+    return values.tolist()
+
+
+def _parse(lines, input_format, from_space, options):
+    """Returns the RGB and alpha arrays of lines of input."""
+    if input_format == 'hex':
+        values = np.array(lines)
+    elif input_format == 'csv':
+        if from_space == 'Hex':
+            values = np.array([line.split(',', 1)[0].strip()
+                               for line in lines])
+        else:
+            values = np.array([line.split(',') for line in lines],
+                              dtype=np.float64)
+    else:
+        values = np.array([json.loads(line) for line in lines],
+                          dtype=None if from_space == 'Hex' else np.float64)
+    if from_space == 'Hex' and values.ndim != 1:
+        raise ValueError('expected hex strings')
+    return batch.to_rgb(values, from_space, options.white_point,
+                        options.value_range)
+
+
+def _columns(lines, rgb, alpha, options):
+    """Returns the output columns of converted colors.
+
+    Returns:
+        A list of (name, channels, values) tuples.  Channels is None
+        for an (N,) array of values, or a tuple of the CSV names of the
+        channels of an (N, channels) array of values.
+
+    """
+    columns = [('input', None, np.array(lines))]
+    for color_space in options.to_spaces:
+        values = batch.from_rgb(rgb, color_space, options.white_point,
+                                options.value_range)
+        if color_space == 'Hex':
+            columns.append(('Hex', None, values))
+            continue
+        if color_space == 'sRGB' and options.value_range == '0-255':
+            values = values.astype(np.int64)
+        columns.append((color_space, tuple(
+            '{} {}'.format(color_space, channel)
+            for channel in _CHANNELS[color_space]), values))
+    if alpha is not None:
+        columns.append(('alpha', None, alpha))
+    if options.names:
+        names_found, delta_e = options.name_index.query(rgb)
+        columns.append(('name', None, names_found))
+        columns.append(('delta_e', None, delta_e))
+    if options.variants:
+        columns.append(('websafe', None, batch.rgb_to_html(
+            batch.rgb_to_websafe(rgb))))
+        columns.append(('greyscale', None, batch.rgb_to_html(
+            batch.rgb_to_greyscale(rgb))))
+    if options.schemes is not None:
+        schemes = wheel.make_schemes(rgb, options.schemes)
+        for scheme in SCHEMES:
+            colors = schemes[scheme]
+            count = colors.shape[1]
+            html = batch.rgb_to_html(colors.reshape(-1, 3)).reshape(
+                len(rgb), count)
+            columns.append((scheme, tuple(
+                '{} {}'.format(scheme, index + 1)
+                for index in range(count)), html))
+    return columns
+
+
+def convert_stream(chunks, options, output, jobs=1):
+    """Converts chunks of input and writes them in order.
+
+    Args:
+        chunks: An iterable of `Chunk` tuples.
+        options: The `Options` of the conversion.
+        output: A text file to write to.
+        jobs: The number of worker processes, or 1 to convert in this
+            process.  Defaults to 1.
+
+    Returns:
+        The number of colors converted.
+
+    Raises:
+        ValueError: If a line is not a valid color, or the input of
+            CSV output has alpha values in some chunks only.
+
+    """
+    count = 0
+    header = None
+    if jobs == 1:
+        results = ((len(chunk.lines), convert_chunk(chunk, options))
+                   for chunk in chunks)
+        for count_chunk, (chunk_header, text) in results:
+            header = _write(output, header, chunk_header, text)
+            count += count_chunk
+        return count
+
+    with ProcessPoolExecutor(jobs) as executor:
+        # Only a few chunks are read ahead, to keep memory constant
+        pending = deque()
+        chunks = iter(chunks)
+        while True:
+            while len(pending) < jobs * _CHUNKS_PER_JOB:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                pending.append((len(chunk.lines), executor.submit(
+                    convert_chunk, chunk, options)))
+            if not pending:
+                break
+            count_chunk, future = pending.popleft()
+            chunk_header, text = future.result()
+            header = _write(output, header, chunk_header, text)
+            count += count_chunk
+    return count
+
+
+def _write(output, header, chunk_header, text):
+    """Writes the output of a chunk, after the CSV header if it is the
+    first chunk, and returns the header."""
+    if chunk_header is not None:
+        if header is None:
+            header = chunk_header
+            csv.writer(output, lineterminator='\n').writerow(header)
+        elif chunk_header != header:
+            raise ValueError('Colors with and without alpha values '
+                             'cannot be written to one CSV output')
+    output.write(text)
+    return header
+
+
+def _load_name_index(parser, path):
+    """Returns the `core.names.NameIndex` saved at a path, or one of
+    grapefruit's named colors if the path is None."""
+    if path is None:
+        return names.default_index()
+    try:
+        return names.NameIndex.load(path)
+    except (IOError, OSError, ValueError, KeyError,
+            zipfile.BadZipFile) as error:
+        parser.error('name index {} not loaded: {}'.format(path, error))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='colorstk-convert',
+        description='Converts colors from files or stdin, one per line, '
+                    'to color spaces and adds names, variants and '
+                    'schemes.')
+    parser.add_argument('files', nargs='*', default=['-'],
+                        help="input files, or '-' for stdin (default)")
+    parser.add_argument('-f', '--format', choices=FORMATS,
+                        help='the input format, guessed from the file '
+                             'extension or first line by default')
+    parser.add_argument('--from', dest='from_space', choices=COLOR_SPACES,
+                        metavar='SPACE',
+                        help='the color space of CSV and JSON values '
+                             '(default: Hex for hex input and JSON '
+                             'strings, else sRGB)')
+    parser.add_argument('-t', '--to', default=','.join(DEFAULT_SPACES),
+                        metavar='SPACES',
+                        help='comma separated color spaces to convert '
+                             'to (default: %(default)s)')
+    parser.add_argument('--white-point', default='D65', choices=WHITE_POINTS,
+                        metavar='NAME',
+                        help='the white point of CIE-LAB values '
+                             '(default: %(default)s)')
+    parser.add_argument('--observer', default=OBSERVERS[0],
+                        choices=OBSERVERS,
+                        help='the observer angle of the white point '
+                             '(default: %(default)s)')
+    parser.add_argument('--value-range', default='0-255',
+                        choices=('0-1', '0-255'),
+                        help='the range of sRGB values '
+                             '(default: %(default)s)')
+    parser.add_argument('--digits', type=int, default=3,
+                        help='decimal places of values '
+                             '(default: %(default)s)')
+    parser.add_argument('--names', action='store_true',
+                        help='add the nearest color name and its Delta-E')
+    parser.add_argument('--name-index',
+                        help='a name index saved as .npz to name colors '
+                             "with, instead of grapefruit's names")
+    parser.add_argument('--variants', action='store_true',
+                        help='add the websafe and greyscale colors')
+    parser.add_argument('--schemes', choices=('rgb', 'ryb'),
+                        help='add color schemes on the RGB or RYB wheel')
+    parser.add_argument('-o', '--output',
+                        help='the output file (default: stdout)')
+    parser.add_argument('-F', '--output-format', choices=OUTPUT_FORMATS,
+                        default='csv',
+                        help='the output format (default: %(default)s)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='colors converted at a time '
+                             '(default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='worker processes, or 0 for one per CPU '
+                             '(default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    to_spaces = [space.strip() for space in args.to.split(',')
+                 if space.strip()]
+    unknown = [space for space in to_spaces if space not in COLOR_SPACES]
+    if unknown or not to_spaces:
+        parser.error('unknown color spaces: {} (choose from {})'.format(
+            ', '.join(unknown) or args.to, ', '.join(COLOR_SPACES)))
+    if args.chunk_size < 1:
+        parser.error('the chunk size must be at least 1')
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+    if args.name_index is not None and not exists(args.name_index):
+        parser.error('name index not found: {}'.format(args.name_index))
+    name_index = None
+    if args.names:
+        name_index = _load_name_index(parser, args.name_index)
+
+    options = Options(
+        from_space=args.from_space, to_spaces=to_spaces,
+        white_point=get_white_point(args.white_point, args.observer),
+        value_range=args.value_range, digits=args.digits,
+        names=args.names, name_index=name_index,
+        variants=args.variants, schemes=args.schemes,
+        output_format=args.output_format)
+    chunks = read_chunks(args.files, args.format, args.from_space,
+                         args.chunk_size)
+    try:
+        if args.output is None:
+            convert_stream(chunks, options, sys.stdout, jobs)
+        else:
+            with io.open(args.output + '.tmp', 'w', encoding='utf-8',
+                         newline='') as output:
+                convert_stream(chunks, options, output, jobs)
+            os.replace(args.output + '.tmp', args.output)
+    except (IOError, OSError, ValueError) as error:
+        if args.output is not None and exists(args.output + '.tmp'):
+            os.remove(args.output + '.tmp')
+        sys.stderr.write('{}: error: {}\n'.format(parser.prog, error))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+"""Implements the color logic of colorstk without depending on Kivy.
+
+Importing this package is kept cheap so that batch jobs do not pay the
+startup cost of the GUI.  Modules that depend on numpy, such as
+`batch`, `names`, `deltae` and `lut`, are not imported here.
+"""
+
+from .cache import BundleCache, ColorBundle
+from .info import NAMED_COLORS, color_info, color_name
+from .schemes import SCHEMES, blend_colors, make_schemes
+from .spaces import (COLOR_SPACES,
+                     DEFAULT_WHITE_POINT,
+                     OBSERVERS,
+                     WHITE_POINTS,
+                     get_value,
+                     get_white_point,
+                     make_color)
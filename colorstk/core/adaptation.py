@@ -0,0 +1,157 @@
+"""Implements chromatic adaptation between white points.
+
+A `ChromaticAdapter` precomputes the adaptation matrices between every
+pair of white points in the settings, for both observer angles, so
+adapting an array of colors to another white point is a single matrix
+multiply.  Adapters are cached by method with `get_adapter`.
+"""
+
+import numpy as np
+
+from .batch import lab_to_xyz, xyz_to_lab
+from .spaces import OBSERVERS, WHITE_POINTS, get_white_point
+
+# Matrices from XYZ to the cone response domain of each method
+CONE_MATRICES = {
+    'bradford': np.array([[0.8951, 0.2664, -0.1614],
+                          [-0.7502, 1.7135, 0.0367],
+                          [0.0389, -0.0685, 1.0296]]),
+    'von kries': np.array([[0.40024, 0.70760, -0.08081],
+                           [-0.22630, 1.16532, 0.04570],
+                           [0.0, 0.0, 0.91822]]),
+    'cat02': np.array([[0.7328, 0.4296, -0.1624],
+                       [-0.7036, 1.6975, 0.0061],
+                       [0.0030, 0.0136, 0.9834]])
+}
+
+METHODS = ('bradford', 'von kries', 'cat02')
+
+_adapters = {}
+
+
+class ChromaticAdapter(object):
+    """Adapts colors between white points with a von Kries-type method.
+
+    White points are given as (name, observer) tuples, such as
+    ('D65', 'CIE 1931'), or as XYZ triples.  XYZ triples of settings
+    white points use the precomputed matrices too.
+
+    """
+
+    def __init__(self, method='bradford'):
+        """Precomputes the matrices between all settings white points.
+
+        Args:
+            method: One of `METHODS`. Defaults to 'bradford'.
+
+        Raises:
+            ValueError: If the method is not supported.
+
+        """
+        if method not in CONE_MATRICES:
+            raise ValueError('Unknown adaptation method: {}'.format(method))
+        self.method = method
+        self.cone_matrix = CONE_MATRICES[method]
+        self.inverse_cone_matrix = np.linalg.inv(self.cone_matrix)
+
+        self.keys = [(name, observer) for observer in OBSERVERS
+                     for name in WHITE_POINTS]
+        self._indexes = {key: index for index, key in enumerate(self.keys)}
+        self.white_points = np.array([get_white_point(*key)
+                                      for key in self.keys])
+        self._xyz_indexes = {}
+        for index, white_point in enumerate(self.white_points):
+            self._xyz_indexes.setdefault(tuple(white_point), index)
+        # Scale the cone responses of every source to every target,
+        # giving an array of shape (sources, targets, 3, 3).
+        cones = self.white_points.dot(self.cone_matrix.T)
+        ratios = cones[np.newaxis, :, :] / cones[:, np.newaxis, :]
+        self.matrices = np.einsum('ij,stj,jk->stik', self.inverse_cone_matrix,
+                                  ratios, self.cone_matrix)
+        self._other_matrices = {}
+
+    def matrix(self, source, target):
+        """Returns the 3x3 matrix adapting XYZ from source to target."""
+        source = _as_key(source)
+        target = _as_key(target)
+        source_index = self._index(source)
+        target_index = self._index(target)
+        if source_index is not None and target_index is not None:
+            return self.matrices[source_index, target_index]
+
+        key = (self._xyz_key(source), self._xyz_key(target))
+        matrix = self._other_matrices.get(key)
+        if matrix is None:
+            source_cones = self.cone_matrix.dot(key[0])
+            target_cones = self.cone_matrix.dot(key[1])
+            matrix = self.inverse_cone_matrix.dot(
+                (target_cones / source_cones)[:, np.newaxis] *
+                self.cone_matrix)
+            self._other_matrices[key] = matrix
+        return matrix
+
+    def white_point(self, key):
+        """Returns the XYZ values of a white point."""
+        key = _as_key(key)
+        index = self._index(key)
+        if index is not None:
+            return self.white_points[index]
+        return np.array(self._xyz_key(key))
+
+    def adapt_xyz(self, xyz, source, target):
+        """Adapts an (N, 3) array of CIE-XYZ values to another white point.
+
+        Args:
+            xyz: An (N, 3) array of XYZ values relative to `source`.
+            source: The white point of `xyz`.
+            target: The white point to adapt to.
+
+        Returns:
+            An (N, 3) array of XYZ values relative to `target`.
+
+        """
+        return np.asarray(xyz, dtype=np.float64).dot(
+            self.matrix(source, target).T)
+
+    def adapt_lab(self, lab, source, target):
+        """Adapts an (N, 3) array of CIE-LAB values to another white point.
+
+        LAB values use grapefruit's scaling, as in `batch.xyz_to_lab`.
+
+        """
+        source_xyz = self.white_point(source)
+        target_xyz = self.white_point(target)
+        xyz = lab_to_xyz(np.asarray(lab, dtype=np.float64), source_xyz)
+        return xyz_to_lab(xyz.dot(self.matrix(source, target).T),
+                          target_xyz)
+
+    def _index(self, white_point):
+        """Returns the index of a settings white point, or None."""
+        index = self._indexes.get(white_point)
+        if (index is None and len(white_point) == 3 and
+                not isinstance(white_point[0], str)):
+            index = self._xyz_indexes.get(
+                tuple(float(val) for val in white_point))
+        return index
+
+    def _xyz_key(self, white_point):
+        if white_point in self._indexes:
+            return tuple(self.white_points[self._indexes[white_point]])
+        if len(white_point) != 3 or isinstance(white_point[0], str):
+            raise ValueError('Unknown white point: {}'.format(white_point))
+        return tuple(float(val) for val in white_point)
+
+
+def _as_key(white_point):
+    """Returns a white point as a hashable tuple."""
+    if isinstance(white_point, tuple):
+        return white_point
+    return tuple(white_point)
+
+
+def get_adapter(method='bradford'):
+    """Returns a shared `ChromaticAdapter` for a method."""
+    adapter = _adapters.get(method)
+    if adapter is None:
+        adapter = _adapters[method] = ChromaticAdapter(method)
+    return adapter
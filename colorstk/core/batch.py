@@ -0,0 +1,402 @@
+"""Implements vectorized color conversions over arrays of colors.
+
+The functions here mirror the per-color conversions in `spaces`,
+but operate on whole `numpy` arrays at once.  Colors are passed as
+arrays of shape (N, channels), where channels is the number of
+components of the color space, optionally followed by an alpha column
+which is carried through unchanged.  Hex colors are passed as arrays
+of strings of shape (N,).
+"""
+
+import numpy as np
+
+from .spaces import COLOR_SPACES, DEFAULT_WHITE_POINT
+
+# Number of components for each color space
+CHANNELS = {'Hex': 1, 'sRGB': 3, 'HSL': 3, 'HSV': 3, 'YIQ': 3, 'YUV': 3,
+            'CIE-XYZ': 3, 'CIE-LAB': 3, 'CMY': 3, 'CMYK': 4}
+
+_RGB_TO_YIQ = np.array([[0.29895808, 0.58660979, 0.11443213],
+                        [0.59590296, -0.27405705, -0.32184591],
+                        [0.21133576, -0.52263517, 0.31129940]])
+_YIQ_TO_RGB = np.array([[1.0, 0.9562, 0.6210],
+                        [1.0, -0.2717, -0.6485],
+                        [1.0, -1.1053, 1.7020]])
+_RGB_TO_YUV = np.array([[0.29900, 0.58700, 0.11400],
+                        [-0.14713, -0.28886, 0.43600],
+                        [0.61500, -0.51499, -0.10001]])
+_YUV_TO_RGB = np.array([[1.0, 0.0, 1.13983],
+                        [1.0, -0.39465, -0.58060],
+                        [1.0, 2.03211, 0.0]])
+_RGB_TO_XYZ = np.array([[0.4124, 0.3576, 0.1805],
+                        [0.2126, 0.7152, 0.0722],
+                        [0.0193, 0.1192, 0.9505]])
+_XYZ_TO_RGB = np.array([[3.2406255, -1.5372080, -0.4986286],
+                        [-0.9689307, 1.8757561, 0.0415175],
+                        [0.0557101, -0.2040211, 1.0569959]])
+
+# Permutations of (v, n, m) giving RGB for each HSV hue sextant
+_HSV_ORDER = np.array([[0, 1, 2], [1, 0, 2], [2, 0, 1],
+                       [2, 1, 0], [1, 2, 0], [0, 2, 1]])
+
+# ASCII lookup tables for formatting and parsing hex strings
+_HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8).astype(
+    np.uint32)
+_HEX_PAIRS = np.stack([_HEX_DIGITS[np.arange(256) >> 4],
+                       _HEX_DIGITS[np.arange(256) & 15]], axis=1)
+_HEX_VALUES = np.full(256, -1, dtype=np.int16)
+_HEX_VALUES[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10)
+_HEX_VALUES[np.frombuffer(b'abcdef', dtype=np.uint8)] = np.arange(10, 16)
+_HEX_VALUES[np.frombuffer(b'ABCDEF', dtype=np.uint8)] = np.arange(10, 16)
+
+
+def convert(values, from_space, to_space,
+            white_point=DEFAULT_WHITE_POINT, value_range='0-1'):
+    """Converts an array of colors from one color space to another.
+
+    Args:
+        values: An array of shape (N, channels) or (N, channels + 1)
+            with alpha, or an array of hex strings for 'Hex'.
+        from_space: The name of the color space of `values`.
+        to_space: The name of the color space to convert to.
+        white_point: The white reference used for CIE-LAB.
+            Defaults to D65 with the CIE 1931 observer.
+        value_range: The range of sRGB values, '0-1' or '0-255'.
+            Defaults to '0-1'.
+
+    Returns:
+        An array of the converted colors.
+
+    """
+    rgb, alpha = to_rgb(values, from_space, white_point, value_range)
+    return from_rgb(rgb, to_space, white_point, value_range, alpha)
+
+
+def to_rgb(values, color_space,
+           white_point=DEFAULT_WHITE_POINT, value_range='0-1'):
+    """Converts an array of colors to sRGB values in range 0-1.
+
+    Args:
+        values: An array of colors in `color_space`.
+        color_space: The name of the color space of `values`.
+        white_point: The white reference used for CIE-LAB.
+        value_range: The range of sRGB values, '0-1' or '0-255'.
+
+    Returns:
+        A tuple of an (N, 3) float array of RGB values and an (N,)
+        array of alpha values, or None if `values` has no alpha.
+
+    Raises:
+        ValueError: If the color space or array shape is not supported.
+
+    """
+    if color_space == 'Hex':
+        return html_to_rgb(values), None
+
+    values, alpha = _split_alpha(values, color_space)
+    if color_space == 'sRGB':
+        rgb = values / 255.0 if value_range == '0-255' else values.copy()
+    elif color_space == 'HSL':
+        rgb = hsl_to_rgb(values)
+    elif color_space == 'HSV':
+        rgb = hsv_to_rgb(values)
+    elif color_space == 'YIQ':
+        rgb = values.dot(_YIQ_TO_RGB.T)
+    elif color_space == 'YUV':
+        rgb = values.dot(_YUV_TO_RGB.T)
+    elif color_space == 'CIE-XYZ':
+        rgb = xyz_to_rgb(values)
+    elif color_space == 'CIE-LAB':
+        rgb = xyz_to_rgb(lab_to_xyz(values, white_point))
+    elif color_space == 'CMY':
+        rgb = 1.0 - values
+    elif color_space == 'CMYK':
+        rgb = 1.0 - cmyk_to_cmy(values)
+    return rgb, alpha
+
+
+def from_rgb(rgb, color_space, white_point=DEFAULT_WHITE_POINT,
+             value_range='0-1', alpha=None):
+    """Converts an array of sRGB values in range 0-1 to a color space.
+
+    Args:
+        rgb: An (N, 3) array of RGB values.
+        color_space: The name of the color space to convert to.
+        white_point: The white reference used for CIE-LAB.
+        value_range: The range of sRGB values, '0-1' or '0-255'.
+            Values in range 0-255 are rounded like `Color.ints`.
+        alpha: An optional (N,) array of alpha values to append.
+
+    Returns:
+        An array of colors in `color_space`. Hex colors are returned
+        as an (N,) array of strings and never include alpha.
+
+    Raises:
+        ValueError: If the color space is not supported.
+
+    """
+    rgb = np.asarray(rgb, dtype=np.float64)
+    if color_space == 'Hex':
+        return rgb_to_html(rgb)
+    elif color_space == 'sRGB':
+        values = np.rint(rgb * 255) if value_range == '0-255' else rgb
+    elif color_space == 'HSL':
+        values = rgb_to_hsl(rgb)
+    elif color_space == 'HSV':
+        values = rgb_to_hsv(rgb)
+    elif color_space == 'YIQ':
+        values = rgb.dot(_RGB_TO_YIQ.T)
+    elif color_space == 'YUV':
+        values = rgb.dot(_RGB_TO_YUV.T)
+    elif color_space == 'CIE-XYZ':
+        values = rgb_to_xyz(rgb)
+    elif color_space == 'CIE-LAB':
+        values = xyz_to_lab(rgb_to_xyz(rgb), white_point)
+    elif color_space == 'CMY':
+        values = 1.0 - rgb
+    elif color_space == 'CMYK':
+        values = cmy_to_cmyk(1.0 - rgb)
+    else:
+        raise ValueError('Unknown color space: {}'.format(color_space))
+
+    if alpha is not None:
+        values = np.column_stack((values, alpha))
+    return values
+
+
+def _split_alpha(values, color_space):
+    """Returns the color components and the alpha column, if any."""
+    if color_space not in CHANNELS:
+        raise ValueError('Unknown color space: {}'.format(color_space))
+    values = np.asarray(values, dtype=np.float64)
+    channels = CHANNELS[color_space]
+    if values.ndim != 2 or values.shape[1] not in (channels, channels + 1):
+        raise ValueError('Expected an array of shape (N, {}) or (N, {}) '
+                         'for {}, got {}'.format(channels, channels + 1,
+                                                 color_space, values.shape))
+    if values.shape[1] == channels:
+        return values, None
+    return values[:, :channels], values[:, channels]
+
+
+def _columns(values):
+    """Returns the columns of an (N, k) array as contiguous arrays."""
+    return np.ascontiguousarray(np.asarray(values, dtype=np.float64).T)
+
+
+def _hue(r, g, b, max_val, delta):
+    """Returns hue angles in degrees shared by HSL and HSV."""
+    hue = np.where(r == max_val, g - b,
+                   np.where(g == max_val, 2.0 * delta + b - r,
+                            4.0 * delta + r - g))
+    hue /= delta
+    hue *= 60.0
+    hue %= 360.0
+    return hue
+
+
+def rgb_to_hsl(rgb):
+    """Converts an (N, 3) array of RGB values to HSL."""
+    r, g, b = _columns(rgb)
+    max_val = np.maximum(np.maximum(r, g), b)
+    min_val = np.minimum(np.minimum(r, g), b)
+    delta = max_val - min_val
+    total = max_val + min_val
+    lightness = total / 2.0
+    grey = delta == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        saturation = delta / np.where(lightness < 0.5, total, 2.0 - total)
+        hue = _hue(r, g, b, max_val, delta)
+    hue[grey] = 0.0
+    saturation[grey] = 0.0
+    return np.column_stack((hue, saturation, lightness))
+
+
+def _hue_to_rgb(n1, n2, hue):
+    hue = hue % 6.0
+    return np.select([hue < 1.0, hue < 3.0, hue < 4.0],
+                     [n1 + (n2 - n1) * hue, n2, n1 + (n2 - n1) * (4.0 - hue)],
+                     n1)
+
+
+def hsl_to_rgb(hsl):
+    """Converts an (N, 3) array of HSL values to RGB."""
+    hue, saturation, lightness = _columns(hsl)
+    n2 = np.where(lightness < 0.5, lightness * (1.0 + saturation),
+                  lightness + saturation - lightness * saturation)
+    n1 = 2.0 * lightness - n2
+    hue /= 60.0
+    rgb = np.column_stack((_hue_to_rgb(n1, n2, hue + 2),
+                           _hue_to_rgb(n1, n2, hue),
+                           _hue_to_rgb(n1, n2, hue - 2)))
+    grey = saturation == 0
+    rgb[grey] = lightness[grey, np.newaxis]
+    return rgb
+
+
+def rgb_to_hsv(rgb):
+    """Converts an (N, 3) array of RGB values to HSV."""
+    r, g, b = _columns(rgb)
+    max_val = np.maximum(np.maximum(r, g), b)
+    delta = max_val - np.minimum(np.minimum(r, g), b)
+    grey = delta == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        saturation = delta / max_val
+        hue = _hue(r, g, b, max_val, delta)
+    hue[grey] = 0.0
+    saturation[grey] = 0.0
+    return np.column_stack((hue, saturation, max_val))
+
+
+def hsv_to_rgb(hsv):
+    """Converts an (N, 3) array of HSV values to RGB."""
+    hue, saturation, value = _columns(hsv)
+    hue = (hue / 60.0) % 6.0
+    sextant = hue.astype(np.intp)
+    fraction = hue - sextant
+    even = (sextant & 1) == 0
+    fraction[even] = 1 - fraction[even]
+    m = value * (1.0 - saturation)
+    n = value * (1.0 - saturation * fraction)
+    candidates = np.column_stack((value, n, m))
+    rgb = np.take_along_axis(candidates, _HSV_ORDER[sextant], axis=1)
+    grey = saturation == 0
+    rgb[grey] = value[grey, np.newaxis]
+    return rgb
+
+
+def rgb_to_xyz(rgb):
+    """Converts an (N, 3) array of RGB values to CIE-XYZ."""
+    with np.errstate(invalid='ignore'):
+        linear = np.where(rgb <= 0.03928, rgb / 12.92,
+                          ((rgb + 0.055) / 1.055) ** 2.4)
+    return linear.dot(_RGB_TO_XYZ.T)
+
+
+def xyz_to_rgb(xyz):
+    """Converts an (N, 3) array of CIE-XYZ values to RGB."""
+    linear = xyz.dot(_XYZ_TO_RGB.T)
+    with np.errstate(invalid='ignore'):
+        return np.where(linear <= 0.03928 / 12.92, linear * 12.92,
+                        1.055 * linear ** (1 / 2.4) - 0.055)
+
+
+def xyz_to_lab(xyz, white_point=DEFAULT_WHITE_POINT):
+    """Converts an (N, 3) array of CIE-XYZ values to CIE-LAB.
+
+    Like grapefruit, a and b are scaled to roughly the range -1 to 1.
+
+    """
+    scaled = xyz / np.asarray(white_point, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        scaled = np.where(scaled > 0.008856, np.cbrt(scaled),
+                          7.787 * scaled + 16.0 / 116)
+    x, y, z = scaled.T
+    return np.column_stack((116 * y - 16, 5.0 * (x - y), 2.0 * (y - z)))
+
+
+def rgb_to_cielab(rgb, white_point=DEFAULT_WHITE_POINT):
+    """Converts an (N, 3) array of RGB values to conventional CIE-LAB.
+
+    Unlike `xyz_to_lab`, a and b are not scaled down, so Euclidean
+    distances are in Delta-E units.
+
+    """
+    lab = xyz_to_lab(rgb_to_xyz(np.asarray(rgb, dtype=np.float64)),
+                     white_point)
+    lab[:, 1:] *= 100.0
+    return lab
+
+
+def lab_to_xyz(lab, white_point=DEFAULT_WHITE_POINT):
+    """Converts an (N, 3) array of CIE-LAB values to CIE-XYZ."""
+    l, a, b = lab.T
+    y = (l + 16) / 116
+    scaled = np.column_stack((a / 5.0 + y, y, y - b / 2.0))
+    scaled = np.where(scaled > 0.206893, scaled ** 3,
+                      (scaled - 16.0 / 116) / 7.787)
+    return scaled * np.asarray(white_point, dtype=np.float64)
+
+
+def cmy_to_cmyk(cmy):
+    """Converts an (N, 3) array of CMY values to CMYK."""
+    c, m, y = _columns(cmy)
+    key = np.minimum(np.minimum(c, m), y)
+    scale = 1.0 - key
+    black = scale == 0
+    scale[black] = 1.0
+    cmyk = np.column_stack(((c - key) / scale, (m - key) / scale,
+                            (y - key) / scale, key))
+    cmyk[black, :3] = 0.0
+    return cmyk
+
+
+def cmyk_to_cmy(cmyk):
+    """Converts an (N, 4) array of CMYK values to CMY."""
+    key = cmyk[:, 3:]
+    return cmyk[:, :3] * (1 - key) + key
+
+
+def rgb_array(colors):
+    """Returns an (N, 3) float64 array of the RGB values of colors.
+
+    Args:
+        colors: A sequence of RGB or RGBA colors, an (N, 3) or (N, 4)
+            array, or a `packed.PackedColors`.
+
+    """
+    values = getattr(colors, 'values', None)
+    if isinstance(values, np.ndarray):
+        # `packed.PackedColors`
+        colors = colors.as_float(np.float64)
+    if isinstance(colors, np.ndarray):
+        return np.array(colors[:, :3], dtype=np.float64).reshape(-1, 3)
+    return np.array([color[:3] for color in colors],
+                    dtype=np.float64).reshape(-1, 3)
+
+
+def rgb_to_websafe(rgb):
+    """Converts an (N, 3) array of RGB values to the nearest websafe
+    colors, rounding halfway values up like grapefruit."""
+    scaled = np.asarray(rgb, dtype=np.float64) * 100.0
+    remainder = scaled % 20
+    lower = scaled - remainder
+    safe = np.where(remainder >= 20 - remainder, lower + 20, lower) / 100.0
+    return np.where(remainder == 0, rgb, safe)
+
+
+def rgb_to_greyscale(rgb):
+    """Converts an (N, 3) array of RGB values to greyscale."""
+    grey = np.asarray(rgb, dtype=np.float64).mean(axis=1)
+    return np.repeat(grey[:, np.newaxis], 3, axis=1)
+
+
+def rgb_to_html(rgb):
+    """Converts an (N, 3) array of RGB values to hex strings."""
+    ints = np.clip(np.rint(np.asarray(rgb) * 255), 0, 255).astype(np.uint8)
+    # Build UCS4 code points directly so no string conversion is needed
+    chars = np.empty((len(ints), 7), dtype=np.uint32)
+    chars[:, 0] = ord('#')
+    chars[:, 1:] = _HEX_PAIRS[ints].reshape(len(ints), 6)
+    return chars.view('U7').ravel()
+
+
+def html_to_rgb(html):
+    """Converts an (N,) array of hex strings to RGB values.
+
+    The strings may have a leading '#' and 3 or 6 hex digits.
+
+    Raises:
+        ValueError: If a string is not a valid hex color.
+
+    """
+    html = np.char.lstrip(np.char.strip(np.asarray(html).astype('S')), b'#')
+    lengths = np.char.str_len(html)
+    chars = html.astype('S6').view(np.uint8).reshape(len(html), 6)
+    digits = _HEX_VALUES[chars]
+    # Expand 3 digit shorthand, e.g. 'f0a' to 'ff00aa'
+    short = lengths == 3
+    digits[short] = digits[short][:, [0, 0, 1, 1, 2, 2]]
+    if np.any((lengths != 3) & (lengths != 6)) or np.any(digits < 0):
+        raise ValueError('Invalid hex color in input')
+    return (digits[:, 0::2] * 16 + digits[:, 1::2]) / 255.0
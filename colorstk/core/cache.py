@@ -0,0 +1,123 @@
+"""Implements caching of values derived from colors."""
+
+from collections import Counter, OrderedDict
+
+from .info import color_info
+from .schemes import make_schemes
+from .spaces import get_value
+
+
+class ColorBundle(object):
+    """Holds the values, info and schemes derived from a color.
+
+    Each part is computed the first time it is requested.
+
+    """
+
+    def __init__(self, color, white_point, scheme_mode, value_range,
+                 conversions=None, name_index=None):
+        """Initializes a `ColorBundle`.
+
+        Args:
+            color: The `grapefruit.Color` to derive values from.
+            white_point: The white reference for the variant colors.
+            scheme_mode: The color wheel for schemes, 'rgb' or 'ryb'.
+            value_range: The range for sRGB values, '0-1' or '0-255'.
+            conversions: An optional `Counter` that is incremented
+                with the kind of each computation, 'value', 'info'
+                or 'schemes'.
+            name_index: An optional `names.NameIndex` for naming
+                the color, see `core.color_info`.
+
+        """
+        self.color = color
+        self.white_point = white_point
+        self.scheme_mode = scheme_mode
+        self.value_range = value_range
+        self.conversions = Counter() if conversions is None else conversions
+        self.name_index = name_index
+        self._values = {}
+        self._info = None
+        self._schemes = None
+
+    def get_value(self, color_space):
+        """Returns a new list with the value for a color space."""
+        if color_space not in self._values:
+            self.conversions['value'] += 1
+            self._values[color_space] = get_value(
+                self.color, color_space, self.value_range)
+        return list(self._values[color_space])
+
+    @property
+    def info(self):
+        """A dict of info about the color, see `core.color_info`."""
+        if self._info is None:
+            self.conversions['info'] += 1
+            self._info = color_info(self.color, self.white_point,
+                                    self.name_index)
+        return self._info
+
+    @property
+    def schemes(self):
+        """A dict of color schemes, see `core.make_schemes`."""
+        if self._schemes is None:
+            self.conversions['schemes'] += 1
+            self._schemes = make_schemes(self.color, self.scheme_mode)
+        return self._schemes
+
+
+class BundleCache(object):
+    """A bounded LRU cache of `ColorBundle` objects.
+
+    Bundles are keyed by the RGBA values of the color, the white point,
+    the scheme mode and the value range.  `conversions` counts the
+    computations done by all bundles of the cache, by kind.
+
+    """
+
+    def __init__(self, maxsize=64, name_index=None):
+        """Initializes an empty `BundleCache`.
+
+        Args:
+            maxsize: The maximum number of bundles to keep.
+                Defaults to 64.
+            name_index: An optional `names.NameIndex` passed on to
+                each bundle.
+
+        """
+        self.maxsize = maxsize
+        self.name_index = name_index
+        self.hits = 0
+        self.misses = 0
+        self.conversions = Counter()
+        self._bundles = OrderedDict()
+
+    def __len__(self):
+        return len(self._bundles)
+
+    def get(self, color, white_point, scheme_mode, value_range):
+        """Returns the bundle for a color, creating it if necessary."""
+        key = (tuple(color), tuple(white_point), scheme_mode, value_range)
+        bundle = self._bundles.get(key)
+        if bundle is not None:
+            self.hits += 1
+            self._bundles.move_to_end(key)
+            return bundle
+
+        self.misses += 1
+        bundle = ColorBundle(color, white_point, scheme_mode, value_range,
+                             self.conversions, self.name_index)
+        self._bundles[key] = bundle
+        if len(self._bundles) > self.maxsize:
+            self._bundles.popitem(last=False)
+        return bundle
+
+    def reset_counters(self):
+        """Resets the hit, miss and conversion counters to zero."""
+        self.hits = 0
+        self.misses = 0
+        self.conversions.clear()
+
+    def invalidate(self):
+        """Removes all bundles, keeping the hit and miss counters."""
+        self._bundles.clear()
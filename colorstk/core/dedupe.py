@@ -0,0 +1,382 @@
+"""Implements removing near-duplicate colors from palettes.
+
+Colors are bucketed by a perceptual hash, their CIE-LAB values quantized
+to cells twice the size of the tolerance, so that every color within the
+tolerance of a color is in one of the 8 cells on the sides nearest to
+it.  Each color is compared only with the colors kept in those cells,
+which takes about linear time for any tolerance.  Colors are compared
+in batches with numpy, and only the colors that no earlier kept color
+is near are decided one at a time.
+
+Colors are kept in palette order: a color is a duplicate if it is within
+the tolerance of a color kept before it, and is then matched to the
+nearest one.  Colors with different alpha values are never duplicates.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from .batch import rgb_to_cielab
+from .names import flat_ids
+from .spaces import DEFAULT_WHITE_POINT
+
+# The CIE76 Delta-E of about one just noticeable difference
+TOLERANCE = 2.3
+
+# Limit on the number of grid cells along each axis
+_MAX_CELLS = 1 << 16
+# Colors are compared with the colors kept before them in batches of at
+# most this many, starting small while few colors are kept
+_BATCH_SIZE = 16384
+_FIRST_BATCH_SIZE = 256
+# The offsets of a cell and its 7 neighbors on the nearest sides
+_CORNERS = np.array([[x, y, z] for x in (0, 1) for y in (0, 1)
+                     for z in (0, 1)])
+
+Duplicate = namedtuple('Duplicate', 'palette index color original delta_e')
+Duplicate.__doc__ = """A color that is removed as a near-duplicate.
+
+Attributes:
+    palette: The name of the palette with the color.
+    index: The index of the color in its palette.
+    color: A list of the RGB or RGBA values of the color.
+    original: The kept color that the color duplicates.
+    delta_e: The CIE76 Delta-E of the color to the kept color.
+"""
+
+DedupeResult = namedtuple('DedupeResult', 'palette colors duplicates merged')
+DedupeResult.__doc__ = """The changes of deduplicating or merging palettes.
+
+Attributes:
+    palette: The name of the palette the colors are saved to.
+    colors: A list of the colors that are kept, in order.
+    duplicates: A list of the `Duplicate` colors that are removed.
+    merged: A list of the names of other palettes that are merged into
+        the palette and deleted.
+"""
+
+
+def find_duplicates(colors, tolerance=TOLERANCE,
+                    white_point=DEFAULT_WHITE_POINT):
+    """Finds the near-duplicates among colors.
+
+    Args:
+        colors: A sequence of RGB or RGBA colors in range 0-1, or an
+            (N, 3) or (N, 4) array with NaN for missing alpha values.
+        tolerance: The maximum CIE76 Delta-E of duplicates.  With 0,
+            only equal colors are duplicates. Defaults to `TOLERANCE`.
+        white_point: The white reference for CIE-LAB.
+            Defaults to D65 with the CIE 1931 observer.
+
+    Returns:
+        A tuple of two arrays: for each color, the index of the kept
+        color it duplicates, or -1 if it is kept, and the Delta-E to
+        that color.
+
+    """
+    values = _values(colors)
+    count = len(values)
+    originals = np.full(count, -1, dtype=np.int64)
+    distances = np.zeros(count)
+    if not count:
+        return originals, distances
+    lab = rgb_to_cielab(values[:, :3], white_point)
+    alphas = np.nan_to_num(values[:, 3], nan=-1.0)
+    cells = _cells(lab, tolerance)
+    limit = tolerance * tolerance
+    # Indexes of the kept colors, sorted by cell
+    kept = np.empty(0, dtype=np.int64)
+    kept_cells = np.empty(0, dtype=np.int64)
+    start = 0
+    batch_size = _FIRST_BATCH_SIZE
+    while start < count:
+        batch = np.arange(start, min(start + batch_size, count))
+        start += len(batch)
+        batch_size = min(2 * batch_size, _BATCH_SIZE)
+        nearest, distance = _nearest(batch, cells, kept, kept_cells, lab,
+                                     alphas, limit)
+        # Colors that no kept color is near are decided in order
+        found = np.flatnonzero(nearest != -1)
+        rest = np.flatnonzero(nearest == -1)
+        nearest[rest], distance[rest] = _greedy(
+            batch.take(rest), cells, lab, alphas, limit)
+        new_kept = batch[nearest == -1]
+        new_cells = cells[new_kept, 0]
+        new_order = np.argsort(new_cells, kind='stable')
+        # A color kept later in the batch may be nearer
+        later, later_distance = _nearest(
+            batch.take(found), cells, new_kept.take(new_order),
+            new_cells.take(new_order), lab, alphas, limit, earlier=True)
+        nearer = later_distance < distance.take(found)
+        nearest[found[nearer]] = later[nearer]
+        distance[found[nearer]] = later_distance[nearer]
+        duplicate = nearest != -1
+        originals[batch[duplicate]] = nearest[duplicate]
+        distances[batch[duplicate]] = np.sqrt(distance[duplicate])
+        kept = np.concatenate((kept, new_kept))
+        kept_cells = np.concatenate((kept_cells, new_cells))
+        order = np.argsort(kept_cells, kind='stable')
+        kept = kept.take(order)
+        kept_cells = kept_cells.take(order)
+    return originals, distances
+
+
+def merge_palettes(store, names, target, tolerance=TOLERANCE,
+                   dry_run=False, white_point=DEFAULT_WHITE_POINT):
+    """Merges palettes into one palette without near-duplicate colors.
+
+    The colors of the palettes are joined in order and saved to the
+    target palette, which may be one of them or a new palette, and the
+    other palettes are deleted.  All changes are made in one store
+    transaction.
+
+    Args:
+        store: A `store.PaletteStore`.
+        names: The names of the palettes to merge.
+        target: The name of the palette to save the colors to.
+        tolerance: The maximum CIE76 Delta-E of duplicates.
+            Defaults to `TOLERANCE`.
+        dry_run: If True, the store is not changed. Defaults to False.
+        white_point: The white reference for CIE-LAB.
+            Defaults to D65 with the CIE 1931 observer.
+
+    Returns:
+        The `DedupeResult` of the merge.
+
+    Raises:
+        KeyError: If there is no palette with one of the names.
+        ValueError: If there are no names, or the target is a palette
+            that is not merged.
+
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        raise ValueError('No palettes to merge')
+    if target in store and target not in names:
+        raise ValueError('Palette already exists: {}'.format(target))
+    result = _dedupe(store, names, target, tolerance, white_point)
+    if not dry_run:
+        with store.transaction():
+            if target in names:
+                store.set_colors(target, result.colors)
+            else:
+                store.create(target, result.colors)
+            for name in result.merged:
+                store.delete(name)
+    return result
+
+
+def dedupe_palettes(store, names=None, tolerance=TOLERANCE,
+                    dry_run=False, white_point=DEFAULT_WHITE_POINT):
+    """Removes the near-duplicate colors within each of some palettes.
+
+    Palettes without duplicates are not changed, and the others are all
+    changed in one store transaction.
+
+    Args:
+        store: A `store.PaletteStore`.
+        names: The names of the palettes, or None for all palettes.
+            Defaults to None.
+        tolerance: The maximum CIE76 Delta-E of duplicates.
+            Defaults to `TOLERANCE`.
+        dry_run: If True, the store is not changed. Defaults to False.
+        white_point: The white reference for CIE-LAB.
+            Defaults to D65 with the CIE 1931 observer.
+
+    Returns:
+        A list of the `DedupeResult` of each palette with duplicates.
+
+    Raises:
+        KeyError: If there is no palette with one of the names.
+
+    """
+    if names is None:
+        names = store.names()
+    results = []
+    for name in names:
+        result = _dedupe(store, [name], name, tolerance, white_point)
+        if result.duplicates:
+            results.append(result)
+    if not dry_run and results:
+        with store.transaction():
+            for result in results:
+                store.set_colors(result.palette, result.colors)
+    return results
+
+
+def format_report(results):
+    """Returns a short description of the changes of `DedupeResult`s."""
+    lines = []
+    for result in results:
+        line = '{}: keeps {} colors, removes {}'.format(
+            result.palette, len(result.colors), len(result.duplicates))
+        if result.merged:
+            line += ', merges {}'.format(', '.join(result.merged))
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _cells(lab, tolerance):
+    """Returns the flat ids of the cell of each color and of the 7
+    neighbors on its nearest sides, as an (N, 8) array.
+
+    The cells are at least twice the size of the tolerance, so that all
+    colors within the tolerance of a color are in these cells.
+
+    """
+    origin = lab.min(axis=0)
+    cell_size = max(2.0 * tolerance,
+                    (lab.max(axis=0) - origin).max() / _MAX_CELLS) or 1.0
+    scaled = (lab - origin) / cell_size
+    floor = np.floor(scaled)
+    sides = np.where(scaled - floor < 0.5, -1, 1)
+    # Padded with a cell on each side for the neighbors
+    cells = floor.astype(np.int64) + 1
+    dims = cells.max(axis=0) + 2
+    ids = np.empty((len(lab), len(_CORNERS)), dtype=np.int64)
+    for corner, offsets in enumerate(_CORNERS):
+        ids[:, corner] = flat_ids(cells + offsets * sides, dims)
+    return ids
+
+
+def _nearest(queries, cells, kept, kept_cells, lab, alphas, limit,
+             earlier=False):
+    """Finds the nearest kept color within the tolerance of colors.
+
+    Args:
+        queries: The positions of the colors.
+        cells: The cell ids of all colors, from `_cells`.
+        kept: The positions of the kept colors, sorted by cell.
+        kept_cells: The cell ids of the kept colors, sorted.
+        lab: The CIE-LAB values of all colors.
+        alphas: The alpha values of all colors.
+        limit: The squared tolerance.
+        earlier: If True, only colors kept before a color are searched.
+
+    Returns:
+        A tuple of the position of the nearest kept color of each
+        query, or -1, and the squared distances, or infinity.
+
+    """
+    nearest = np.full(len(queries), -1, dtype=np.int64)
+    distance = np.full(len(queries), np.inf)
+    if not len(queries) or not len(kept):
+        return nearest, distance
+    searched = cells.take(queries, axis=0).reshape(-1)
+    lows = np.searchsorted(kept_cells, searched, 'left')
+    counts = np.searchsorted(kept_cells, searched, 'right') - lows
+    total = int(counts.sum())
+    if not total:
+        return nearest, distance
+    # One pair of a query and a kept color for each color in its cells
+    pairs = np.repeat(np.arange(len(searched)) // len(_CORNERS), counts)
+    positions = np.arange(total) - np.repeat(np.cumsum(counts) - counts -
+                                             lows, counts)
+    candidates = kept.take(positions)
+    colors = queries.take(pairs)
+    dists = ((lab.take(colors, axis=0) -
+              lab.take(candidates, axis=0)) ** 2).sum(axis=1)
+    inside = (dists <= limit) & (alphas.take(colors) ==
+                                 alphas.take(candidates))
+    if earlier:
+        inside &= candidates < colors
+    if not inside.any():
+        return nearest, distance
+    pairs = pairs[inside]
+    candidates = candidates[inside]
+    dists = dists[inside]
+    # Pairs are grouped by query, so the nearest of each group is found
+    # without sorting, and of equally near ones the first kept
+    starts = np.flatnonzero(np.diff(pairs, prepend=-1))
+    groups = np.repeat(np.arange(len(starts)),
+                       np.diff(np.append(starts, len(pairs))))
+    least = np.minimum.reduceat(dists, starts)
+    candidates = np.where(dists == least.take(groups), candidates,
+                          np.iinfo(np.int64).max)
+    nearest[pairs.take(starts)] = np.minimum.reduceat(candidates, starts)
+    distance[pairs.take(starts)] = least
+    return nearest, distance
+
+
+def _greedy(queries, cells, lab, alphas, limit):
+    """Decides in order which of colors are kept, comparing each only
+    with the colors kept before it.
+
+    Returns:
+        A tuple of the position of the nearest kept color of each color,
+        or -1 if it is kept, and the squared distances, or infinity.
+
+    """
+    nearests = []
+    distances = []
+    buckets = {}
+    for position, (l, a, b), searched, alpha in zip(
+            queries.tolist(), lab.take(queries, axis=0).tolist(),
+            cells.take(queries, axis=0).tolist(),
+            alphas.take(queries).tolist()):
+        nearest = -1
+        nearest_distance = limit
+        for cell in searched:
+            for other, other_l, other_a, other_b, other_alpha in (
+                    buckets.get(cell, ())):
+                distance = ((l - other_l) ** 2 + (a - other_a) ** 2 +
+                            (b - other_b) ** 2)
+                if alpha != other_alpha or distance > nearest_distance:
+                    continue
+                # Of equally near colors, the first kept
+                if (nearest == -1 or distance < nearest_distance or
+                        other < nearest):
+                    nearest = other
+                    nearest_distance = distance
+        if nearest == -1:
+            buckets.setdefault(searched[0], []).append(
+                (position, l, a, b, alpha))
+            nearest_distance = np.inf
+        nearests.append(nearest)
+        distances.append(nearest_distance)
+    return np.array(nearests, dtype=np.int64), np.array(distances)
+
+
+def _dedupe(store, names, target, tolerance, white_point):
+    """Returns the `DedupeResult` of joining the colors of palettes."""
+    arrays = [_values(store.packed_colors(name)) for name in names]
+    values = np.concatenate(arrays)
+    originals, distances = find_duplicates(values, tolerance, white_point)
+    colors = _colors(values)
+    duplicates = []
+    starts = np.cumsum([0] + [len(array) for array in arrays])
+    for index in np.flatnonzero(originals != -1).tolist():
+        palette = int(np.searchsorted(starts, index, side='right')) - 1
+        duplicates.append(Duplicate(
+            names[palette], index - int(starts[palette]), colors[index],
+            colors[originals[index]], float(distances[index])))
+    kept = [colors[index]
+            for index in np.flatnonzero(originals == -1).tolist()]
+    return DedupeResult(target, kept, duplicates,
+                        [name for name in names if name != target])
+
+
+def _values(colors):
+    """Returns an (N, 4) float64 array of colors, with NaN for missing
+    alpha values."""
+    values = getattr(colors, 'values', None)
+    if isinstance(values, np.ndarray):
+        # `packed.PackedColors`
+        colors = colors.as_float(np.float64)
+    if not isinstance(colors, np.ndarray):
+        colors = np.array([list(color[:4]) + [np.nan] * (4 - len(color))
+                           for color in colors],
+                          dtype=np.float64).reshape(-1, 4)
+    colors = np.asarray(colors, dtype=np.float64)
+    if colors.shape[1] == 3:
+        colors = np.column_stack((colors, np.full(len(colors), np.nan)))
+    return colors
+
+
+def _colors(values):
+    """Returns a list of colors from an (N, 4) array of values."""
+    colors = values.tolist()
+    # NaN alpha is the only value not equal to itself
+    return [color if color[3] == color[3] else color[:3]
+            for color in colors]
@@ -0,0 +1,250 @@
+"""Implements perceptual color differences (Delta-E).
+
+All functions take conventional CIE-LAB values, with a and b in the
+range of about -128 to 127, as returned by `batch.rgb_to_cielab`.  Use
+`lab_values` to get them from RGB values or grapefruit's scaled LAB
+values, with the same white point as `LookupScreen.get_value`.
+
+Arguments broadcast like numpy arrays, so a single color can be
+compared with many colors, or two (N, 3) arrays pair by pair.  Full
+distance matrices are computed in tiles to bound memory.
+"""
+
+import numpy as np
+
+from .batch import rgb_to_cielab
+from .spaces import DEFAULT_WHITE_POINT
+
+METHODS = ('cie76', 'cie94', 'ciede2000')
+
+_POW25_7 = 25.0 ** 7
+_TAU = 2.0 * np.pi
+_COS_30, _SIN_30 = np.cos(np.radians(30.0)), np.sin(np.radians(30.0))
+_COS_6, _SIN_6 = np.cos(np.radians(6.0)), np.sin(np.radians(6.0))
+_COS_63, _SIN_63 = np.cos(np.radians(63.0)), np.sin(np.radians(63.0))
+
+
+def lab_values(values, color_space='sRGB', white_point=DEFAULT_WHITE_POINT):
+    """Returns conventional CIE-LAB values for an array of colors.
+
+    Args:
+        values: An (N, 3) array of RGB values in range 0-1, or of LAB
+            values as returned by `get_value('CIE-LAB')`.
+        color_space: 'sRGB' or 'CIE-LAB'. Defaults to 'sRGB'.
+        white_point: The white reference for converting RGB values.
+            Defaults to D65 with the CIE 1931 observer.
+
+    Raises:
+        ValueError: If the color space is not supported.
+
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if color_space == 'sRGB':
+        return rgb_to_cielab(values, white_point)
+    elif color_space == 'CIE-LAB':
+        # grapefruit scales a and b down by 100
+        return values * (1.0, 100.0, 100.0)
+    raise ValueError('Unsupported color space: {}'.format(color_space))
+
+
+def cie76(lab1, lab2):
+    """Returns the CIE76 Delta-E, the Euclidean distance in CIE-LAB."""
+    diff = np.asarray(lab1, dtype=np.float64) - lab2
+    return np.sqrt(np.einsum('...i,...i->...', diff, diff))
+
+
+def cie94(lab1, lab2, textiles=False):
+    """Returns the CIE94 Delta-E.
+
+    The formula is not symmetric, `lab1` is the reference color.
+
+    Args:
+        lab1: The reference LAB values.
+        lab2: The LAB values to compare with.
+        textiles: Whether to use the weights for textiles instead of
+            graphic arts. Defaults to False.
+
+    """
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    if textiles:
+        k_l, k_1, k_2 = 2.0, 0.048, 0.014
+    else:
+        k_l, k_1, k_2 = 1.0, 0.045, 0.015
+
+    l1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    l2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+    c1 = np.hypot(a1, b1)
+    c2 = np.hypot(a2, b2)
+    delta_l = l1 - l2
+    delta_c = c1 - c2
+    delta_h_sq = np.maximum(
+        (a1 - a2) ** 2 + (b1 - b2) ** 2 - delta_c ** 2, 0.0)
+    s_c = 1.0 + k_1 * c1
+    s_h = 1.0 + k_2 * c1
+    return np.sqrt((delta_l / k_l) ** 2 + (delta_c / s_c) ** 2 +
+                   delta_h_sq / s_h ** 2)
+
+
+def ciede2000(lab1, lab2, k_l=1.0, k_c=1.0, k_h=1.0):
+    """Returns the CIEDE2000 Delta-E.
+
+    Args:
+        lab1: The first LAB values.
+        lab2: The second LAB values.
+        k_l: The weight of lightness differences. Defaults to 1.
+        k_c: The weight of chroma differences. Defaults to 1.
+        k_h: The weight of hue differences. Defaults to 1.
+
+    """
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    l1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    l2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+    c_mean_7 = ((np.sqrt(a1 * a1 + b1 * b1) +
+                 np.sqrt(a2 * a2 + b2 * b2)) / 2.0) ** 7
+    g = 1.5 - 0.5 * np.sqrt(c_mean_7 / (c_mean_7 + _POW25_7))
+    a1 = g * a1
+    a2 = g * a2
+    c1 = np.sqrt(a1 * a1 + b1 * b1)
+    c2 = np.sqrt(a2 * a2 + b2 * b2)
+    # Hue angles in radians, in the range 0 to 2 pi
+    h1 = np.arctan2(b1, a1)
+    h1 += (h1 < 0) * _TAU
+    h2 = np.arctan2(b2, a2)
+    h2 += (h2 < 0) * _TAU
+
+    chroma_product = c1 * c2
+    achromatic = chroma_product == 0
+    delta_l = l2 - l1
+    delta_c = c2 - c1
+    # 2 sqrt(C1 C2) sin(dh / 2) without trigonometry, using the
+    # magnitude from da^2 + db^2 - dC^2 and the sign from the cross product
+    delta_big_h = np.sqrt(np.maximum(
+        (a2 - a1) ** 2 + (b2 - b1) ** 2 - delta_c ** 2, 0.0))
+    delta_big_h *= np.where(a1 * b2 - a2 * b1 < 0, -1.0, 1.0)
+
+    l_mean = (l1 + l2) / 2.0
+    c_mean = (c1 + c2) / 2.0
+    h_sum = h1 + h2
+    h_mean = np.where(achromatic | (np.abs(h1 - h2) <= np.pi), h_sum,
+                      np.where(h_sum < _TAU, h_sum + _TAU, h_sum - _TAU))
+    h_mean[~achromatic] /= 2.0
+
+    # The cosines of multiples of the mean hue in T are expanded from
+    # its cosine and sine, which avoids two more trigonometric calls.
+    cos_h = np.cos(h_mean)
+    sin_h = np.sin(h_mean)
+    cos_2h = 2.0 * cos_h * cos_h - 1.0
+    sin_2h = 2.0 * sin_h * cos_h
+    cos_3h = cos_h * (2.0 * cos_2h - 1.0)
+    sin_3h = sin_h * (2.0 * cos_2h + 1.0)
+    cos_4h = 2.0 * cos_2h * cos_2h - 1.0
+    sin_4h = 2.0 * sin_2h * cos_2h
+    t = (1.0 - 0.17 * (cos_h * _COS_30 + sin_h * _SIN_30) +
+         0.24 * cos_2h +
+         0.32 * (cos_3h * _COS_6 - sin_3h * _SIN_6) -
+         0.20 * (cos_4h * _COS_63 + sin_4h * _SIN_63))
+
+    delta_theta = np.radians(30.0) * np.exp(
+        -((np.degrees(h_mean) - 275.0) / 25.0) ** 2)
+    c_mean_7 = c_mean ** 7
+    r_c = 2.0 * np.sqrt(c_mean_7 / (c_mean_7 + _POW25_7))
+    l_offset_sq = (l_mean - 50.0) ** 2
+    s_l = 1.0 + 0.015 * l_offset_sq / np.sqrt(20.0 + l_offset_sq)
+    s_c = 1.0 + 0.045 * c_mean
+    s_h = 1.0 + 0.015 * c_mean * t
+    r_t = -np.sin(2.0 * delta_theta) * r_c
+
+    term_l = delta_l / (k_l * s_l)
+    term_c = delta_c / (k_c * s_c)
+    term_h = delta_big_h / (k_h * s_h)
+    return np.sqrt(term_l ** 2 + term_c ** 2 + term_h ** 2 +
+                   r_t * term_c * term_h)
+
+
+def delta_e(lab1, lab2, method='ciede2000'):
+    """Returns the Delta-E between colors with a method by name.
+
+    Args:
+        lab1: LAB values of shape (3,) or (N, 3).
+        lab2: LAB values of shape (3,) or (N, 3), broadcast
+            against `lab1`.
+        method: One of `METHODS`. Defaults to 'ciede2000'.
+
+    Raises:
+        ValueError: If the method is not supported.
+
+    """
+    return _method(method)(lab1, lab2)
+
+
+def iter_matrix(lab1, lab2=None, method='ciede2000', tile_size=1024,
+                dtype=np.float32):
+    """Yields the tiles of a Delta-E matrix.
+
+    Only one tile of (`tile_size`, `tile_size`) values is held in
+    memory at a time, so very large matrices can be streamed.
+
+    Args:
+        lab1: An (N, 3) array of LAB values for the rows.
+        lab2: An (M, 3) array of LAB values for the columns.
+            Defaults to `lab1`.
+        method: One of `METHODS`. Defaults to 'ciede2000'.
+        tile_size: The number of rows and columns of each tile.
+            Defaults to 1024.
+        dtype: The dtype of the tiles. Defaults to float32.
+
+    Yields:
+        Tuples of (row, column, tile), where row and column are the
+        indexes of the top left value of the tile in the matrix.
+
+    """
+    function = _method(method)
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = lab1 if lab2 is None else np.asarray(lab2, dtype=np.float64)
+    for row in range(0, len(lab1), tile_size):
+        rows = lab1[row:row + tile_size, np.newaxis, :]
+        for column in range(0, len(lab2), tile_size):
+            columns = lab2[np.newaxis, column:column + tile_size, :]
+            yield row, column, function(rows, columns).astype(dtype)
+
+
+def matrix(lab1, lab2=None, method='ciede2000', tile_size=1024,
+           dtype=np.float32, out=None):
+    """Returns the full Delta-E matrix between two arrays of colors.
+
+    Args:
+        lab1: An (N, 3) array of LAB values for the rows.
+        lab2: An (M, 3) array of LAB values for the columns.
+            Defaults to `lab1`.
+        method: One of `METHODS`. Defaults to 'ciede2000'.
+        tile_size: The number of rows and columns computed at a time.
+            Defaults to 1024.
+        dtype: The dtype of the matrix. Defaults to float32.
+        out: An optional (N, M) array to fill, such as a
+            `numpy.memmap` for matrices that do not fit in memory.
+
+    Returns:
+        The (N, M) matrix, or `out` if given.
+
+    """
+    rows = len(lab1)
+    columns = rows if lab2 is None else len(lab2)
+    if out is None:
+        out = np.empty((rows, columns), dtype=dtype)
+    for row, column, tile in iter_matrix(lab1, lab2, method,
+                                         tile_size, dtype):
+        out[row:row + tile.shape[0], column:column + tile.shape[1]] = tile
+    return out
+
+
+def _method(method):
+    if method == 'cie76':
+        return cie76
+    elif method == 'cie94':
+        return cie94
+    elif method == 'ciede2000':
+        return ciede2000
+    raise ValueError('Unknown Delta-E method: {}'.format(method))
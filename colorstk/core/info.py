@@ -0,0 +1,53 @@
+"""Implements information about colors, such as names and variants."""
+
+import grapefruit
+
+from .spaces import DEFAULT_WHITE_POINT
+
+# Load named colors from grapefruit as {value: name} pairs
+NAMED_COLORS = {value: name for name, value in
+                grapefruit.NAMED_COLOR.items()}
+
+
+def color_info(color, white_point=DEFAULT_WHITE_POINT, name_index=None):
+    """Returns info about a color.
+
+    Args:
+        color: The `grapefruit.Color` to get info about.
+        white_point: The white reference for the variant colors.
+            Defaults to D65 with the CIE 1931 observer.
+        name_index: An optional `names.NameIndex` used to name colors
+            without an exact named match.
+
+    Returns:
+        A dict with the color name and its websafe, greyscale and
+        complementary colors, and the RYB hue of the color.
+
+    """
+    return {
+        'color_name': color_name(color, name_index),
+        'websafe_color': grapefruit.Color(color.websafe, wref=white_point),
+        'greyscale_color': grapefruit.Color(
+            color.greyscale, wref=white_point),
+        'complementary_color': color.complementary_color(),
+        'ryb_hue': round(grapefruit.rgb_to_ryb(color.hsl_hue), 3)
+    }
+
+
+def color_name(color, name_index=None):
+    """Returns the name of a color.
+
+    Args:
+        color: The `grapefruit.Color` to name.
+        name_index: An optional `names.NameIndex`. If given, colors
+            without an exact named match get the nearest name and its
+            Delta-E, otherwise they are named 'N/A'.
+
+    """
+    name = NAMED_COLORS.get(color.html)
+    if name is not None:
+        return name
+    if name_index is None:
+        return 'N/A'
+    name, delta_e = name_index.nearest(color.rgb)
+    return u'{} (\u0394E {:.1f})'.format(name, delta_e)
@@ -0,0 +1,330 @@
+"""Implements approximate sRGB conversions with 3D lookup tables.
+
+A `ColorLUT` samples the exact conversion of `batch.from_rgb` on a
+regular grid of RGB values and interpolates between the grid nodes, so
+bulk conversions to CIE-LAB skip the gamma and cube root math.  Tables
+are small (a 33x33x33 table holds 35937 colors) and can be cached on
+disk with `get_lut`.
+
+Only CIE-LAB is supported: the exact conversion to CIE-XYZ needs no
+cube roots and is as fast as a table.  Only sizes that convert faster
+than the exact conversion are in `SIZES`; a 33x33x33 table with
+tetrahedral interpolation is about 1.5 times as fast, as measured by
+benchmarks/bench_lut.py, larger tables are slower.
+
+The error of a table is measured with `ColorLUT.measure_error` as the
+maximum Delta-E against the exact conversion over all 8 bit colors.
+"""
+
+import hashlib
+import os
+from os.path import join
+
+import numpy as np
+
+from . import batch, deltae
+from .spaces import DEFAULT_WHITE_POINT
+
+SIZES = (17, 33)
+SPACES = ('CIE-LAB',)
+INTERPOLATIONS = ('trilinear', 'tetrahedral')
+# Upper bounds of the CIE76 Delta-E of each table size against the exact
+# conversion, for both interpolations with the D65 white point, as
+# checked by benchmarks/bench_lut.py
+MAX_DELTA_E = {17: 2.0, 33: 0.75}
+
+# Colors are interpolated in chunks of this many, so that temporary
+# arrays stay in the CPU cache
+_CHUNK_SIZE = 32768
+# Axes of RGB sorted by descending fraction, for each combination of
+# (r >= g) * 4 + (g >= b) * 2 + (r >= b).  Combinations 1 and 6 cannot
+# occur and are filled with the identity.
+_TETRAHEDRA = np.array([[2, 1, 0], [0, 1, 2], [1, 2, 0], [1, 0, 2],
+                        [2, 0, 1], [0, 2, 1], [0, 1, 2], [0, 1, 2]])
+
+_luts = {}
+
+
+class ColorLUT(object):
+    """A 3D lookup table from sRGB to CIE-LAB.
+
+    Values are the same as those of `batch.from_rgb`, so CIE-LAB uses
+    grapefruit's scaling of a and b.
+
+    """
+
+    def __init__(self, color_space='CIE-LAB', size=33,
+                 white_point=DEFAULT_WHITE_POINT, _table=None,
+                 _error_bounds=None):
+        """Builds a `ColorLUT`.
+
+        Args:
+            color_space: One of `SPACES`. Defaults to 'CIE-LAB'.
+            size: The number of grid nodes along each axis, usually one
+                of `SIZES`. Defaults to 33.
+            white_point: The white reference used for CIE-LAB.
+                Defaults to D65 with the CIE 1931 observer.
+
+        Raises:
+            ValueError: If the color space or size is not supported.
+
+        """
+        if color_space not in SPACES:
+            raise ValueError('Unsupported color space: {}'.format(color_space))
+        if size < 2:
+            raise ValueError('A LUT needs at least 2 nodes per axis')
+        self.color_space = color_space
+        self.size = size
+        self.white_point = tuple(float(val) for val in white_point)
+        if _table is None:
+            nodes = np.linspace(0.0, 1.0, size)
+            rgb = np.stack(np.meshgrid(nodes, nodes, nodes, indexing='ij'),
+                           axis=-1).reshape(-1, 3)
+            _table = batch.from_rgb(rgb, color_space, self.white_point)
+        # Flat table of shape (size ** 3, 3), red varying slowest
+        self.table = np.ascontiguousarray(_table, dtype=np.float64)
+        self.error_bounds = dict(_error_bounds or {})
+
+        # Tables with one contiguous row per channel, by dtype
+        self._columns = {}
+        strides = np.array([size * size, size, 1], dtype=np.intp)
+        self._last_offset = strides.sum()
+        # Offsets of the second and third corner of each tetrahedron
+        self._first_offsets = strides[_TETRAHEDRA[:, 0]]
+        self._second_offsets = self._last_offset - strides[_TETRAHEDRA[:, 2]]
+        # Offset of the cell and fraction within it of every 8 bit value
+        # along each axis, so uint8 input needs no scaling
+        scaled = np.arange(256) * (size - 1) / 255.0
+        byte_index = np.minimum(scaled.astype(np.intp), size - 2)
+        self._byte_offsets = [byte_index * stride for stride in strides]
+        self._byte_fraction = scaled - byte_index
+
+    @classmethod
+    def load(cls, path):
+        """Loads a `ColorLUT` saved with `save`."""
+        with np.load(path, allow_pickle=False) as data:
+            bounds = data['error_bounds']
+            error_bounds = {interpolation: float(bound) for
+                            interpolation, bound in zip(INTERPOLATIONS, bounds)
+                            if not np.isnan(bound)}
+            return cls(str(data['color_space']), int(data['size']),
+                       data['white_point'], _table=data['table'],
+                       _error_bounds=error_bounds)
+
+    def save(self, path):
+        """Saves the table and its measured error bounds to an .npz file."""
+        bounds = [self.error_bounds.get(interpolation, np.nan)
+                  for interpolation in INTERPOLATIONS]
+        np.savez(path, color_space=self.color_space, size=self.size,
+                 white_point=np.array(self.white_point), table=self.table,
+                 error_bounds=np.array(bounds))
+
+    def apply(self, rgb, interpolation='tetrahedral', dtype=np.float32):
+        """Converts an array of RGB values with the table.
+
+        Args:
+            rgb: An (N, 3) array of RGB values, either uint8 in range
+                0-255 or floats in range 0-1. Floats outside the range
+                are clipped.
+            interpolation: One of `INTERPOLATIONS`.
+                Defaults to 'tetrahedral'.
+            dtype: The float dtype to interpolate in and return.
+                Defaults to float32, which is enough for the accuracy
+                of the table and nearly halves the time.
+
+        Returns:
+            An (N, 3) array of values in the color space of the table.
+
+        Raises:
+            ValueError: If the array shape or interpolation is not
+                supported.
+
+        """
+        rgb = np.asarray(rgb)
+        if rgb.ndim != 2 or rgb.shape[1] != 3:
+            raise ValueError('Expected an array of shape (N, 3), '
+                             'got {}'.format(rgb.shape))
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError('Unknown interpolation: {}'.format(interpolation))
+        dtype = np.dtype(dtype)
+        columns = self._columns.get(dtype)
+        if columns is None:
+            columns = self._columns[dtype] = np.ascontiguousarray(
+                self.table.T, dtype=dtype)
+
+        result = np.empty((len(rgb), 3), dtype=dtype)
+        for start in range(0, len(rgb), _CHUNK_SIZE):
+            chunk = rgb[start:start + _CHUNK_SIZE]
+            result[start:start + len(chunk)] = self._interpolate(
+                columns, chunk, interpolation).T
+        return result
+
+    def measure_error(self, interpolation='tetrahedral', method='cie76',
+                      step=1):
+        """Measures the maximum Delta-E of the table against exact values.
+
+        All 8 bit colors are compared, one red value at a time, and the
+        result is stored in `error_bounds`.  Float input between 8 bit
+        values interpolates the same cells, so its error is bounded by
+        the same value in practice.
+
+        Args:
+            interpolation: One of `INTERPOLATIONS`.
+                Defaults to 'tetrahedral'.
+            method: One of `deltae.METHODS`. Defaults to 'cie76'.
+            step: Only compare every `step`-th red, green and blue
+                value, for a faster estimate. Defaults to 1.
+
+        Returns:
+            The maximum Delta-E.
+
+        """
+        levels = np.arange(0, 256, step, dtype=np.uint8)
+        green, blue = np.meshgrid(levels, levels, indexing='ij')
+        rgb = np.column_stack((np.zeros(green.size, dtype=np.uint8),
+                               green.ravel(), blue.ravel()))
+        worst = 0.0
+        for red in levels:
+            rgb[:, 0] = red
+            exact = self._cielab(batch.from_rgb(rgb / 255.0, self.color_space,
+                                                self.white_point))
+            approximate = self._cielab(self.apply(rgb, interpolation))
+            worst = max(worst, float(
+                deltae.delta_e(exact, approximate, method).max()))
+        if step == 1:
+            self.error_bounds[interpolation] = worst
+        return worst
+
+    def _cielab(self, values):
+        """Returns conventional CIE-LAB values of table values."""
+        return deltae.lab_values(values, 'CIE-LAB')
+
+    def _interpolate(self, columns, rgb, interpolation):
+        """Returns a (3, N) array of interpolated values for RGB values."""
+        dtype = columns.dtype
+        channels = np.ascontiguousarray(rgb.T)
+        if rgb.dtype == np.uint8:
+            base = self._byte_offsets[0].take(channels[0])
+            base += self._byte_offsets[1].take(channels[1])
+            base += self._byte_offsets[2].take(channels[2])
+            byte_fraction = self._byte_fraction.astype(dtype)
+            fraction = [byte_fraction.take(channel) for channel in channels]
+        else:
+            scaled = np.clip(channels.astype(dtype), 0.0, 1.0)
+            scaled *= self.size - 1
+            cells = np.minimum(np.floor(scaled), self.size - 2)
+            fraction = scaled - cells
+            index = cells.astype(np.intp)
+            base = (index[0] * self.size + index[1]) * self.size + index[2]
+
+        if interpolation == 'tetrahedral':
+            return self._tetrahedral(columns, base, *fraction)
+        return self._trilinear(columns, base, *fraction)
+
+    def _tetrahedral(self, columns, base, r, g, b):
+        """Interpolates within the tetrahedron of each cell containing
+        the color, using 4 of the 8 corners.
+
+        Returns:
+            A (3, N) array of interpolated values.
+
+        """
+        case = (r >= g).astype(np.intp)
+        case <<= 1
+        case |= g >= b
+        case <<= 1
+        case |= r >= b
+        high = np.maximum(r, g)
+        np.maximum(high, b, out=high)
+        low = np.minimum(r, g)
+        np.minimum(low, b, out=low)
+        middle = r + g
+        middle += b
+        middle -= high
+        middle -= low
+
+        # Weights are 1 - high, high - middle, middle - low and low
+        result = columns.take(base + self._last_offset, axis=1)
+        result *= low
+        corner = columns.take(base, axis=1)
+        corner *= high - 1.0
+        result -= corner
+        corner = columns.take(base + self._first_offsets.take(case), axis=1)
+        high -= middle
+        corner *= high
+        result += corner
+        corner = columns.take(base + self._second_offsets.take(case), axis=1)
+        middle -= low
+        corner *= middle
+        result += corner
+        return result
+
+    def _trilinear(self, columns, base, r, g, b):
+        """Interpolates between all 8 corners of each cell, along blue,
+        then green, then red.
+
+        Returns:
+            A (3, N) array of interpolated values.
+
+        """
+        green_step = self.size
+        red_step = self.size * self.size
+        edges = []
+        for offset in (0, green_step, red_step, red_step + green_step):
+            low = columns.take(base + offset, axis=1)
+            high = columns.take(base + (offset + 1), axis=1)
+            high -= low
+            high *= b
+            high += low
+            edges.append(high)
+        for low, high in ((edges[0], edges[1]), (edges[2], edges[3])):
+            high -= low
+            high *= g
+            high += low
+        result = edges[3]
+        result -= edges[1]
+        result *= r
+        result += edges[1]
+        return result
+
+
+def get_lut(color_space='CIE-LAB', size=33, white_point=DEFAULT_WHITE_POINT,
+            cache_dir=None):
+    """Returns a shared `ColorLUT`, loading or building it once.
+
+    Args:
+        color_space: One of `SPACES`. Defaults to 'CIE-LAB'.
+        size: The number of grid nodes along each axis.
+            Defaults to 33.
+        white_point: The white reference used for CIE-LAB.
+            Defaults to D65 with the CIE 1931 observer.
+        cache_dir: An optional directory to load the table from, or
+            to save it to after building it.
+
+    """
+    white_point = tuple(float(val) for val in white_point)
+    key = (color_space, size, white_point)
+    lut = _luts.get(key)
+    if lut is not None:
+        return lut
+
+    path = join(cache_dir, _file_name(*key)) if cache_dir else None
+    if path is not None and os.path.exists(path):
+        try:
+            lut = ColorLUT.load(path)
+        except (IOError, OSError, KeyError, ValueError):
+            lut = None
+    if lut is None:
+        lut = ColorLUT(color_space, size, white_point)
+        if path is not None:
+            try:
+                lut.save(path)
+            except (IOError, OSError):
+                pass
+    _luts[key] = lut
+    return lut
+
+
+def _file_name(color_space, size, white_point):
+    digest = hashlib.md5(repr(white_point).encode()).hexdigest()[:12]
+    return 'lut-{}-{}-{}.npz'.format(color_space.lower(), size, digest)
@@ -0,0 +1,303 @@
+"""Implements finding the nearest named color in CIE-LAB.
+
+A `NameIndex` stores the conventional CIE-LAB values of a list of named
+colors in a uniform grid, sorted by cell, so that the nearest name of a
+color only needs to be searched for in the cells around it.  Indexes
+can be saved to and loaded from an .npz file, so large name lists do
+not have to be rebuilt at startup.
+"""
+
+import csv
+import io
+import logging
+import math
+from os.path import exists
+import zipfile
+
+import grapefruit
+import numpy as np
+
+from .batch import html_to_rgb, rgb_to_cielab
+from .spaces import DEFAULT_WHITE_POINT
+
+# Average number of names per grid cell
+_NAMES_PER_CELL = 4
+# Limit on the number of grid cells, to bound memory for sparse lists
+_MAX_CELLS = 1 << 21
+# Queries are compared with names in chunks of this many queries when
+# the grid neighborhood does not contain a close enough name
+_CHUNK_SIZE = 4096
+
+# Shared indexes by path, with None for grapefruit's named colors
+_default_indexes = {}
+
+_log = logging.getLogger(__name__)
+
+
+class NameIndex(object):
+    """A spatial index of named colors in CIE-LAB.
+
+    Distances are CIE76 Delta-E values, measured with the white point
+    the index was built with.
+
+    """
+
+    def __init__(self, names, rgb, white_point=DEFAULT_WHITE_POINT,
+                 _grid=None):
+        """Builds a `NameIndex`.
+
+        Args:
+            names: A sequence of color names.
+            rgb: An (N, 3) array of RGB values in range 0-1,
+                one for each name.
+            white_point: The white reference for CIE-LAB.
+                Defaults to D65 with the CIE 1931 observer.
+
+        Raises:
+            ValueError: If there are no names, or the number of names
+                and colors differ.
+
+        """
+        names = np.asarray(names, dtype=np.str_)
+        rgb = np.asarray(rgb, dtype=np.float64)
+        if not len(names) or rgb.shape != (len(names), 3):
+            raise ValueError('Expected one RGB value for each name')
+        self.white_point = tuple(float(val) for val in white_point)
+
+        if _grid is None:
+            _grid = build_grid(rgb_to_cielab(rgb, self.white_point))
+        (self.origin, self.cell_size, self.dims,
+         self.order, self.starts, self.lab) = _grid
+        # Names and colors are stored in grid order
+        self.names = names[self.order]
+        self.rgb = rgb[self.order]
+        self._dims = [int(dim) for dim in self.dims]
+        self._origin = [float(val) for val in self.origin]
+        self._cell_size = float(self.cell_size)
+        self._offsets = self._neighbor_offsets()
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_named_colors(cls, named_colors,
+                          white_point=DEFAULT_WHITE_POINT):
+        """Builds a `NameIndex` from a dict of {name: hex} pairs."""
+        names = list(named_colors)
+        rgb = html_to_rgb([named_colors[name] for name in names])
+        return cls(names, rgb, white_point)
+
+    @classmethod
+    def from_csv(cls, path, white_point=DEFAULT_WHITE_POINT):
+        """Builds a `NameIndex` from a CSV file of name,hex rows.
+
+        Rows that do not have a name and a valid hex color, such as a
+        header or blank lines, are skipped.
+
+        """
+        named_colors = {}
+        with io.open(path, newline='', encoding='utf-8') as name_file:
+            for row in csv.reader(name_file):
+                if len(row) == 2 and is_hex(row[1]):
+                    named_colors[row[0].strip()] = row[1]
+        return cls.from_named_colors(named_colors, white_point)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a `NameIndex` saved with `save`."""
+        with np.load(path, allow_pickle=False) as data:
+            order = data['order']
+            names = np.empty_like(data['names'])
+            rgb = np.empty_like(data['rgb'])
+            # Undo the grid order so __init__ can apply it again
+            names[order] = data['names']
+            rgb[order] = data['rgb']
+            grid = (data['origin'], data['cell_size'], data['dims'],
+                    order, data['starts'], data['lab'])
+            return cls(names, rgb, data['white_point'], _grid=grid)
+
+    def save(self, path):
+        """Saves the index to an .npz file, including the grid."""
+        np.savez(path, names=self.names, rgb=self.rgb,
+                 white_point=np.array(self.white_point),
+                 origin=self.origin, cell_size=self.cell_size,
+                 dims=self.dims, order=self.order, starts=self.starts,
+                 lab=self.lab)
+
+    def nearest(self, rgb):
+        """Returns the nearest name to a single color.
+
+        Args:
+            rgb: A sequence of RGB values in range 0-1.
+
+        Returns:
+            A tuple of the name and its Delta-E to the color.
+
+        """
+        # Plain Python math is much faster than numpy for one color
+        l, a, b = grapefruit.xyz_to_lab(
+            *grapefruit.rgb_to_xyz(*tuple(rgb)[:3]), wref=self.white_point)
+        lab = np.array((l, a * 100.0, b * 100.0))
+        cell = [int(math.floor((val - origin) / self._cell_size)) + 1
+                for val, origin in zip(lab, self._origin)]
+
+        best_dist = np.inf
+        best_pos = -1
+        if all(0 < coord < dim - 1 for coord, dim in zip(cell, self._dims)):
+            positions = [pos for first, last in self._neighbor_ranges(cell)
+                         for pos in range(first, last)]
+            if positions:
+                dists = ((self.lab[positions] - lab) ** 2).sum(axis=1)
+                index = dists.argmin()
+                best_dist = dists[index]
+                best_pos = positions[index]
+
+        if best_dist > self._cell_size ** 2:
+            dists = ((self.lab - lab) ** 2).sum(axis=1)
+            best_pos = dists.argmin()
+            best_dist = dists[best_pos]
+        return str(self.names[best_pos]), math.sqrt(best_dist)
+
+    def query(self, rgb):
+        """Finds the nearest names for an array of colors.
+
+        Args:
+            rgb: An (N, 3) array of RGB values in range 0-1.
+
+        Returns:
+            A tuple of an (N,) array of names and an (N,) array of
+            their Delta-E values to the colors.
+
+        """
+        positions, dists = self.query_positions(rgb)
+        return self.names[positions], dists
+
+    def query_positions(self, rgb):
+        """Like `query`, but returns positions in `names` and `rgb`."""
+        lab = rgb_to_cielab(rgb, self.white_point)
+        count = len(lab)
+        cells = np.floor((lab - self.origin) / self.cell_size).astype(
+            np.int64) + 1
+        inside = np.all((cells > 0) & (cells < self.dims - 1), axis=1)
+        cell_ids = flat_ids(np.where(inside[:, np.newaxis], cells, 1),
+                             self.dims)
+
+        best_dist = np.full(count, np.inf)
+        best_pos = np.zeros(count, dtype=np.int64)
+        for offset in self._offsets:
+            # Each offset covers three cells along the last axis
+            first = self.starts[cell_ids + offset - 1]
+            counts = self.starts[cell_ids + offset + 2] - first
+            counts[~inside] = 0
+            for slot in range(int(counts.max()) if count else 0):
+                rows = np.flatnonzero(counts > slot)
+                pos = first[rows] + slot
+                dists = ((self.lab[pos] - lab[rows]) ** 2).sum(axis=1)
+                closer = dists < best_dist[rows]
+                best_dist[rows[closer]] = dists[closer]
+                best_pos[rows[closer]] = pos[closer]
+
+        # The grid neighborhood only guarantees the nearest name within
+        # one cell size, so search everything for the remaining colors.
+        rows = np.flatnonzero(best_dist > self.cell_size ** 2)
+        for start in range(0, len(rows), _CHUNK_SIZE):
+            chunk = rows[start:start + _CHUNK_SIZE]
+            dists = ((lab[chunk, np.newaxis, :] -
+                      self.lab[np.newaxis, :, :]) ** 2).sum(axis=2)
+            best_pos[chunk] = dists.argmin(axis=1)
+            best_dist[chunk] = dists[np.arange(len(chunk)),
+                                     best_pos[chunk]]
+        return best_pos, np.sqrt(best_dist)
+
+    def _neighbor_offsets(self):
+        """Returns flat id offsets of the 3x3 columns around a cell."""
+        stride_i = self._dims[1] * self._dims[2]
+        stride_j = self._dims[2]
+        return [di * stride_i + dj * stride_j
+                for di in (-1, 0, 1) for dj in (-1, 0, 1)]
+
+    def _neighbor_ranges(self, cell):
+        """Returns (first, last) positions of the names around a cell."""
+        cell_id = (cell[0] * self._dims[1] + cell[1]) * self._dims[2] + cell[2]
+        starts = self.starts
+        return [(int(starts[cell_id + offset - 1]),
+                 int(starts[cell_id + offset + 2]))
+                for offset in self._offsets]
+
+
+def is_hex(value):
+    """Returns whether a string is a 3 or 6 digit hex color."""
+    value = value.strip().lstrip('#')
+    if len(value) not in (3, 6):
+        return False
+    try:
+        int(value, 16)
+    except ValueError:
+        return False
+    return True
+
+
+def flat_ids(cells, dims):
+    """Returns the flat ids of (N, 3) grid cells in a grid of dims."""
+    return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+
+def build_grid(lab):
+    """Sorts LAB values into a uniform grid.
+
+    Returns:
+        A tuple of the grid origin, cell size, dimensions, the order
+        that sorts the values by cell, the start position of each cell
+        in sorted order, and the sorted LAB values.
+
+    """
+    origin = lab.min(axis=0)
+    extent = np.maximum(lab.max(axis=0) - origin, 1.0)
+    min_cell_size = (extent.prod() / _MAX_CELLS) ** (1 / 3.0)
+    cell_size = (extent.prod() * _NAMES_PER_CELL / len(lab)) ** (1 / 3.0)
+    # Colors only fill part of the bounding box, so scale the cells by
+    # the occupancy measured at the first estimate.
+    cells = np.floor((lab - origin) / cell_size).astype(np.int64)
+    occupied = len(np.unique(flat_ids(cells, cells.max(axis=0) + 1)))
+    cell_size *= (_NAMES_PER_CELL * occupied / len(lab)) ** (1 / 3.0)
+    cell_size = max(cell_size, min_cell_size)
+    # Pad with an empty cell on each side so that neighbors of any
+    # occupied cell are inside the grid.
+    dims = np.ceil(extent / cell_size).astype(np.int64) + 3
+    cells = np.floor((lab - origin) / cell_size).astype(np.int64) + 1
+    cell_ids = flat_ids(cells, dims)
+    order = np.argsort(cell_ids, kind='stable')
+    starts = np.searchsorted(cell_ids[order], np.arange(dims.prod() + 1))
+    return origin, np.float64(cell_size), dims, order, starts, lab[order]
+
+
+def default_index(path=None):
+    """Returns a shared `NameIndex`, loading or building it once per path.
+
+    Args:
+        path: An optional path of an index saved with `NameIndex.save`.
+            If the file exists it is loaded, otherwise the index is
+            built from grapefruit's named colors.  It is also built if
+            the file cannot be loaded.  Both are logged.
+
+    """
+    index = _default_indexes.get(path)
+    if index is not None:
+        return index
+    if path:
+        if not exists(path):
+            _log.info("Name index %s not found, using grapefruit's names",
+                      path)
+        else:
+            try:
+                index = NameIndex.load(path)
+            except (IOError, OSError, ValueError, KeyError,
+                    zipfile.BadZipFile) as error:
+                _log.warning('Name index %s not loaded, using '
+                             "grapefruit's names: %s", path, error)
+        if index is None:
+            index = default_index()
+    else:
+        index = NameIndex.from_named_colors(grapefruit.NAMED_COLOR)
+    _default_indexes[path] = index
+    return index
@@ -0,0 +1,227 @@
+"""Implements a compact binary file format for palette colors.
+
+A packed palette file is a 16 byte header followed by the colors as one
+array of float32, float64 or uint16 values, with three or four values
+per color.  Opening a file with `open_packed` memory-maps it, so it
+takes the same time for any number of colors, and the colors are read
+from the map only when they are used.
+
+In palettes with four values per color, colors without alpha have an
+alpha of NaN in float files and of 1 in uint16 files.
+"""
+
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'CPAL'
+VERSION = 1
+DTYPES = ('float32', 'float64', 'uint16')
+
+# Magic, version, dtype index, values per color and color count
+_HEADER = struct.Struct('<4sHBBQ')
+
+# Colors are converted and written in chunks of this many
+_CHUNK_SIZE = 65536
+
+_UINT16_MAX = 65535.0
+
+
+class PackedColors(object):
+    """A read-only sequence of the colors of a packed palette.
+
+    Items are lists of RGB or RGBA values in range 0-1, like the colors
+    of a `store.PaletteStore`, and are converted when they are read.
+
+    Attributes:
+        values: An (N, 3) or (N, 4) array of the packed values, which is
+            a view of the file for memory-mapped palettes.
+
+    """
+
+    def __init__(self, values, _mapped=None):
+        """Wraps an array of packed values.
+
+        Args:
+            values: An (N, 3) or (N, 4) array of float32, float64 or
+                uint16 values.
+
+        """
+        self.values = values
+        self._mapped = _mapped
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return _colors(self.values[index])
+        return _colors(self.values[index:index + 1 or None])[0]
+
+    def __iter__(self):
+        for start in range(0, len(self.values), _CHUNK_SIZE):
+            for color in _colors(self.values[start:start + _CHUNK_SIZE]):
+                yield color
+
+    @property
+    def dtype(self):
+        return self.values.dtype.name
+
+    @property
+    def buffer(self):
+        """A read-only `memoryview` of the packed values, without a
+        copy."""
+        return memoryview(self.values)
+
+    def without(self, indices):
+        """Returns a `PackedColors` in memory without the colors at
+        indexes."""
+        return PackedColors(np.delete(self.values, list(indices), axis=0))
+
+    def as_float(self, dtype=np.float32):
+        """Returns the colors as an array of floats in range 0-1.
+
+        Float palettes of the same dtype are returned without a copy,
+        with NaN for missing alpha values.
+
+        """
+        if self.values.dtype.kind == 'f':
+            return self.values.astype(dtype, copy=False)
+        return self.values.astype(dtype) / dtype(_UINT16_MAX)
+
+    def close(self):
+        """Unmaps the file of a memory-mapped palette.
+
+        The palette can not be read afterwards.
+
+        """
+        if self._mapped is not None:
+            self.values = self.values[:0].copy()
+            self._mapped.close()
+            self._mapped = None
+
+
+def open_packed(path):
+    """Memory-maps a packed palette file.
+
+    Returns:
+        The `PackedColors` of the file.
+
+    Raises:
+        ValueError: If the file is not a packed palette.
+
+    """
+    with open(path, 'rb') as packed_file:
+        header = packed_file.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError('Not a packed palette: {}'.format(path))
+        magic, version, dtype, channels, count = _HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION or dtype >= len(DTYPES):
+            raise ValueError('Not a packed palette: {}'.format(path))
+        dtype = np.dtype(DTYPES[dtype])
+        if os.fstat(packed_file.fileno()).st_size < (
+                _HEADER.size + count * channels * dtype.itemsize):
+            raise ValueError('Truncated packed palette: {}'.format(path))
+        mapped = mmap.mmap(packed_file.fileno(), 0, access=mmap.ACCESS_READ)
+    values = np.frombuffer(mapped, dtype, count * channels,
+                           _HEADER.size).reshape(count, channels)
+    return PackedColors(values, mapped)
+
+
+def write_packed(path, colors, dtype='float32', channels=None):
+    """Writes colors to a packed palette file.
+
+    The file is written next to `path` and moved over it when it is
+    complete.
+
+    Args:
+        path: The path of the file.
+        colors: An iterable of colors as lists of RGB or RGBA values,
+            or an (N, 3) or (N, 4) array.
+        dtype: One of `DTYPES`. Defaults to 'float32'.
+        channels: 3 or 4, the number of values per color, or None to
+            take it from the colors.  For an iterable that is not an
+            array, all colors are then read first. Defaults to None.
+
+    Returns:
+        The number of colors written.
+
+    Raises:
+        ValueError: If the dtype or number of values is not supported.
+
+    """
+    if dtype not in DTYPES:
+        raise ValueError('Unknown dtype: {}'.format(dtype))
+    if isinstance(colors, np.ndarray):
+        if colors.ndim != 2 or colors.shape[1] not in (3, 4):
+            raise ValueError('Expected an array of shape (N, 3) or (N, 4), '
+                             'got {}'.format(colors.shape))
+        if channels is None:
+            channels = colors.shape[1]
+    elif channels is None:
+        colors = list(colors)
+        channels = 4 if any(len(color) == 4 for color in colors) else 3
+    if channels not in (3, 4):
+        raise ValueError('Expected 3 or 4 values per color, got {}'.format(
+            channels))
+
+    temporary_path = path + '.tmp'
+    count = 0
+    with open(temporary_path, 'wb') as packed_file:
+        # The count is written when it is known
+        packed_file.write(_HEADER.pack(MAGIC, VERSION, DTYPES.index(dtype),
+                                       channels, 0))
+        for chunk in _chunks(colors, channels):
+            packed_file.write(_pack(chunk, dtype).tobytes())
+            count += len(chunk)
+        packed_file.seek(0)
+        packed_file.write(_HEADER.pack(MAGIC, VERSION, DTYPES.index(dtype),
+                                       channels, count))
+    os.replace(temporary_path, path)
+    return count
+
+
+def _chunks(colors, channels):
+    """Yields arrays of float64 values with `channels` columns, with NaN
+    for missing alpha values."""
+    if isinstance(colors, np.ndarray):
+        for start in range(0, len(colors), _CHUNK_SIZE):
+            chunk = colors[start:start + _CHUNK_SIZE].astype(np.float64)
+            if chunk.shape[1] < channels:
+                chunk = np.column_stack((chunk, np.full(len(chunk), np.nan)))
+            yield chunk[:, :channels]
+        return
+    chunk = []
+    for color in colors:
+        if len(color) == 3 and channels == 4:
+            color = list(color) + [np.nan]
+        elif len(color) not in (3, 4):
+            raise ValueError('Expected RGB or RGBA values, got {}'.format(
+                color))
+        chunk.append(color[:channels])
+        if len(chunk) == _CHUNK_SIZE:
+            yield np.array(chunk, dtype=np.float64)
+            chunk = []
+    if chunk:
+        yield np.array(chunk, dtype=np.float64)
+
+
+def _pack(values, dtype):
+    if dtype != 'uint16':
+        return values.astype(dtype)
+    values = np.nan_to_num(values, nan=1.0)
+    return np.rint(np.clip(values, 0.0, 1.0) * _UINT16_MAX).astype(np.uint16)
+
+
+def _colors(values):
+    """Returns a list of colors from an array of packed values."""
+    if values.dtype.kind != 'f':
+        values = values / _UINT16_MAX
+    colors = values.tolist()
+    if values.shape[1] == 4:
+        # NaN alpha is the only value not equal to itself
+        colors = [color if color[3] == color[3] else color[:3]
+                  for color in colors]
+    return colors
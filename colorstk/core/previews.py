@@ -0,0 +1,208 @@
+"""Implements rendering palette previews and color grids to images.
+
+A palette preview is rendered as one RGBA image, so that a `Palette`
+view draws a single textured rectangle instead of canvas instructions
+for every preview color and border.  `PreviewCache` keeps the rendered
+images in a directory, keyed by a digest of the colors, so that they
+are rendered once, and again only when the preview colors change.
+
+`color_texels` packs all colors of a palette into one image with a
+texel per color, which the views of a color grid share as a texture.
+
+Images are arrays of uint8 RGBA values with the bottom row first, the
+row order of Kivy textures.
+"""
+
+from array import array
+import hashlib
+import math
+import os
+from os.path import join
+
+import numpy as np
+
+from .batch import rgb_array
+
+# The preview colors are drawn from the back, the last preview color,
+# to the front, as squares half the height of the image centered at
+# these fractions of its width and height
+PREVIEW_CENTERS = ((0.3, 0.3), (0.5, 0.5), (0.7, 0.7))
+BACKGROUND = (0.1, 0.1, 0.1)
+BORDER = (0.2, 0.2, 0.2)
+
+# Texels per row of color grid images, within the smallest maximum
+# texture size of mobile GPUs
+TEXEL_ROW = 4096
+
+# Cached preview files are removed, oldest first, beyond this many
+_CACHE_LIMIT = 2048
+
+
+def render_preview(colors, width, height):
+    """Renders a palette preview.
+
+    Args:
+        colors: The first colors of a palette as sequences of RGB or
+            RGBA values in range 0-1.  Missing colors are drawn as empty
+            squares.
+        width: The width of the image in pixels.
+        height: The height of the image in pixels.
+
+    Returns:
+        A (height, width, 4) array of uint8 RGBA values.
+
+    """
+    image = np.empty((height, width, 4), dtype=np.uint8)
+    image[...] = _rgba(BACKGROUND)
+    size = height // 2
+    border = max(1, int(round(height / 50.0)))
+    for index in reversed(range(len(PREVIEW_CENTERS))):
+        center_x, center_y = PREVIEW_CENTERS[index]
+        left = int(round(center_x * width - size / 2.0))
+        bottom = int(round(center_y * height - size / 2.0))
+        square = image[max(bottom, 0):bottom + size,
+                       max(left, 0):left + size]
+        square[...] = _rgba(BORDER)
+        color = colors[index] if index < len(colors) else BACKGROUND
+        square[border:-border, border:-border] = _rgba(color[:3])
+    return image
+
+
+def color_texels(colors):
+    """Packs colors into an image with one texel per color.
+
+    Colors are laid out in rows of up to `TEXEL_ROW` texels, so the
+    texel of the color at index i is at column i % `TEXEL_ROW` of row
+    i // `TEXEL_ROW`.  Alpha values are ignored.
+
+    Args:
+        colors: A sequence of RGB or RGBA colors in range 0-1, a
+            `packed.PackedColors`, or an (N, 3) or (N, 4) array.
+
+    Returns:
+        A (rows, columns, 4) array of uint8 RGBA values.
+
+    """
+    values = rgb_array(colors)
+    count = len(values)
+    columns = max(1, min(count, TEXEL_ROW))
+    rows = max(1, -(-count // columns))
+    texels = np.zeros((rows * columns, 4), dtype=np.uint8)
+    texels[:count, :3] = np.rint(
+        np.clip(values, 0.0, 1.0) * 255.0).astype(np.uint8)
+    texels[:, 3] = 255
+    return texels.reshape(rows, columns, 4)
+
+
+def texel_coords(index, columns, rows):
+    """Returns the texture coordinates of a quad within the texel of a
+    color in an image from `color_texels`.
+
+    The quad covers the middle of the texel, so that it samples only
+    that texel with linear filtering too.
+
+    """
+    column, row = index % columns, index // columns
+    left = (column + 0.25) / columns
+    right = (column + 0.75) / columns
+    bottom = (row + 0.25) / rows
+    top = (row + 0.75) / rows
+    return [left, bottom, right, bottom, right, top, left, top]
+
+
+class PreviewCache(object):
+    """Renders palette previews of one size, cached in a directory.
+
+    Images are read from the directory when the same colors were
+    rendered before, in this run or an earlier one.
+
+    """
+
+    def __init__(self, directory, width, height):
+        """Opens a `PreviewCache`, creating the directory if needed.
+
+        Args:
+            directory: The directory of the cached images, or None to
+                render every preview.
+            width: The width of the previews in pixels.
+            height: The height of the previews in pixels.
+
+        """
+        self.directory = directory
+        self.width = width
+        self.height = height
+        if directory is not None:
+            try:
+                os.makedirs(directory, exist_ok=True)
+                self._prune()
+            except OSError:
+                self.directory = None
+
+    def key(self, colors):
+        """Returns the digest of the preview of colors."""
+        values = array('d', [self.width, self.height])
+        for color in colors[:len(PREVIEW_CENTERS)]:
+            values.extend(color[:3])
+            values.append(color[3] if len(color) > 3 else math.nan)
+        return hashlib.sha1(values.tobytes()).hexdigest()
+
+    def get(self, colors, key=None):
+        """Returns the preview of colors as bytes of RGBA values.
+
+        Args:
+            colors: The preview colors of a palette.
+            key: The `key` of the colors, if it is known.
+
+        """
+        if key is None:
+            key = self.key(colors)
+        pixels = self._read(key)
+        if pixels is None:
+            pixels = render_preview(colors, self.width,
+                                    self.height).tobytes()
+            self._write(key, pixels)
+        return pixels
+
+    def _read(self, key):
+        if self.directory is None:
+            return None
+        path = join(self.directory, key + '.rgba')
+        try:
+            with open(path, 'rb') as image:
+                pixels = image.read()
+            # Pruning removes the least recently used images
+            os.utime(path)
+        except (IOError, OSError):
+            return None
+        # Partly written files are rendered again
+        if len(pixels) != self.width * self.height * 4:
+            return None
+        return pixels
+
+    def _write(self, key, pixels):
+        if self.directory is None:
+            return
+        path = join(self.directory, key + '.rgba')
+        try:
+            with open(path + '.tmp', 'wb') as image:
+                image.write(pixels)
+            os.replace(path + '.tmp', path)
+        except (IOError, OSError):
+            # The cache only saves rendering again
+            pass
+
+    def _prune(self):
+        """Removes the oldest cached images beyond the limit."""
+        paths = [join(self.directory, name)
+                 for name in os.listdir(self.directory)]
+        if len(paths) <= _CACHE_LIMIT:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - _CACHE_LIMIT]:
+            os.remove(path)
+
+
+def _rgba(color):
+    """Returns uint8 RGBA values of RGB values in range 0-1."""
+    values = [int(round(min(max(val, 0.0), 1.0) * 255)) for val in color]
+    return values + [255]
@@ -0,0 +1,300 @@
+"""Implements timing the phases of starting the app and hot paths.
+
+A `StartupProfiler` records how long named phases take, such as parsing
+kv files or building a screen, and the times of marks such as the first
+frame, relative to when it was created.  Phases can be nested and are
+reported in the order they started, indented by depth.
+
+A `Tracer` records spans of hot paths, such as refreshing the lookup
+screen after a color change, and counters of events, such as property
+dispatches, as Chrome trace events that chrome://tracing or Perfetto
+can open.  It keeps the latest durations of each span for percentiles.
+The `tracer` of the app is off unless the `TRACE_ENV` environment
+variable is set, and costs an attribute check per traced call while it
+is off.
+"""
+
+from collections import Counter, deque, namedtuple
+from contextlib import contextmanager
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+# Environment variable that turns tracing on, unless empty or 0
+TRACE_ENV = 'COLORSTK_TRACE'
+
+# Durations kept of each span for percentiles
+_LATENCY_WINDOW = 256
+# Trace events kept, the oldest are dropped beyond this many
+_EVENT_LIMIT = 100000
+
+Phase = namedtuple('Phase', 'name start duration depth')
+Phase.__doc__ = """A timed phase of a `StartupProfiler`.
+
+Attributes:
+    name: The name of the phase.
+    start: The seconds from the start of the profiler to the phase.
+    duration: The seconds the phase took, or 0 for a mark.
+    depth: The number of phases the phase is nested in.
+"""
+
+
+class StartupProfiler(object):
+    """Records the time spent in phases of starting the app."""
+
+    def __init__(self, clock=time.perf_counter):
+        """Starts a `StartupProfiler`.
+
+        Args:
+            clock: A function returning the time in seconds.
+                Defaults to `time.perf_counter`.
+
+        """
+        self.clock = clock
+        self.start = clock()
+        self.phases = []
+        self._depth = 0
+
+    @contextmanager
+    def phase(self, name):
+        """Returns a context manager that times a phase."""
+        start = self.clock()
+        index = len(self.phases)
+        # Added when it starts to keep the phases in order
+        self.phases.append(None)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self.phases[index] = Phase(name, start - self.start,
+                                       self.clock() - start, self._depth)
+
+    def mark(self, name):
+        """Records the current time as a mark with a name."""
+        self.phases.append(Phase(name, self.clock() - self.start, 0.0,
+                                 self._depth))
+
+    def totals(self):
+        """Returns a dict of the total seconds of each phase name.
+
+        Marks are left out.
+
+        """
+        totals = {}
+        for phase in self.phases:
+            if phase is not None and phase.duration:
+                totals[phase.name] = totals.get(phase.name, 0.0) + (
+                    phase.duration)
+        return totals
+
+    def report(self):
+        """Returns a text report of the phases and marks."""
+        lines = []
+        for phase in self.phases:
+            if phase is None:
+                continue
+            indent = '  ' * phase.depth
+            if phase.duration:
+                lines.append('{:9.1f} ms  {}{}'.format(
+                    phase.duration * 1000, indent, phase.name))
+            else:
+                lines.append('{:>12}  {}{} at {:.1f} ms'.format(
+                    '-', indent, phase.name, phase.start * 1000))
+        return '\n'.join(lines)
+
+    def write(self, path):
+        """Writes the phases and their totals to a JSON file."""
+        data = {
+            'phases': [phase._asdict() for phase in self.phases
+                       if phase is not None],
+            'totals': self.totals()
+        }
+        with open(path + '.tmp', 'w') as report_file:
+            json.dump(data, report_file, indent=2)
+        os.replace(path + '.tmp', path)
+
+
+class Tracer(object):
+    """Records spans and counters as Chrome trace events.
+
+    Spans are recorded with the `span` context manager, the `traced`
+    decorator, or `begin` and `end` for intervals that start and end in
+    different calls, such as a touch and the next frame.  Nothing is
+    recorded while `enabled` is false.  Spans of any thread can be
+    recorded.
+
+    """
+
+    def __init__(self, clock=time.perf_counter, window=_LATENCY_WINDOW,
+                 event_limit=_EVENT_LIMIT):
+        """Creates a disabled `Tracer`.
+
+        Args:
+            clock: A function returning the time in seconds.
+                Defaults to `time.perf_counter`.
+            window: The number of durations kept of each span.
+            event_limit: The number of trace events kept.
+
+        """
+        self.clock = clock
+        self.enabled = False
+        self.start = clock()
+        self.events = deque(maxlen=event_limit)
+        self.counters = Counter()
+        self.window = window
+        self._latencies = {}
+        # Start times of intervals begun, by name
+        self._begun = {}
+
+    def span(self, name):
+        """Returns a context manager that records a span."""
+        if not self.enabled:
+            return _NO_SPAN
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    def traced(self, name=None):
+        """Returns a decorator that records a span of each call.
+
+        Args:
+            name: The name of the spans, or None for the qualified name
+                of the decorated function.  Defaults to None.
+
+        """
+        def decorator(function):
+            span_name = name or function.__qualname__
+
+            @functools.wraps(function)
+            def traced_function(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = self.clock()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(span_name, start)
+            return traced_function
+        return decorator
+
+    def begin(self, name):
+        """Starts an interval, unless one of the name was begun."""
+        if self.enabled and name not in self._begun:
+            self._begun[name] = self.clock()
+
+    def end(self, name):
+        """Records an interval as a span, if one of the name was
+        begun."""
+        start = self._begun.pop(name, None)
+        if start is not None and self.enabled:
+            self.record(name, start)
+
+    def record(self, name, start, end=None):
+        """Records a span from clock times.
+
+        Args:
+            name: The name of the span.
+            start: The clock time the span started.
+            end: The clock time the span ended, or None for now.
+                Defaults to None.
+
+        """
+        if end is None:
+            end = self.clock()
+        latencies = self._latencies.get(name)
+        if latencies is None:
+            latencies = self._latencies.setdefault(
+                name, deque(maxlen=self.window))
+        latencies.append(end - start)
+        self.events.append({
+            'name': name, 'ph': 'X', 'ts': (start - self.start) * 1e6,
+            'dur': (end - start) * 1e6, 'pid': os.getpid(),
+            'tid': threading.get_ident()})
+
+    def count(self, name, value=1):
+        """Adds to a counter."""
+        if not self.enabled:
+            return
+        self.counters[name] += value
+        self.events.append({
+            'name': name, 'ph': 'C',
+            'ts': (self.clock() - self.start) * 1e6, 'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': {'count': self.counters[name]}})
+
+    def percentiles(self):
+        """Returns the p50 and p99 seconds of the latest spans.
+
+        Returns:
+            A list of (name, p50, p99, count) tuples, slowest p99
+            first, where count is the number of durations kept.
+
+        """
+        results = []
+        for name, latencies in list(self._latencies.items()):
+            durations = sorted(latencies)
+            if durations:
+                results.append((name, _percentile(durations, 0.5),
+                                _percentile(durations, 0.99),
+                                len(durations)))
+        results.sort(key=lambda result: result[2], reverse=True)
+        return results
+
+    def report(self):
+        """Returns a text report of span percentiles and counters."""
+        lines = ['{:>9} {:>9}  span'.format('p50 ms', 'p99 ms')]
+        for name, p50, p99, _ in self.percentiles():
+            lines.append('{:9.2f} {:9.2f}  {}'.format(
+                p50 * 1000, p99 * 1000, name))
+        for name, value in sorted(self.counters.items()):
+            lines.append('{:>19}  {}'.format(value, name))
+        return '\n'.join(lines)
+
+    def clear(self):
+        """Discards everything recorded."""
+        self.events.clear()
+        self.counters.clear()
+        self._latencies.clear()
+        self._begun.clear()
+
+    def write(self, path):
+        """Writes the trace events to a Chrome trace JSON file."""
+        data = {'traceEvents': list(self.events),
+                'displayTimeUnit': 'ms'}
+        with open(path + '.tmp', 'w') as trace_file:
+            json.dump(data, trace_file)
+        os.replace(path + '.tmp', path)
+
+
+class _NoSpan(object):
+    """A context manager that does nothing, returned by `Tracer.span`
+    while tracing is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def _percentile(durations, fraction):
+    """Returns the nearest-rank percentile of sorted durations."""
+    index = int(math.ceil(fraction * len(durations))) - 1
+    return durations[max(index, 0)]
+
+
+tracer = Tracer()
+tracer.enabled = os.environ.get(TRACE_ENV, '0') not in ('', '0')
@@ -0,0 +1,29 @@
+"""Implements color schemes and blending."""
+
+SCHEMES = ('monochrome', 'triadic', 'tetradic', 'analogous')
+
+
+def make_schemes(color, mode='ryb'):
+    """Makes color schemes for a color.
+
+    Args:
+        color: The `grapefruit.Color` to base the schemes on.
+        mode: The color wheel to use, 'rgb' or 'ryb'. Defaults to 'ryb'.
+
+    Returns:
+        A dict mapping each name in `SCHEMES` to a tuple of colors.
+
+    """
+    return {
+        'monochrome': color.make_monochrome_scheme(),
+        'triadic': color.make_triadic_scheme(mode=mode),
+        'tetradic': color.make_tetradic_scheme(mode=mode),
+        'analogous': color.make_analogous_scheme(mode=mode)
+    }
+
+
+def blend_colors(color1, color2):
+    """Returns the blend of two colors, or None if either is invisible."""
+    if color1.alpha and color2.alpha:
+        return color1.blend(color2)
+    return None
@@ -0,0 +1,285 @@
+"""Implements finding similar colors across palettes.
+
+A `ColorIndex` keeps the CIE-LAB values of the colors of many palettes
+in a uniform grid, like `names.NameIndex`, so that nearest and radius
+queries only search the cells around a color.  Colors can be added and
+removed without rebuilding the grid: added colors are kept in a short
+pending list that is searched in full, removed colors are marked dead,
+and the grid is rebuilt by the next query once enough of either have
+piled up, so that adding many colors at once only rebuilds it once.
+"""
+
+from collections import namedtuple
+
+import grapefruit
+import numpy as np
+
+from .batch import rgb_array, rgb_to_cielab
+from .names import build_grid, flat_ids
+from .spaces import DEFAULT_WHITE_POINT
+
+# Maximum number of added colors outside of the grid
+_PENDING_LIMIT = 8192
+
+Match = namedtuple('Match', 'palette color delta_e')
+Match.__doc__ = """A color found in a `ColorIndex`.
+
+Attributes:
+    palette: The name of the palette with the color.
+    color: A list of the RGB values of the color.
+    delta_e: The CIE76 Delta-E of the color to the query.
+"""
+
+
+class ColorIndex(object):
+    """A spatial index of the colors of palettes in CIE-LAB.
+
+    Distances are CIE76 Delta-E values, measured with the white point
+    the index was built with.  Alpha values are ignored.
+
+    """
+
+    def __init__(self, white_point=DEFAULT_WHITE_POINT):
+        """Builds an empty `ColorIndex`.
+
+        Args:
+            white_point: The white reference for CIE-LAB.
+                Defaults to D65 with the CIE 1931 observer.
+
+        """
+        self.white_point = tuple(float(val) for val in white_point)
+        self._palettes = []
+        self._palette_ids = {}
+        # Colors in the order they were added.  Rows are allocated
+        # ahead, and only the first `_count` are used.
+        self._count = 0
+        self._rgb = np.empty((0, 3))
+        self._lab = np.empty((0, 3))
+        self._owners = np.empty(0, dtype=np.int32)
+        self._alive = np.empty(0, dtype=bool)
+        self._dead = 0
+        # Colors before `_indexed` are in the grid
+        self._indexed = 0
+        self._grid = None
+
+    def __len__(self):
+        return self._count - self._dead
+
+    @classmethod
+    def from_store(cls, store, white_point=DEFAULT_WHITE_POINT):
+        """Builds a `ColorIndex` of all palettes of a `PaletteStore`."""
+        index = cls(white_point)
+        for name in store.names():
+            index.add(name, store.packed_colors(name))
+        return index
+
+    def add(self, palette, colors):
+        """Adds colors of a palette.
+
+        Args:
+            palette: The name of the palette.
+            colors: A sequence of RGB or RGBA colors in range 0-1, or an
+                (N, 3) or (N, 4) array.
+
+        """
+        self._append(palette, rgb_array(colors))
+
+    def remove(self, palette, colors):
+        """Removes the first occurrence of each color from a palette.
+
+        Colors that are not in the index for the palette are skipped.
+
+        """
+        palette_id = self._palette_ids.get(palette)
+        rgb = rgb_array(colors)
+        if palette_id is None or not len(rgb):
+            return
+        self.update()
+        # Equal colors are in the same grid cell, but the CIE-LAB values
+        # of a batch can differ from the stored ones in the last bits
+        for color, lab in zip(rgb, rgb_to_cielab(rgb, self.white_point)):
+            ids, _ = self._search(lab, 1e-6)
+            found = ids[(self._owners.take(ids) == palette_id) &
+                        (self._rgb.take(ids, axis=0) == color).all(axis=1)]
+            if len(found):
+                self._alive[found.min()] = False
+                self._dead += 1
+
+    def remove_palette(self, palette):
+        """Removes all colors of a palette."""
+        palette_id = self._palette_ids.get(palette)
+        if palette_id is None:
+            return
+        removed = (self._owners[:self._count] == palette_id) & (
+            self._alive[:self._count])
+        self._alive[:self._count][removed] = False
+        self._dead += int(removed.sum())
+
+    def set_colors(self, palette, colors):
+        """Replaces all colors of a palette."""
+        self.remove_palette(palette)
+        self.add(palette, colors)
+
+    def within(self, rgb, delta_e):
+        """Finds the colors within a Delta-E of a color.
+
+        Args:
+            rgb: A sequence of RGB values in range 0-1.
+            delta_e: The maximum CIE76 Delta-E.
+
+        Returns:
+            A list of `Match` tuples, nearest first.
+
+        """
+        self.update()
+        ids, dists = self._search(self._query_lab(rgb), delta_e)
+        return self._matches(ids, dists)
+
+    def nearest(self, rgb, count=1):
+        """Finds the nearest colors to a color.
+
+        Args:
+            rgb: A sequence of RGB values in range 0-1.
+            count: The number of colors to find. Defaults to 1.
+
+        Returns:
+            A list of up to `count` `Match` tuples, nearest first.
+
+        """
+        self.update()
+        lab = self._query_lab(rgb)
+        if self._grid is None:
+            radius = np.inf
+        else:
+            radius = float(self._grid[1])
+        while True:
+            ids, dists = self._search(lab, radius)
+            # Beyond the radius, closer colors may not have been found
+            if len(ids) >= count or radius == np.inf:
+                break
+            radius *= 2
+            if radius > self._max_distance(lab):
+                radius = np.inf
+        return self._matches(ids[:count], dists[:count])
+
+    def palettes_near(self, rgb, delta_e):
+        """Finds the palettes that have a color within a Delta-E.
+
+        Returns:
+            A list of `Match` tuples of the nearest color of each
+            palette, nearest first.
+
+        """
+        self.update()
+        ids, dists = self._search(self._query_lab(rgb), delta_e)
+        # Colors are sorted by distance, so the first of each palette
+        # is its nearest
+        first = np.unique(self._owners.take(ids), return_index=True)[1]
+        first.sort()
+        return self._matches(ids.take(first), dists.take(first))
+
+    def _query_lab(self, rgb):
+        # Plain Python math is much faster than numpy for one color
+        l, a, b = grapefruit.xyz_to_lab(
+            *grapefruit.rgb_to_xyz(*tuple(rgb)[:3]), wref=self.white_point)
+        return np.array((l, a * 100.0, b * 100.0))
+
+    def _search(self, lab, radius):
+        """Returns the ids and distances of the live colors within a
+        radius of a CIE-LAB value, sorted by distance."""
+        if self._grid is None or radius == np.inf:
+            ids = np.arange(self._count)
+        else:
+            ids = np.concatenate((self._grid_ids(lab, radius),
+                                  np.arange(self._indexed, self._count)))
+        ids = ids[self._alive.take(ids)]
+        dists = np.sqrt(((self._lab.take(ids, axis=0) - lab) ** 2).sum(
+            axis=1))
+        inside = dists <= radius
+        ids = ids[inside]
+        dists = dists[inside]
+        order = np.argsort(dists, kind='stable')
+        return ids.take(order), dists.take(order)
+
+    def _grid_ids(self, lab, radius):
+        """Returns the ids in the grid cells that a sphere touches."""
+        origin, cell_size, dims, order, starts = self._grid
+        low = np.floor((lab - radius - origin) / cell_size).astype(
+            np.int64) + 1
+        high = np.floor((lab + radius - origin) / cell_size).astype(
+            np.int64) + 1
+        low = np.clip(low, 0, dims - 1)
+        high = np.clip(high, 0, dims - 1)
+        if (low > high).any():
+            return np.empty(0, dtype=np.int64)
+        # The cells of each column along the last axis are contiguous
+        columns = np.stack(np.meshgrid(
+            np.arange(low[0], high[0] + 1), np.arange(low[1], high[1] + 1),
+            [low[2]], indexing='ij'), axis=-1).reshape(-1, 3)
+        first_ids = flat_ids(columns, dims)
+        firsts = starts.take(first_ids)
+        lasts = starts.take(first_ids + (high[2] - low[2] + 1))
+        return order[np.concatenate([np.arange(first, last) for first, last
+                                     in zip(firsts.tolist(),
+                                            lasts.tolist())])]
+
+    def _max_distance(self, lab):
+        """Returns a distance beyond all colors of the grid."""
+        origin, cell_size, dims = self._grid[:3]
+        far = origin + (dims - 1) * cell_size
+        return float(np.sqrt((np.maximum(np.abs(lab - origin),
+                                         np.abs(lab - far)) ** 2).sum()))
+
+    def _matches(self, ids, dists):
+        owners = self._owners.take(ids).tolist()
+        return [Match(self._palettes[owner], rgb, dist)
+                for owner, rgb, dist in zip(
+                    owners, self._rgb.take(ids, axis=0).tolist(),
+                    dists.tolist())]
+
+    def _append(self, palette, rgb):
+        palette_id = self._palette_ids.get(palette)
+        if palette_id is None:
+            palette_id = self._palette_ids[palette] = len(self._palettes)
+            self._palettes.append(palette)
+        count = self._count + len(rgb)
+        if count > len(self._rgb):
+            self._grow(count)
+        self._rgb[self._count:count] = rgb
+        self._lab[self._count:count] = rgb_to_cielab(rgb, self.white_point)
+        self._owners[self._count:count] = palette_id
+        self._alive[self._count:count] = True
+        self._count = count
+
+    def _grow(self, count):
+        capacity = max(count, 2 * len(self._rgb), 1024)
+        for name in ('_rgb', '_lab', '_owners', '_alive'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._count] = old[:self._count]
+            setattr(self, name, new)
+
+    def update(self):
+        """Rebuilds the grid if too many colors were added or removed
+        since it was built.
+
+        Queries call this first, so it only needs to be called to
+        rebuild the grid ahead of them.
+
+        """
+        if (self._count - self._indexed > _PENDING_LIMIT or
+                self._dead > max(_PENDING_LIMIT, len(self) // 4)):
+            self._rebuild()
+
+    def _rebuild(self):
+        """Drops dead colors and puts all colors in the grid."""
+        alive = np.flatnonzero(self._alive[:self._count])
+        for name in ('_rgb', '_lab', '_owners', '_alive'):
+            setattr(self, name, getattr(self, name).take(alive, axis=0))
+        self._count = self._indexed = len(alive)
+        self._dead = 0
+        if not self._count:
+            self._grid = None
+            return
+        origin, cell_size, dims, order, starts, _ = build_grid(self._lab)
+        self._grid = (origin, float(cell_size), dims, order, starts)
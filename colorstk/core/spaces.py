@@ -0,0 +1,111 @@
+"""Implements color space conversions for single colors."""
+
+import grapefruit
+
+COLOR_SPACES = ('Hex', 'sRGB', 'HSL', 'HSV', 'YIQ', 'YUV',
+                'CIE-XYZ', 'CIE-LAB', 'CMY', 'CMYK')
+
+WHITE_POINTS = ('A', 'B', 'C', 'D50', 'D55', 'D65', 'D75', 'E',
+                'F1', 'F2', 'F3', 'F4', 'F5', 'F6', 'F7', 'F8',
+                'F9', 'F10', 'F11', 'F12')
+
+OBSERVERS = ('CIE 1931', 'CIE 1964')
+
+DEFAULT_WHITE_POINT = grapefruit.WHITE_REFERENCE['std_D65']
+
+
+def get_value(color, color_space, value_range='0-255'):
+    """Returns the color value for the corresponding color space.
+
+    Args:
+        color: The `grapefruit.Color` to get the value of.
+        color_space: The name of the color space to get the value of.
+        value_range: The range for sRGB values, '0-1' or '0-255'.
+            Defaults to '0-255'.
+
+    Returns:
+        A list containing the value for the color.
+
+    """
+    if color_space == 'Hex':
+        return [color.html]
+    elif color_space == 'sRGB':
+        if value_range == '0-255':
+            return list(color.ints)
+        elif value_range == '0-1':
+            return list(color.rgb)
+    elif color_space == 'HSL':
+        return list(color.hsl)
+    elif color_space == 'HSV':
+        return list(color.hsv)
+    elif color_space == 'YIQ':
+        return list(color.yiq)
+    elif color_space == 'YUV':
+        return list(color.yuv)
+    elif color_space == 'CIE-XYZ':
+        return list(color.xyz)
+    elif color_space == 'CIE-LAB':
+        return list(color.lab)
+    elif color_space == 'CMY':
+        return list(color.cmy)
+    elif color_space == 'CMYK':
+        return list(color.cmyk)
+
+
+def make_color(color_space, value, white_point=DEFAULT_WHITE_POINT,
+               value_range='0-255'):
+    """Returns a new color from a value in a color space.
+
+    Args:
+        color_space: The name of the color space of the value.
+        value: A list containing the value of the color.
+        white_point: The white reference of the new color.
+            Defaults to D65 with the CIE 1931 observer.
+        value_range: The range for sRGB values, '0-1' or '0-255'.
+            Defaults to '0-255'.
+
+    Returns:
+        A `grapefruit.Color` for the value.
+
+    """
+    if color_space == 'Hex':
+        return grapefruit.Color.from_html(*value, wref=white_point)
+    elif color_space == 'sRGB':
+        if value_range == '0-255':
+            # Convert RGB values from range 0-255 to range 0-1
+            value = [val / 255 for val in value]
+        return grapefruit.Color.from_rgb(*value, wref=white_point)
+    elif color_space == 'HSL':
+        return grapefruit.Color.from_hsl(*value, wref=white_point)
+    elif color_space == 'HSV':
+        return grapefruit.Color.from_hsv(*value, wref=white_point)
+    elif color_space == 'YIQ':
+        return grapefruit.Color.from_yiq(*value, wref=white_point)
+    elif color_space == 'YUV':
+        return grapefruit.Color.from_yuv(*value, wref=white_point)
+    elif color_space == 'CIE-XYZ':
+        return grapefruit.Color.from_xyz(*value, wref=white_point)
+    elif color_space == 'CIE-LAB':
+        return grapefruit.Color.from_lab(*value, wref=white_point)
+    elif color_space == 'CMY':
+        return grapefruit.Color.from_cmy(*value, wref=white_point)
+    elif color_space == 'CMYK':
+        return grapefruit.Color.from_cmyk(*value, wref=white_point)
+
+
+def get_white_point(name, observer):
+    """Returns the white point based on observer angle and point name.
+
+    Args:
+        name: The name of the white point.
+        observer: The observer angle of the white point.
+
+    Returns:
+        A tuple of the XYZ values of the white point.
+
+    """
+    if observer == 'CIE 1931':
+        name = 'std_' + name
+    elif observer == 'CIE 1964':
+        name = 'sup_' + name
+    return grapefruit.WHITE_REFERENCE[name]
@@ -0,0 +1,1138 @@
+"""Implements persistent storage of color palettes.
+
+A palette store maps palette names to ordered lists of colors, each a
+list of RGB or RGBA values in range 0-1.  `PaletteStore` defines the
+interface of stores, and `SQLitePaletteStore` implements it with one
+row per color, so adding or removing a color only writes that color.
+Several changes can be grouped into one transaction with `transaction`.
+
+Stores also keep an index of `PaletteSummary` tuples, with the color
+count and the first colors of each palette, so that an overview of all
+palettes can be shown without reading their colors.
+
+The colors of large palettes can be read with `packed_colors` from a
+memory-mapped `packed` file, which the SQLite store keeps as a cache
+next to the database, without converting every color to a list.
+
+`BackgroundPaletteStore` wraps a store so that changes are saved on a
+writer thread, keeping slow storage off the UI thread.  It keeps only
+the index and the colors of recently read palettes in memory.
+
+`open_store` opens the store in a user data directory and migrates the
+palettes of an older `palettes.json` file the first time.
+"""
+
+from array import array
+from collections import Counter, namedtuple, OrderedDict
+from contextlib import contextmanager
+import json
+import logging
+import math
+import operator
+import os
+from os.path import dirname, exists, join
+import sqlite3
+import queue
+import threading
+
+from . import packed
+from .profiling import tracer
+
+DATABASE_NAME = 'palettes.db'
+LEGACY_NAME = 'palettes.json'
+
+# Number of colors kept in the index for previews
+PREVIEW_SIZE = 3
+
+# Number of palettes whose colors `BackgroundPaletteStore` keeps
+CACHE_SIZE = 4
+
+# Directory of packed palette files, next to the database
+PACKED_DIRECTORY = 'packed'
+
+# Palettes with fewer colors are not packed by `packed_colors`
+PACKED_MINIMUM = 10000
+
+_log = logging.getLogger(__name__)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS palettes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS colors (
+    palette_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    red REAL NOT NULL,
+    green REAL NOT NULL,
+    blue REAL NOT NULL,
+    alpha REAL,
+    PRIMARY KEY (palette_id, position)
+) WITHOUT ROWID;
+'''
+
+# Scripts that upgrade the database from the version at their index,
+# tracked with `PRAGMA user_version`
+_UPGRADES = [
+    '''
+    ALTER TABLE palettes ADD COLUMN color_count INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE palettes ADD COLUMN preview BLOB NOT NULL DEFAULT x'';
+    ''',
+    # Counts the changes of a palette, to name its packed files
+    '''
+    ALTER TABLE palettes ADD COLUMN revision INTEGER NOT NULL DEFAULT 0;
+    '''
+]
+
+PaletteSummary = namedtuple('PaletteSummary', 'name color_count preview')
+PaletteSummary.__doc__ = """The index entry of a palette.
+
+Attributes:
+    name: The name of the palette.
+    color_count: The number of colors in the palette.
+    preview: A list of the first `PREVIEW_SIZE` colors of the palette.
+"""
+
+
+class PaletteStore(object):
+    """The interface of palette stores.
+
+    Palettes are kept in the order they were created.  Changes made
+    outside of `transaction` are saved immediately.
+
+    """
+
+    def __contains__(self, name):
+        raise NotImplementedError
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __len__(self):
+        return len(self.names())
+
+    def names(self):
+        """Returns a list of the palette names."""
+        raise NotImplementedError
+
+    def get_colors(self, name):
+        """Returns a list of the colors of a palette.
+
+        Raises:
+            KeyError: If there is no palette with the name.
+
+        """
+        raise NotImplementedError
+
+    def iter_colors(self, name, start=0, stop=None):
+        """Returns an iterator over the colors of a palette.
+
+        Stores may read the colors as they are iterated, so the palette
+        must not be changed until the iteration is done.
+
+        Args:
+            name: The name of the palette.
+            start: The index of the first color. Defaults to 0.
+            stop: The index after the last color, or None for the end
+                of the palette. Defaults to None.
+
+        Raises:
+            KeyError: If there is no palette with the name.
+
+        """
+        return iter(self.get_colors(name)[start:stop])
+
+    def packed_colors(self, name):
+        """Returns a read-only sequence of the colors of a palette.
+
+        Stores may return a `packed.PackedColors` that reads the colors
+        from a memory-mapped file, so that large palettes open in
+        constant time.  The sequence is not updated by later changes.
+
+        Raises:
+            KeyError: If there is no palette with the name.
+
+        """
+        return self.get_colors(name)
+
+    def summary(self, name):
+        """Returns the `PaletteSummary` of a palette.
+
+        Raises:
+            KeyError: If there is no palette with the name.
+
+        """
+        colors = self.get_colors(name)
+        return PaletteSummary(name, len(colors), colors[:PREVIEW_SIZE])
+
+    def summaries(self):
+        """Returns a list of the `PaletteSummary` of every palette."""
+        return [self.summary(name) for name in self.names()]
+
+    def read_later(self, function, callback):
+        """Reads from the store without waiting for the result.
+
+        Stores that save changes on another thread call the function
+        there, after the changes queued before, and then call the
+        callback on that thread.  Other stores call both at once.
+
+        Args:
+            function: A callable taking the store to read from and
+                returning what it read.
+            callback: A callable taking the result of the function and
+                the exception it raised, or None for each.
+
+        """
+        try:
+            result = function(self)
+        except Exception as error:
+            callback(None, error)
+        else:
+            callback(result, None)
+
+    def create(self, name, colors=()):
+        """Creates a palette, optionally with colors.
+
+        Raises:
+            ValueError: If a palette with the name already exists.
+
+        """
+        raise NotImplementedError
+
+    def set_colors(self, name, colors):
+        """Replaces all colors of a palette."""
+        raise NotImplementedError
+
+    def append_colors(self, name, colors):
+        """Adds colors to the end of a palette."""
+        raise NotImplementedError
+
+    def remove_colors(self, name, colors):
+        """Removes the first occurrence of each color from a palette.
+
+        Raises:
+            ValueError: If a color is not in the palette.
+
+        """
+        raise NotImplementedError
+
+    def remove_indices(self, name, indices):
+        """Removes the colors at indexes of a palette.
+
+        Unlike `remove_colors`, this removes the chosen color of equal
+        colors.  Repeated indexes are removed once.
+
+        Raises:
+            IndexError: If an index is not in the palette.
+
+        """
+        raise NotImplementedError
+
+    def delete(self, name):
+        """Deletes a palette and its colors."""
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self):
+        """Returns a context manager that saves all changes made in it
+        together, or none of them if an exception is raised."""
+        yield self
+
+    def flush(self, timeout=None):
+        """Waits until all changes made so far are saved.
+
+        Returns:
+            False if the timeout expired first, otherwise True.
+
+        """
+        return True
+
+    def close(self):
+        """Saves all changes and closes the store."""
+
+
+class SQLitePaletteStore(PaletteStore):
+    """A `PaletteStore` backed by an SQLite database."""
+
+    def __init__(self, path):
+        """Opens or creates the database at `path`.
+
+        Args:
+            path: The path of the database file, or ':memory:'.
+
+        """
+        self.path = path
+        # Transactions are managed with savepoints in `transaction`
+        self._connection = sqlite3.connect(path, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(_SCHEMA)
+        self._depth = 0
+        self._upgrade()
+
+    def __contains__(self, name):
+        return self._connection.execute(
+            'SELECT 1 FROM palettes WHERE name = ?', (name,)
+        ).fetchone() is not None
+
+    def __len__(self):
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM palettes').fetchone()[0]
+
+    def names(self):
+        return [name for name, in self._connection.execute(
+            'SELECT name FROM palettes ORDER BY id')]
+
+    def get_colors(self, name):
+        rows = self._connection.execute(
+            'SELECT red, green, blue, alpha FROM colors '
+            'WHERE palette_id = ? ORDER BY position',
+            (self._palette_id(name),))
+        return [_color(row) for row in rows]
+
+    def iter_colors(self, name, start=0, stop=None):
+        # A negative limit is no limit
+        rows = self._connection.execute(
+            'SELECT red, green, blue, alpha FROM colors '
+            'WHERE palette_id = ? ORDER BY position LIMIT ? OFFSET ?',
+            (self._palette_id(name), -1 if stop is None else
+             max(stop - start, 0), start))
+        return (_color(row) for row in rows)
+
+    def packed_colors(self, name):
+        palette_id = self._palette_id(name)
+        count, revision = self._connection.execute(
+            'SELECT color_count, revision FROM palettes WHERE id = ?',
+            (palette_id,)).fetchone()
+        # Changes in a transaction may be rolled back, and their
+        # revision used again for other colors
+        if (count < PACKED_MINIMUM or self._depth or
+                self.path == ':memory:'):
+            return self.get_colors(name)
+        path = self._packed_path(palette_id, revision)
+        if not exists(path):
+            self._remove_packed(palette_id)
+            if not exists(dirname(path)):
+                os.makedirs(dirname(path))
+            # Exact values, so that colors read from the file are found
+            # by `remove_colors`
+            has_alpha = self._connection.execute(
+                'SELECT 1 FROM colors WHERE palette_id = ? '
+                'AND alpha IS NOT NULL LIMIT 1', (palette_id,)
+            ).fetchone() is not None
+            packed.write_packed(path, self.iter_colors(name), 'float64',
+                                4 if has_alpha else 3)
+        return packed.open_packed(path)
+
+    def summary(self, name):
+        row = self._connection.execute(
+            'SELECT name, color_count, preview FROM palettes '
+            'WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return _summary(row)
+
+    def summaries(self):
+        return [_summary(row) for row in self._connection.execute(
+            'SELECT name, color_count, preview FROM palettes ORDER BY id')]
+
+    def create(self, name, colors=()):
+        with self.transaction():
+            if name in self:
+                raise ValueError('Palette already exists: {}'.format(name))
+            palette_id = self._connection.execute(
+                'INSERT INTO palettes (name) VALUES (?)', (name,)).lastrowid
+            self._index(palette_id, self._insert(palette_id, 0, colors))
+
+    def set_colors(self, name, colors):
+        with self.transaction():
+            palette_id = self._palette_id(name)
+            self._connection.execute(
+                'DELETE FROM colors WHERE palette_id = ?', (palette_id,))
+            self._index(palette_id, self._insert(palette_id, 0, colors))
+
+    def append_colors(self, name, colors):
+        with self.transaction():
+            palette_id = self._palette_id(name)
+            # The primary key index makes this independent of the size
+            position = self._connection.execute(
+                'SELECT COALESCE(MAX(position) + 1, 0) FROM colors '
+                'WHERE palette_id = ?', (palette_id,)).fetchone()[0]
+            count = self._color_count(palette_id)
+            added = self._insert(palette_id, position, colors)
+            # The preview only changes while the palette is short
+            if count < PREVIEW_SIZE:
+                self._index(palette_id, count + added)
+            else:
+                self._connection.execute(
+                    'UPDATE palettes SET color_count = ?, '
+                    'revision = revision + 1 WHERE id = ?',
+                    (count + added, palette_id))
+
+    def remove_colors(self, name, colors):
+        with self.transaction():
+            palette_id = self._palette_id(name)
+            # Colors are matched in one pass over the palette, instead
+            # of a query for each color
+            missing = Counter(_rows(colors))
+            removed = sum(missing.values())
+            positions = []
+            for row in self._connection.execute(
+                    'SELECT position, red, green, blue, alpha FROM colors '
+                    'WHERE palette_id = ? ORDER BY position',
+                    (palette_id,)):
+                if missing[row[1:]]:
+                    missing[row[1:]] -= 1
+                    positions.append((palette_id, row[0]))
+                    if len(positions) == removed:
+                        break
+            if len(positions) < removed:
+                raise ValueError('Color not in palette {}: {}'.format(
+                    name, _color(next((+missing).elements()))))
+            self._connection.executemany(
+                'DELETE FROM colors WHERE palette_id = ? AND position = ?',
+                positions)
+            self._index(palette_id,
+                        self._color_count(palette_id) - removed)
+
+    def remove_indices(self, name, indices):
+        with self.transaction():
+            palette_id = self._palette_id(name)
+            count = self._color_count(palette_id)
+            indices = _check_indices(indices, count, name)
+            if not indices:
+                return
+            # Positions have gaps after removals, so the colors are
+            # found by their order, up to the last removed one
+            wanted = iter(indices)
+            index = next(wanted)
+            positions = []
+            for order, (position,) in enumerate(self._connection.execute(
+                    'SELECT position FROM colors WHERE palette_id = ? '
+                    'ORDER BY position LIMIT ?',
+                    (palette_id, indices[-1] + 1))):
+                if order == index:
+                    positions.append((palette_id, position))
+                    index = next(wanted, None)
+            self._connection.executemany(
+                'DELETE FROM colors WHERE palette_id = ? AND position = ?',
+                positions)
+            self._index(palette_id, count - len(positions))
+
+    def delete(self, name):
+        with self.transaction():
+            palette_id = self._palette_id(name)
+            self._connection.execute(
+                'DELETE FROM colors WHERE palette_id = ?', (palette_id,))
+            self._connection.execute(
+                'DELETE FROM palettes WHERE id = ?', (palette_id,))
+            # Ids of deleted palettes may be used again
+            self._remove_packed(palette_id)
+
+    @contextmanager
+    def transaction(self):
+        # Nested transactions are savepoints within the outermost one
+        savepoint = 'level{}'.format(self._depth)
+        self._connection.execute('SAVEPOINT ' + savepoint)
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._connection.execute('ROLLBACK TO ' + savepoint)
+            self._connection.execute('RELEASE ' + savepoint)
+            raise
+        else:
+            self._connection.execute('RELEASE ' + savepoint)
+        finally:
+            self._depth -= 1
+
+    def close(self):
+        self._connection.close()
+
+    def _upgrade(self):
+        """Brings an existing database up to date with `_UPGRADES`."""
+        version = self._connection.execute(
+            'PRAGMA user_version').fetchone()[0]
+        if version >= len(_UPGRADES):
+            return
+        with self.transaction():
+            for script in _UPGRADES[version:]:
+                for statement in script.split(';'):
+                    if statement.strip():
+                        self._connection.execute(statement)
+            if version < 1:
+                # Build the index of palettes saved before it existed
+                palette_ids = [palette_id for palette_id,
+                               in self._connection.execute(
+                                   'SELECT id FROM palettes')]
+                for palette_id in palette_ids:
+                    self._index(palette_id)
+            self._connection.execute(
+                'PRAGMA user_version = {:d}'.format(len(_UPGRADES)))
+
+    def _palette_id(self, name):
+        row = self._connection.execute(
+            'SELECT id FROM palettes WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return row[0]
+
+    def _packed_path(self, palette_id, revision):
+        return join(dirname(self.path), PACKED_DIRECTORY,
+                    '{}-{}.cpal'.format(palette_id, revision))
+
+    def _remove_packed(self, palette_id):
+        """Removes the packed files of all revisions of a palette."""
+        directory = join(dirname(self.path), PACKED_DIRECTORY)
+        if self.path == ':memory:' or not exists(directory):
+            return
+        prefix = '{}-'.format(palette_id)
+        for file_name in os.listdir(directory):
+            if file_name.startswith(prefix):
+                try:
+                    os.remove(join(directory, file_name))
+                except OSError:
+                    # Still mapped on some platforms
+                    pass
+
+    def _color_count(self, palette_id):
+        return self._connection.execute(
+            'SELECT color_count FROM palettes WHERE id = ?',
+            (palette_id,)).fetchone()[0]
+
+    def _insert(self, palette_id, position, colors):
+        """Inserts colors from `position` and returns how many."""
+        return self._connection.executemany(
+            'INSERT INTO colors VALUES (?, ?, ?, ?, ?, ?)',
+            ((palette_id, position + index) + row
+             for index, row in enumerate(_rows(colors)))).rowcount
+
+    def _index(self, palette_id, count=None):
+        """Updates the index entry of a palette.
+
+        Args:
+            palette_id: The id of the palette.
+            count: The number of colors of the palette, or None to
+                count them.
+
+        """
+        if count is None:
+            count = self._connection.execute(
+                'SELECT COUNT(*) FROM colors WHERE palette_id = ?',
+                (palette_id,)).fetchone()[0]
+        preview = self._connection.execute(
+            'SELECT red, green, blue, alpha FROM colors '
+            'WHERE palette_id = ? ORDER BY position LIMIT ?',
+            (palette_id, PREVIEW_SIZE)).fetchall()
+        self._connection.execute(
+            'UPDATE palettes SET color_count = ?, preview = ?, '
+            'revision = revision + 1 WHERE id = ?',
+            (count, _pack(preview), palette_id))
+
+
+class BackgroundPaletteStore(PaletteStore):
+    """A `PaletteStore` that saves changes on a background thread.
+
+    Changes are applied at once to an index of the palettes in memory,
+    which answers most reads, and queued for a writer thread that owns
+    the wrapped store.  The writer saves everything queued so far in one
+    transaction, coalescing repeated changes to the same palette.  Use
+    `flush` to wait until changes are saved.
+
+    The colors of a palette are read from the wrapped store when first
+    needed, after the changes queued before, and only those of the last
+    `CACHE_SIZE` palettes read or changed are kept.
+
+    If the writer fails to save changes, they are lost, and the index
+    is read again from the wrapped store before it is next used outside
+    of a transaction.
+
+    """
+
+    def __init__(self, open_backend):
+        """Starts the writer thread and loads the palette index.
+
+        Args:
+            open_backend: A callable returning the `PaletteStore` to
+                save changes to.  It is called on the writer thread,
+                since SQLite connections belong to the thread that
+                opened them.
+
+        """
+        self._queue = queue.Queue()
+        self._condition = threading.Condition()
+        # Loading the index counts as the first pending change
+        self._pending = 1
+        self._error = None
+        # Colors of recently used palettes, least recent first
+        self._colors = OrderedDict()
+        # Changes of the current transaction, and for each nested
+        # level the number of changes made before it and the summaries
+        # it replaced, to restore if that level fails
+        self._depth = 0
+        self._operations = []
+        self._savepoints = []
+        # Whether the writer failed since the index was last read
+        self._stale = False
+        # Whether the writer thread stopped, after `close` or an error
+        self._stopped = False
+        loaded = []
+        self._thread = threading.Thread(
+            target=self._run, args=(open_backend, loaded),
+            name='palette-writer')
+        self._thread.daemon = True
+        self._thread.start()
+        self.flush()
+        self._palettes = loaded[0]
+
+    def __contains__(self, name):
+        self._sync()
+        return name in self._palettes
+
+    def __len__(self):
+        self._sync()
+        return len(self._palettes)
+
+    def names(self):
+        self._sync()
+        return list(self._palettes)
+
+    def get_colors(self, name):
+        self._check(name)
+        colors = self._colors.get(name)
+        if colors is None:
+            colors = self._read(name)
+        self._cache(name, colors)
+        return [list(color) for color in colors]
+
+    def packed_colors(self, name):
+        self._check(name)
+        if any(operation[1] == name for operation in self._operations):
+            # Changes of the current transaction are not saved yet
+            return self.get_colors(name)
+        return self._request('packed_colors', name)
+
+    def summary(self, name):
+        self._check(name)
+        return self._palettes[name]
+
+    def summaries(self):
+        self._sync()
+        return list(self._palettes.values())
+
+    def read_later(self, function, callback):
+        self._queue.put(_Read(function, callback))
+
+    def create(self, name, colors=()):
+        self._sync()
+        if name in self._palettes:
+            raise ValueError('Palette already exists: {}'.format(name))
+        colors = [_color(row) for row in _rows(colors)]
+        self._replace(name, colors)
+        self._queue_change(('create', name, colors))
+
+    def set_colors(self, name, colors):
+        self._check(name)
+        colors = [_color(row) for row in _rows(colors)]
+        self._replace(name, colors)
+        self._queue_change(('set_colors', name, colors))
+
+    def append_colors(self, name, colors):
+        self._check(name)
+        colors = [_color(row) for row in _rows(colors)]
+        self._save(name)
+        summary = self._palettes[name]
+        self._palettes[name] = summary._replace(
+            color_count=summary.color_count + len(colors),
+            preview=(summary.preview + colors)[:PREVIEW_SIZE])
+        # The colors are only updated if they are kept anyway
+        if name in self._colors:
+            self._colors[name].extend(colors)
+        self._queue_change(('append_colors', name, colors))
+
+    def remove_colors(self, name, colors):
+        colors = [_color(row) for row in _rows(colors)]
+        self._replace(name, _remove(self.get_colors(name), colors, name))
+        self._queue_change(('remove_colors', name, colors))
+
+    def remove_indices(self, name, indices):
+        self._check(name)
+        summary = self._palettes[name]
+        indices = _check_indices(indices, summary.color_count, name)
+        if not indices:
+            return
+        colors = self._colors.get(name)
+        if colors is not None:
+            self._replace(name, _remove_indices(colors, indices))
+        else:
+            # Only the colors that move into the preview are read
+            count = PREVIEW_SIZE
+            for index in indices:
+                if index >= count:
+                    break
+                count += 1
+            preview = summary.preview
+            if count > PREVIEW_SIZE:
+                preview = _remove_indices(self._head(name, count),
+                                          indices)[:PREVIEW_SIZE]
+            self._save(name)
+            self._palettes[name] = PaletteSummary(
+                name, summary.color_count - len(indices), preview)
+        self._queue_change(('remove_indices', name, indices))
+
+    def delete(self, name):
+        self._check(name)
+        self._save(name)
+        del self._palettes[name]
+        self._colors.pop(name, None)
+        self._queue_change(('delete', name, None))
+
+    @contextmanager
+    def transaction(self):
+        self._depth += 1
+        self._savepoints.append((len(self._operations), {}))
+        try:
+            yield self
+        except BaseException:
+            self._rollback()
+            raise
+        else:
+            self._release()
+        finally:
+            self._depth -= 1
+        if self._depth == 0:
+            self._submit()
+
+    def flush(self, timeout=None):
+        """Waits until all changes made so far are saved.
+
+        Raises:
+            The first error the writer thread raised since the last
+            flush, if any.  Changes of a failed transaction are lost.
+            RuntimeError: If the writer thread stopped before saving
+                them.
+
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                    lambda: self._pending == 0 or self._stopped, timeout):
+                return False
+            error, self._error = self._error, None
+            pending = self._pending
+        if error is not None:
+            raise error
+        if pending:
+            raise RuntimeError('The palette writer thread stopped with '
+                               '{} changes unsaved'.format(pending))
+        return True
+
+    def close(self):
+        """Saves all changes and stops the writer thread."""
+        self._enqueue(None)
+        self._thread.join()
+        self.flush()
+
+    def _check(self, name):
+        self._sync()
+        if name not in self._palettes:
+            raise KeyError(name)
+
+    def _cache(self, name, colors):
+        """Keeps the colors of a palette as the most recently used."""
+        self._colors.pop(name, None)
+        self._colors[name] = colors
+        while len(self._colors) > CACHE_SIZE:
+            self._colors.popitem(last=False)
+
+    def _replace(self, name, colors):
+        """Replaces the summary and colors of a palette in memory."""
+        self._save(name)
+        self._palettes[name] = PaletteSummary(
+            name, len(colors), [list(color)
+                                for color in colors[:PREVIEW_SIZE]])
+        # Copied, since appends extend the colors in place
+        self._cache(name, list(colors))
+
+    def _read(self, name):
+        """Returns the colors of a palette from the writer thread.
+
+        Changes of the current transaction are not queued yet, so they
+        are applied to the colors read.
+
+        """
+        operations = [operation for operation in self._operations
+                      if operation[1] == name]
+        replaced = [index for index, operation in enumerate(operations)
+                    if operation[0] in ('create', 'set_colors')]
+        if replaced:
+            colors = list(operations[replaced[-1]][2])
+            operations = operations[replaced[-1] + 1:]
+        else:
+            colors = self._request('get_colors', name)
+        for method, _, changed in operations:
+            if method == 'append_colors':
+                colors.extend(changed)
+            elif method == 'remove_indices':
+                colors = _remove_indices(colors, changed)
+            else:
+                colors = _remove(colors, changed, name)
+        return colors
+
+    def _head(self, name, count):
+        """Returns the first colors of a palette."""
+        if any(operation[1] == name for operation in self._operations):
+            # Changes of the current transaction are not saved yet
+            return self.get_colors(name)[:count]
+        return self._call(lambda backend: list(
+            backend.iter_colors(name, 0, count)))
+
+    def _request(self, method, *args):
+        """Calls a method of the wrapped store on the writer thread,
+        after the changes queued before, and returns the result."""
+        return self._call(operator.methodcaller(method, *args))
+
+    def _call(self, function):
+        """Calls a function with the wrapped store on the writer
+        thread, after the changes queued before, and returns the
+        result."""
+        request = _Read(function)
+        self._queue.put(request)
+        with tracer.span('palette read'), self._condition:
+            self._condition.wait_for(
+                lambda: request.done or self._stopped)
+        if not request.done:
+            raise RuntimeError('The palette writer thread stopped')
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _save(self, name):
+        """Keeps the summary of a palette to restore if the transaction
+        fails."""
+        if self._savepoints:
+            replaced = self._savepoints[-1][1]
+            if name not in replaced:
+                replaced[name] = self._palettes.get(name)
+
+    def _queue_change(self, operation):
+        self._operations.append(operation)
+        if self._depth == 0:
+            self._submit()
+
+    def _submit(self):
+        operations = self._operations
+        self._operations = []
+        if operations:
+            self._enqueue(operations)
+
+    def _rollback(self):
+        """Undoes the changes of the innermost transaction level."""
+        count, replaced = self._savepoints.pop()
+        for name, summary in replaced.items():
+            # Colors are read again from the wrapped store when needed
+            self._colors.pop(name, None)
+            if summary is None:
+                self._palettes.pop(name, None)
+            else:
+                self._palettes[name] = summary
+        del self._operations[count:]
+
+    def _release(self):
+        """Hands the summaries replaced by the innermost transaction
+        level to the level around it."""
+        _, replaced = self._savepoints.pop()
+        if self._savepoints:
+            outer = self._savepoints[-1][1]
+            for name, summary in replaced.items():
+                outer.setdefault(name, summary)
+
+    def _sync(self):
+        """Reads the index again if the writer failed to save changes.
+
+        Changes of a transaction are applied to the index before they
+        are saved, so this waits until no transaction is open.
+
+        """
+        if not self._stale or self._depth:
+            return
+        with self._condition:
+            self._stale = False
+        summaries = self._request('summaries')
+        self._palettes = OrderedDict((summary.name, summary)
+                                     for summary in summaries)
+        self._colors.clear()
+
+    def _enqueue(self, item):
+        with self._condition:
+            self._pending += 1
+        self._queue.put(item)
+
+    def _run(self, open_backend, loaded):
+        """Saves queued changes and answers reads until `None` is
+        queued, or until opening the wrapped store fails."""
+        try:
+            try:
+                backend = open_backend()
+                loaded.append(OrderedDict(
+                    (summary.name, summary)
+                    for summary in backend.summaries()))
+            except Exception as error:
+                self._finish(1, error)
+                return
+            self._finish(1)
+            self._serve(backend)
+        finally:
+            with self._condition:
+                self._stopped = True
+                self._condition.notify_all()
+
+    def _serve(self, backend):
+        running = True
+        while running:
+            # Everything queued while the last batch was saved goes
+            # into the next transaction
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            running = None not in items
+            batch = []
+            for item in items:
+                if isinstance(item, _Read):
+                    # A read sees the changes queued before it
+                    self._write(backend, batch)
+                    batch = []
+                    self._answer(backend, item)
+                elif item is not None:
+                    batch.append(item)
+            self._write(backend, batch)
+            if not running:
+                self._finish(1)
+        backend.close()
+
+    def _answer(self, backend, request):
+        """Answers a read, calling its callback if it has one."""
+        try:
+            request.result = request.function(backend)
+        except Exception as error:
+            request.error = error
+        try:
+            if request.callback is not None:
+                request.callback(request.result, request.error)
+        except Exception:
+            _log.exception('Palette read callback failed')
+        finally:
+            with self._condition:
+                request.done = True
+                self._condition.notify_all()
+
+    def _write(self, backend, items):
+        """Saves lists of queued changes in one transaction."""
+        if not items:
+            return
+        operations = [operation for item in items for operation in item]
+        failure = None
+        try:
+            with tracer.span('palette write'), backend.transaction():
+                for method, name, colors in _coalesce(operations):
+                    if method == 'delete':
+                        backend.delete(name)
+                    else:
+                        getattr(backend, method)(name, colors)
+        except Exception as error:
+            failure = error
+            with self._condition:
+                self._stale = True
+        self._finish(len(items), failure)
+
+    def _finish(self, count, error=None):
+        with self._condition:
+            self._pending -= count
+            if error is not None and self._error is None:
+                self._error = error
+            self._condition.notify_all()
+
+
+class _Read(object):
+    """A request to read from the wrapped store on the writer thread."""
+
+    def __init__(self, function, callback=None):
+        self.function = function
+        self.callback = callback
+        self.result = None
+        self.error = None
+        self.done = False
+
+
+def _coalesce(operations):
+    """Merges queued changes to the same palette.
+
+    Consecutive appends are merged into one, and changes followed by
+    `set_colors` or `delete` of the same palette are dropped.  A palette
+    created and deleted in the same batch is never written.
+
+    """
+    result = []
+    for operation in operations:
+        method, name, colors = operation
+        if method in ('set_colors', 'delete'):
+            index = len(result)
+            while index > 0:
+                previous_method, previous_name, _ = result[index - 1]
+                if previous_name == name:
+                    if previous_method in ('create', 'delete'):
+                        break
+                    del result[index - 1]
+                index -= 1
+            if index and result[index - 1][:2] == ('create', name):
+                if method == 'delete':
+                    del result[index - 1]
+                else:
+                    result[index - 1] = ('create', name, colors)
+                continue
+        elif method == 'append_colors' and result and (
+                result[-1][0] in ('create', 'append_colors') and
+                result[-1][1] == name):
+            result[-1] = (result[-1][0], name, result[-1][2] + colors)
+            continue
+        result.append(operation)
+    return result
+
+
+def _rows(colors):
+    """Yields (red, green, blue, alpha) tuples, with None for no alpha."""
+    for color in colors:
+        if len(color) == 3:
+            yield tuple(float(val) for val in color) + (None,)
+        elif len(color) == 4:
+            yield tuple(float(val) for val in color)
+        else:
+            raise ValueError('Expected RGB or RGBA values, got {}'.format(
+                color))
+
+
+def _remove(colors, removed, name):
+    """Returns colors without the first occurrence of each removed color.
+
+    Unlike a `list.remove` for each color, this takes one pass over the
+    colors for any number of removed colors.
+
+    Raises:
+        ValueError: If a removed color is not in the colors.
+
+    """
+    missing = Counter(tuple(color) for color in removed)
+    remaining = []
+    for color in colors:
+        key = tuple(color)
+        if missing[key]:
+            missing[key] -= 1
+        else:
+            remaining.append(color)
+    for key in +missing:
+        raise ValueError('Color not in palette {}: {}'.format(
+            name, list(key)))
+    return remaining
+
+
+def _check_indices(indices, count, name):
+    """Returns sorted unique color indexes of a palette.
+
+    Raises:
+        IndexError: If an index is not in the palette.
+
+    """
+    indices = sorted(set(int(index) for index in indices))
+    if indices and (indices[0] < 0 or indices[-1] >= count):
+        raise IndexError('Color index out of range for palette {}: '
+                         '{}'.format(name, indices[0] if indices[0] < 0
+                                     else indices[-1]))
+    return indices
+
+
+def _remove_indices(colors, indices):
+    """Returns colors without those at sorted indexes."""
+    removed = set(indices)
+    return [color for index, color in enumerate(colors)
+            if index not in removed]
+
+
+def _color(row):
+    """Returns a list of RGB or RGBA values from a row."""
+    return list(row[:3]) if row[3] is None else list(row)
+
+
+def _pack(rows):
+    """Packs color rows into bytes of doubles, with NaN for no alpha.
+
+    Previews are read for every palette at once, and unpacking them is
+    much faster than parsing JSON.
+
+    """
+    return array('d', [math.nan if value is None else value
+                       for row in rows for value in row]).tobytes()
+
+
+def _summary(row):
+    """Returns a `PaletteSummary` from a (name, count, preview) row."""
+    values = array('d')
+    values.frombytes(row[2])
+    preview = []
+    for index in range(0, len(values), 4):
+        alpha = values[index + 3]
+        preview.append(values[index:index + 3].tolist() if alpha != alpha
+                       else values[index:index + 4].tolist())
+    return PaletteSummary(row[0], row[1], preview)
+
+
+def migrate_json(store, path):
+    """Copies the palettes of a `kivy.storage.jsonstore.JsonStore` file.
+
+    Palettes that already exist in the store are skipped, so migrating
+    the same file again has no effect.
+
+    Args:
+        store: The `PaletteStore` to copy palettes to.
+        path: The path of the JSON file.
+
+    Returns:
+        The number of palettes copied.
+
+    """
+    with open(path) as json_file:
+        palettes = json.load(json_file, object_pairs_hook=OrderedDict)
+    copied = 0
+    with store.transaction():
+        for name, palette in palettes.items():
+            if name not in store:
+                store.create(name, palette.get('colors', []))
+                copied += 1
+    return copied
+
+
+def open_store(directory, background=False):
+    """Opens the palette store of a user data directory.
+
+    If the directory has a `palettes.json` file from an older version,
+    its palettes are migrated and the file is renamed with a
+    '.migrated' suffix.
+
+    Args:
+        directory: The user data directory.
+        background: Whether to save changes on a writer thread with a
+            `BackgroundPaletteStore`. Defaults to False.
+
+    """
+    if background:
+        return BackgroundPaletteStore(lambda: open_store(directory))
+    store = SQLitePaletteStore(join(directory, DATABASE_NAME))
+    legacy_path = join(directory, LEGACY_NAME)
+    if exists(legacy_path):
+        migrate_json(store, legacy_path)
+        try:
+            os.rename(legacy_path, legacy_path + '.migrated')
+        except OSError:
+            pass
+    return store
@@ -0,0 +1,594 @@
+"""Implements importing and exporting palettes as swatch files.
+
+Supported formats are GIMP palettes ('gpl'), Adobe swatch exchange
+('ase') and Photoshop color swatches ('aco') files, CSS custom
+properties ('css') and the JSON layout of the old `palettes.json`
+('json').
+
+Files are parsed incrementally, so memory use does not grow with the
+size of the file, and imported colors are written to the palette store
+in transactions of `BATCH_SIZE` colors.  Colors are exported one palette
+at a time with `PaletteStore.iter_colors`.
+"""
+
+import io
+import json
+from os.path import basename, splitext
+import re
+import struct
+
+from .spaces import make_color
+
+FORMATS = ('gpl', 'ase', 'aco', 'css', 'json')
+
+# Number of colors written to the store in one transaction
+BATCH_SIZE = 10000
+
+# Number of bytes or characters read from a file at a time
+_CHUNK_SIZE = 65536
+
+_ASE_GROUP_START = 0xC001
+_ASE_GROUP_END = 0xC002
+_ASE_COLOR = 0x0001
+# Number of values of each ASE color model
+_ASE_MODELS = {b'RGB ': 3, b'LAB ': 3, b'CMYK': 4, b'Gray': 1}
+
+# Values and hex code of a color, as GIMP writes them
+_GPL_LINE = '{0:3d} {1:3d} {2:3d}\t#{0:02x}{1:02x}{2:02x}\n'
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_PROPERTY = re.compile(r'--[\w-]+\s*:\s*(.*?)\s*(?:!important)?$', re.S)
+_CSS_HEX = re.compile(r'#([0-9a-fA-F]{3,4}|[0-9a-fA-F]{6}|[0-9a-fA-F]{8})$')
+_CSS_RGB = re.compile(r'rgba?\((.*)\)$', re.S | re.I)
+_CSS_NUMBER = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?%?', re.I)
+
+_WHITESPACE = re.compile(r'\s*')
+
+
+def guess_format(path):
+    """Returns the swatch format of a file from its extension.
+
+    Raises:
+        ValueError: If the extension is not one of `FORMATS`.
+
+    """
+    extension = splitext(path)[1][1:].lower()
+    if extension not in FORMATS:
+        raise ValueError('Unknown swatch format: {}'.format(path))
+    return extension
+
+
+def read_swatches(swatch_file, swatch_format, name='Imported'):
+    """Reads the colors of a swatch file one at a time.
+
+    Args:
+        swatch_file: A binary file object to read from.
+        swatch_format: One of `FORMATS`.
+        name: The name of palettes that are not named in the file.
+            Defaults to 'Imported'.
+
+    Yields:
+        (palette name, color) tuples in file order, where a color is a
+        list of RGB or RGBA values in range 0-1.  The color is None for
+        the first tuple of each palette, so that palettes without colors
+        are read too.
+
+    Raises:
+        ValueError: If the format is unknown or the file is malformed.
+
+    """
+    readers = {'gpl': _read_gpl, 'ase': _read_ase, 'aco': _read_aco,
+               'css': _read_css, 'json': _read_json}
+    if swatch_format not in readers:
+        raise ValueError('Unknown swatch format: {}'.format(swatch_format))
+    if swatch_format in ('gpl', 'css', 'json'):
+        text_file = io.TextIOWrapper(swatch_file, encoding='utf-8-sig')
+        try:
+            for swatch in readers[swatch_format](text_file, name):
+                yield swatch
+        finally:
+            # Leave the binary file open for the caller
+            text_file.detach()
+    else:
+        for swatch in readers[swatch_format](swatch_file, name):
+            yield swatch
+
+
+def write_swatches(store, names, swatch_file, swatch_format):
+    """Writes palettes of a store to a swatch file.
+
+    Alpha values are only kept by the 'css' and 'json' formats.
+
+    Args:
+        store: The `PaletteStore` to read palettes from.
+        names: A list of the names of the palettes to write.
+        swatch_file: A binary file object to write to.
+        swatch_format: One of `FORMATS`.
+
+    Raises:
+        ValueError: If the format is unknown, or cannot hold the
+            palettes.  'gpl' and 'aco' files hold one palette, and
+            'aco' files at most 65535 colors.
+
+    """
+    writers = {'gpl': _write_gpl, 'ase': _write_ase, 'aco': _write_aco,
+               'css': _write_css, 'json': _write_json}
+    if swatch_format not in writers:
+        raise ValueError('Unknown swatch format: {}'.format(swatch_format))
+    if swatch_format in ('gpl', 'aco') and len(names) != 1:
+        raise ValueError('{} files hold one palette, got {}'.format(
+            swatch_format, len(names)))
+    if swatch_format in ('gpl', 'css', 'json'):
+        text_file = io.TextIOWrapper(swatch_file, encoding='utf-8',
+                                     newline='\n')
+        try:
+            writers[swatch_format](store, names, text_file)
+            text_file.flush()
+        finally:
+            text_file.detach()
+    else:
+        writers[swatch_format](store, names, swatch_file)
+
+
+def import_palettes(store, path, swatch_format=None, name=None):
+    """Imports the palettes of a swatch file into a store.
+
+    Palettes are given a numbered name if the name is taken.  If the
+    file is malformed, the palettes imported from it so far are deleted.
+
+    Args:
+        store: The `PaletteStore` to import palettes to.
+        path: The path of the swatch file.
+        swatch_format: One of `FORMATS`, or None to guess it from the
+            extension. Defaults to None.
+        name: The name of palettes that are not named in the file, or
+            None for the file name. Defaults to None.
+
+    Returns:
+        A list of the names of the imported palettes.
+
+    """
+    if swatch_format is None:
+        swatch_format = guess_format(path)
+    if name is None:
+        name = splitext(basename(path))[0]
+    created = []
+    taken = set()
+    # Changes to write in the next transaction, as
+    # (method, name, colors) tuples
+    batch = []
+    batch_size = 0
+    source = None
+    try:
+        with open(path, 'rb') as swatch_file:
+            for palette, color in read_swatches(swatch_file, swatch_format,
+                                                name):
+                if palette != source or color is None:
+                    source = palette
+                    created.append(_unique_name(store, palette, taken))
+                    taken.add(created[-1])
+                    batch.append(('create', created[-1], []))
+                if color is not None:
+                    batch[-1][2].append(color)
+                    batch_size += 1
+                    if batch_size >= BATCH_SIZE:
+                        _write_batch(store, batch)
+                        batch = [('append_colors', created[-1], [])]
+                        batch_size = 0
+        _write_batch(store, batch)
+    except Exception:
+        with store.transaction():
+            for palette in created:
+                if palette in store:
+                    store.delete(palette)
+        raise
+    return created
+
+
+def export_palettes(store, names, path, swatch_format=None):
+    """Exports palettes of a store to a swatch file.
+
+    Args:
+        store: The `PaletteStore` to export palettes from.
+        names: A list of the names of the palettes to export.
+        path: The path of the swatch file.
+        swatch_format: One of `FORMATS`, or None to guess it from the
+            extension. Defaults to None.
+
+    """
+    if swatch_format is None:
+        swatch_format = guess_format(path)
+    with open(path, 'wb') as swatch_file:
+        write_swatches(store, names, swatch_file, swatch_format)
+
+
+def _write_batch(store, batch):
+    with store.transaction():
+        for method, name, colors in batch:
+            if method == 'create':
+                store.create(name, colors)
+            elif colors:
+                store.append_colors(name, colors)
+
+
+def _unique_name(store, name, taken):
+    """Returns `name`, numbered if a palette already has it."""
+    unique_name = name
+    number = 1
+    while unique_name in store or unique_name in taken:
+        number += 1
+        unique_name = '{} {}'.format(name, number)
+    return unique_name
+
+
+def _read_exactly(binary_file, size):
+    data = binary_file.read(size)
+    if len(data) != size:
+        raise ValueError('Unexpected end of file')
+    return data
+
+
+def _byte(value):
+    """Returns an RGB value in range 0-1 as an integer in range 0-255."""
+    if value <= 0:
+        return 0
+    elif value >= 1:
+        return 255
+    return int(value * 255 + 0.5)
+
+
+def _clamp(color):
+    return [min(max(value, 0.0), 1.0) for value in color]
+
+
+def _hex(color):
+    return '#' + ''.join('{:02x}'.format(_byte(value)) for value in color)
+
+
+def _read_gpl(text_file, name):
+    if text_file.readline().strip() != 'GIMP Palette':
+        raise ValueError('Not a GIMP palette')
+    channels = 3
+    started = False
+    for number, line in enumerate(text_file, 2):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if not started:
+            # Header lines come before the colors
+            if line.startswith('Name:'):
+                name = line[5:].strip() or name
+                continue
+            elif line.startswith('Columns:'):
+                continue
+            elif line.startswith('Channels:'):
+                channels = 4 if line[9:].strip() == 'RGBA' else 3
+                continue
+            started = True
+            yield name, None
+        try:
+            color = [int(value) / 255.0
+                     for value in line.split(None, channels)[:channels]]
+        except ValueError:
+            color = []
+        if len(color) != channels:
+            raise ValueError('Invalid color on line {}: {}'.format(
+                number, line))
+        yield name, color
+    if not started:
+        yield name, None
+
+
+def _write_gpl(store, names, text_file):
+    text_file.write('GIMP Palette\nName: {}\nColumns: 0\n#\n'.format(
+        names[0]))
+    for color in store.iter_colors(names[0]):
+        text_file.write(_GPL_LINE.format(*[_byte(value)
+                                           for value in color[:3]]))
+
+
+def _read_ase(binary_file, name):
+    header = _read_exactly(binary_file, 12)
+    if header[:4] != b'ASEF':
+        raise ValueError('Not an Adobe swatch exchange file')
+    block_count, = struct.unpack('>I', header[8:])
+    group = None
+    for _ in range(block_count):
+        block_type, length = struct.unpack('>HI',
+                                           _read_exactly(binary_file, 6))
+        data = _read_exactly(binary_file, length)
+        if block_type == _ASE_GROUP_START:
+            group = _ase_name(data)[0] or name
+            yield group, None
+        elif block_type == _ASE_GROUP_END:
+            group = None
+        elif block_type == _ASE_COLOR:
+            if group is None:
+                # Colors outside of groups make up one palette
+                group = name
+                yield group, None
+            offset = _ase_name(data)[1]
+            model = data[offset:offset + 4]
+            if model not in _ASE_MODELS:
+                raise ValueError('Unknown ASE color model: {!r}'.format(
+                    model))
+            values = struct.unpack_from(
+                '>{}f'.format(_ASE_MODELS[model]), data, offset + 4)
+            yield group, _ase_color(model, values)
+
+
+def _ase_name(data):
+    """Returns the name of an ASE block and the offset after it."""
+    length, = struct.unpack_from('>H', data)
+    end = 2 + 2 * length
+    return data[2:end].decode('utf-16-be').rstrip('\0'), end
+
+
+def _ase_color(model, values):
+    if model == b'RGB ':
+        return _clamp(values)
+    elif model == b'Gray':
+        return _clamp(values * 3)
+    elif model == b'CMYK':
+        return _clamp(make_color('CMYK', values).rgb)
+    # Lightness is stored in range 0-1
+    return _lab(values[0] * 100, values[1], values[2])
+
+
+def _lab(lightness, a, b):
+    """Returns the RGB values of a swatch in CIE-LAB.
+
+    Swatch files use D50, but the values are converted relative to the
+    white point of sRGB, so that grays stay gray without a chromatic
+    adaptation transform.  grapefruit expects a and b divided by 100.
+
+    """
+    return _clamp(make_color('CIE-LAB', [lightness, a / 100.0,
+                                         b / 100.0]).rgb)
+
+
+def _write_ase(store, names, binary_file):
+    # Each palette is a group of colors between a start and end block
+    block_count = sum(store.summary(name).color_count + 2 for name in names)
+    binary_file.write(b'ASEF' + struct.pack('>HHI', 1, 0, block_count))
+    for name in names:
+        _write_ase_block(binary_file, _ASE_GROUP_START, _ase_string(name))
+        for color in store.iter_colors(name):
+            # Normal color type
+            _write_ase_block(binary_file, _ASE_COLOR,
+                             _ase_string(_hex(color[:3])) + b'RGB ' +
+                             struct.pack('>3fH', *(color[:3] + [2])))
+        _write_ase_block(binary_file, _ASE_GROUP_END, b'')
+
+
+def _ase_string(string):
+    return struct.pack('>H', len(string) + 1) + (
+        string + '\0').encode('utf-16-be')
+
+
+def _write_ase_block(binary_file, block_type, data):
+    binary_file.write(struct.pack('>HI', block_type, len(data)) + data)
+
+
+def _read_aco(binary_file, name):
+    version, count = struct.unpack('>HH', _read_exactly(binary_file, 4))
+    if version not in (1, 2):
+        raise ValueError('Not a Photoshop color swatches file')
+    yield name, None
+    # Version 1 data is followed by the same colors with names in
+    # version 2, which are not needed
+    for _ in range(count):
+        space, w, x, y, z = struct.unpack('>5H',
+                                          _read_exactly(binary_file, 10))
+        if version == 2:
+            length, = struct.unpack('>I', _read_exactly(binary_file, 4))
+            _read_exactly(binary_file, 2 * length)
+        yield name, _aco_color(space, w, x, y, z)
+
+
+def _aco_color(space, w, x, y, z):
+    if space == 0:
+        return [w / 65535.0, x / 65535.0, y / 65535.0]
+    elif space == 1:
+        return _clamp(make_color(
+            'HSV', [w / 65535.0 * 360, x / 65535.0, y / 65535.0]).rgb)
+    elif space == 2:
+        # 0 is full ink
+        return _clamp(make_color('CMYK', [
+            1 - value / 65535.0 for value in (w, x, y, z)]).rgb)
+    elif space == 7:
+        a, b = struct.unpack('>2h', struct.pack('>2H', x, y))
+        return _lab(w / 100.0, a / 100.0, b / 100.0)
+    elif space == 8:
+        return [1 - w / 10000.0] * 3
+    raise ValueError('Unknown ACO color space: {}'.format(space))
+
+
+def _write_aco(store, names, binary_file):
+    count = store.summary(names[0]).color_count
+    if count > 0xFFFF:
+        raise ValueError('aco files hold at most 65535 colors, got {}'.format(
+            count))
+    binary_file.write(struct.pack('>HH', 1, count))
+    for color in store.iter_colors(names[0]):
+        binary_file.write(struct.pack(
+            '>5H', 0, *[int(round(min(max(value, 0.0), 1.0) * 65535))
+                        for value in color[:3]] + [0]))
+
+
+def _read_css(text_file, name):
+    yield name, None
+    rest = ''
+    while True:
+        chunk = text_file.read(_CHUNK_SIZE)
+        text = _CSS_COMMENT.sub('', rest + chunk)
+        # An unclosed comment and the last declaration may continue in
+        # the next chunk
+        comment = text.find('/*')
+        if comment < 0:
+            comment = len(text)
+        declarations = re.split(r'[;{}]', text[:comment])
+        rest = declarations.pop() + text[comment:] if chunk else ''
+        for declaration in declarations:
+            color = _css_color(declaration)
+            if color is not None:
+                yield name, color
+        if not chunk:
+            break
+
+
+def _css_color(declaration):
+    """Returns the color of a custom property declaration, or None if it
+    is not a color."""
+    match = _CSS_PROPERTY.match(declaration.strip())
+    if match is None:
+        return None
+    value = match.group(1)
+    match = _CSS_HEX.match(value)
+    if match is not None:
+        digits = match.group(1)
+        if len(digits) < 6:
+            digits = ''.join(digit * 2 for digit in digits)
+        return [int(digits[index:index + 2], 16) / 255.0
+                for index in range(0, len(digits), 2)]
+    match = _CSS_RGB.match(value)
+    if match is None:
+        return None
+    values = _CSS_NUMBER.findall(match.group(1))
+    if len(values) not in (3, 4):
+        return None
+    color = [float(value[:-1]) / 100 if value.endswith('%')
+             else float(value) / 255 for value in values[:3]]
+    if len(values) == 4:
+        alpha = values[3]
+        color.append(float(alpha[:-1]) / 100 if alpha.endswith('%')
+                     else float(alpha))
+    return _clamp(color)
+
+
+def _write_css(store, names, text_file):
+    text_file.write(':root {\n')
+    for name in names:
+        prefix = re.sub(r'[^\w-]+', '-', name).strip('-') or 'palette'
+        for index, color in enumerate(store.iter_colors(name), 1):
+            if len(color) == 4:
+                value = 'rgba({}, {}, {}, {:.4g})'.format(
+                    *[_byte(val) for val in color[:3]] + [color[3]])
+            else:
+                value = _hex(color)
+            text_file.write('  --{}-{}: {};\n'.format(prefix, index, value))
+    text_file.write('}\n')
+
+
+class _JSONStream(object):
+    """Reads the tokens and values of a JSON document from a text file,
+    keeping only the part that is being parsed in memory."""
+
+    def __init__(self, text_file):
+        self._text_file = text_file
+        self._buffer = ''
+        self._position = 0
+        self._decoder = json.JSONDecoder()
+
+    def peek(self):
+        """Returns the next character that is not whitespace, or '' at
+        the end of the file."""
+        while True:
+            self._position = _WHITESPACE.match(self._buffer,
+                                               self._position).end()
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill():
+                return ''
+
+    def expect(self, characters):
+        """Skips and returns the next character if it is one of
+        `characters`.
+
+        Raises:
+            ValueError: If the next character is another one.
+
+        """
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError('Expected one of {!r}, got {!r}'.format(
+                characters, character))
+        self._position += 1
+        return character
+
+    def value(self):
+        """Reads the next JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer,
+                                                      self._position)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            # A number may continue in the next chunk
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._position = end
+            return value
+
+    def _fill(self):
+        chunk = self._text_file.read(_CHUNK_SIZE)
+        if not chunk:
+            return False
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        return True
+
+
+def _read_json(text_file, name):
+    stream = _JSONStream(text_file)
+    stream.expect('{')
+    if stream.peek() == '}':
+        return
+    while True:
+        palette = stream.value()
+        if not isinstance(palette, str):
+            raise ValueError('Expected a palette name, got {!r}'.format(
+                palette))
+        yield palette, None
+        stream.expect(':')
+        stream.expect('{')
+        while stream.peek() != '}':
+            key = stream.value()
+            stream.expect(':')
+            if key == 'colors':
+                stream.expect('[')
+                while stream.peek() != ']':
+                    yield palette, _json_color(stream.value())
+                    if stream.peek() != ']':
+                        stream.expect(',')
+                stream.expect(']')
+            else:
+                stream.value()
+            if stream.peek() != '}':
+                stream.expect(',')
+        stream.expect('}')
+        if stream.expect(',}') == '}':
+            break
+
+
+def _json_color(color):
+    if (not isinstance(color, list) or len(color) not in (3, 4) or
+            not all(isinstance(value, (int, float)) for value in color)):
+        raise ValueError('Invalid color: {!r}'.format(color))
+    return [float(value) for value in color]
+
+
+def _write_json(store, names, text_file):
+    # The layout of `kivy.storage.jsonstore.JsonStore`, one color a line
+    text_file.write('{')
+    for index, name in enumerate(names):
+        text_file.write('{}\n{}: {{"colors": ['.format(
+            ',' if index else '', json.dumps(name)))
+        for number, color in enumerate(store.iter_colors(name)):
+            text_file.write('{}\n  {}'.format(',' if number else '',
+                                              json.dumps(color)))
+        text_file.write('\n]}')
+    text_file.write('\n}\n')
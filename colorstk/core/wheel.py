@@ -0,0 +1,120 @@
+"""Implements color schemes for arrays of colors.
+
+The functions here mirror `schemes.make_schemes`, but build all four
+schemes for a whole array of base colors at once.  Hues on the RYB
+color wheel are mapped with a precomputed table instead of grapefruit's
+piecewise interpolation, which is evaluated one hue at a time.
+"""
+
+import grapefruit
+import numpy as np
+
+from .batch import hsl_to_rgb, rgb_to_hsl
+from .schemes import SCHEMES
+
+# Table entries per degree of hue
+RESOLUTION = 16
+
+# grapefruit interpolates its wheels linearly between every 15 degrees,
+# so the tables are filled in from those breakpoints.  With a whole
+# number of entries per 15 degrees, interpolating the table gives
+# grapefruit's values.
+_BREAKPOINTS = np.arange(0, 361, 15)
+_DEGREES = np.arange(360 * RESOLUTION + 1) / float(RESOLUTION)
+_RGB_TO_RYB = np.interp(_DEGREES, _BREAKPOINTS, [
+    grapefruit.rgb_to_ryb(hue) for hue in _BREAKPOINTS[:-1]] + [360.0])
+_RYB_TO_RGB = np.interp(_DEGREES, _BREAKPOINTS, [
+    grapefruit.ryb_to_rgb(hue) for hue in _BREAKPOINTS[:-1]] + [360.0])
+
+# Offsets of the scheme hues from the hue of the color on the wheel
+_HUE_OFFSETS = {
+    'triadic': (120.0, 240.0),
+    'tetradic': (60.0, 180.0, 240.0),
+    'analogous': (-30.0, 30.0)
+}
+
+
+def rgb_to_ryb(hues):
+    """Maps an array of RGB hues in degrees to the RYB color wheel."""
+    return _lookup(_RGB_TO_RYB, hues)
+
+
+def ryb_to_rgb(hues):
+    """Maps an array of RYB hues in degrees to the RGB color wheel."""
+    return _lookup(_RYB_TO_RGB, hues)
+
+
+def _lookup(table, hues):
+    """Linearly interpolates a hue table at an array of hues."""
+    scaled = np.asarray(hues, dtype=np.float64) % 360.0
+    scaled *= RESOLUTION
+    index = np.minimum(scaled.astype(np.intp), len(table) - 2)
+    scaled -= index
+    low = table.take(index)
+    return low + (table.take(index + 1) - low) * scaled
+
+
+def make_schemes(rgb, mode='ryb'):
+    """Makes color schemes for an array of colors.
+
+    Args:
+        rgb: An (N, 3) array of RGB values in range 0-1, or (N, 4)
+            with alpha, which is carried through to the scheme colors.
+        mode: The color wheel to use, 'rgb' or 'ryb'. Defaults to 'ryb'.
+
+    Returns:
+        A dict mapping each name in `SCHEMES` to an array of shape
+        (N, colors, 3), or (N, colors, 4) with alpha, of the RGB values
+        of the scheme colors of each color, in the order of grapefruit.
+
+    Raises:
+        ValueError: If the array shape or mode is not supported.
+
+    """
+    rgb = np.asarray(rgb, dtype=np.float64)
+    if rgb.ndim != 2 or rgb.shape[1] not in (3, 4):
+        raise ValueError('Expected an array of shape (N, 3) or (N, 4), '
+                         'got {}'.format(rgb.shape))
+    if mode not in ('rgb', 'ryb'):
+        raise ValueError('Unknown color wheel: {}'.format(mode))
+    alpha = rgb[:, 3] if rgb.shape[1] == 4 else None
+    hue, saturation, lightness = rgb_to_hsl(rgb[:, :3]).T
+
+    schemes = {'monochrome': _monochrome(hue, saturation, lightness)}
+    wheel_hue = rgb_to_ryb(hue) if mode == 'ryb' else hue
+    for scheme, offsets in _HUE_OFFSETS.items():
+        hues = (wheel_hue[:, np.newaxis] + offsets) % 360.0
+        if mode == 'ryb':
+            hues = ryb_to_rgb(hues)
+        count = len(offsets)
+        schemes[scheme] = np.column_stack((
+            hues.ravel(), np.repeat(saturation, count),
+            np.repeat(lightness, count)))
+
+    for scheme in SCHEMES:
+        colors = hsl_to_rgb(schemes[scheme])
+        if alpha is not None:
+            colors = np.column_stack((colors, np.repeat(
+                alpha, len(colors) // len(rgb))))
+        schemes[scheme] = colors.reshape(len(rgb), -1, colors.shape[1])
+    return schemes
+
+
+def _monochrome(hue, saturation, lightness):
+    """Returns the HSL values of monochrome schemes, like grapefruit's
+    `make_monochrome_scheme`, as an (N * 4, 3) array."""
+    def wrap(values, minimum, threshold, plus):
+        return np.where(values - minimum < threshold, values + plus,
+                        values - minimum)
+
+    saturation1 = wrap(saturation, 0.3, 0.1, 0.3)
+    lightness1 = wrap(lightness, 0.5, 0.2, 0.3)
+    schemes = np.empty((len(hue), 4, 3))
+    schemes[:, :, 0] = hue[:, np.newaxis]
+    schemes[:, 0, 1:] = np.column_stack((saturation1, lightness1))
+    schemes[:, 1, 1:] = np.column_stack((
+        saturation, wrap(lightness, 0.2, 0.2, 0.6)))
+    schemes[:, 2, 1:] = np.column_stack((
+        saturation1, np.maximum(0.2, lightness + (1 - lightness) * 0.2)))
+    schemes[:, 3, 1:] = np.column_stack((saturation, lightness1))
+    return schemes.reshape(-1, 3)
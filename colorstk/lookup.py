@@ -2,6 +2,7 @@
 
 from collections import deque
 import json
+from os.path import join
 import random
 import re
 
@@ -9,6 +10,9 @@ import grapefruit
 from kivy.app import App
 from kivy.clock import Clock
 from kivy.factory import Factory
+from kivy.graphics import Color, Mesh
+from kivy.graphics.texture import Texture
+from kivy.metrics import dp
 from kivy.properties import (BooleanProperty,
                              ListProperty,
                              NumericProperty,
@@ -22,15 +26,23 @@ from kivy.uix.tabbedpanel import TabbedPanel, TabbedPanelItem
 from kivy.uix.textinput import TextInput
 from kivy.uix.widget import Widget
 
+try:
+    import core
+    from core.profiling import tracer
+except ImportError:
+    from colorstk import core
+    from colorstk.core.profiling import tracer
+
 
 class LookupScreen(KNSpaceBehavior, BoxLayout, Screen):
     """A `Screen` to look up and view colors and their values."""
 
-    # Load named colors from grapefruit as {value: name} pairs
-    named_colors = {value: name for name, value in
-                    grapefruit.NAMED_COLOR.items()}
+    named_colors = core.NAMED_COLORS
+    # CIE76 Delta-E within which palette colors count as similar
+    similar_delta_e = 5.0
     color = ObjectProperty()
     color_name = StringProperty()
+    similar_palettes = StringProperty()
     websafe_color = ObjectProperty()
     greyscale_color = ObjectProperty()
     complementary_color = ObjectProperty()
@@ -55,30 +67,128 @@ class LookupScreen(KNSpaceBehavior, BoxLayout, Screen):
 
         self.history = deque(maxlen=30)
         self.history_next = []
+        # Colors are named by exact matches until `load_name_index`
+        self.bundle_cache = core.BundleCache()
+        # Sections that are out of date with the current color
+        self.dirty = {'schemes'}
         self.color = grapefruit.Color((0, 0, 0), wref=self.white_point)
         self.set_color_info()
         super(LookupScreen, self).__init__(**kwargs)
 
         self.value_view = Factory.ValueView()
+        # Every `ValueDisplay` built, by color space, including those
+        # of color spaces that are no longer shown
+        self.value_displays = {}
         self.tabbed_panel = FullWidthTabbedPanel()
+        self.values_tab = TabbedPanelItem(text='Values',
+                                          content=self.value_view)
         self.info_tab = Factory.InfoTab()
         self.schemes_tab = Factory.SchemesTab()
         self.tools_tab = Factory.ToolsTab()
+        self.tabbed_panel.bind(current_tab=self.on_current_tab)
+        # Collapses all changes within a frame into one refresh
+        self.trigger_refresh = Clock.create_trigger(self.refresh_visible)
 
         self.load_content()
         self.load_value_displays()
-        self.make_schemes()
+        self.refresh_visible()
 
+    @tracer.traced()
     def on_color(self, instance, color):
-        """Sets values, info, and schemes."""
+        """Marks values, info, and schemes dirty.
+
+        The refresh is scheduled for the next frame, so several color
+        changes within one frame only cause a single refresh.
+
+        """
+        tracer.count('dispatch: color')
+        if not self.color.is_legal:
+            return
+        self.dirty.update(('values', 'info', 'schemes'))
+        self.trigger_refresh()
+
+    def on_enter(self):
+        """Marks info dirty, since palettes may have changed."""
+        self.dirty.add('info')
+        self.trigger_refresh()
+
+    def on_current_tab(self, tabbed_panel, current_tab):
+        """Refreshes the content of a newly shown tab if it is dirty."""
+        self.trigger_refresh()
+
+    def visible_sections(self):
+        """Returns the set of sections currently shown on screen."""
+        current_tab = self.tabbed_panel.current_tab
+        sections = set()
+        if self.detach_values or current_tab is self.values_tab:
+            sections.add('values')
+        if current_tab is self.info_tab:
+            sections.add('info')
+        elif current_tab is self.schemes_tab:
+            sections.add('schemes')
+        return sections
+
+    @tracer.traced()
+    def refresh_visible(self, *args):
+        """Recomputes dirty sections that are visible.
+
+        Hidden sections stay dirty until their tab is shown.
+
+        """
         if not self.color.is_legal:
             return
+        for section in self.visible_sections() & self.dirty:
+            self.dirty.discard(section)
+            if section == 'values':
+                self.update_values()
+            elif section == 'info':
+                self.set_color_info()
+            elif section == 'schemes':
+                self.make_schemes()
+
+    def update_values(self):
+        """Sets the value of each `ValueDisplay`."""
         for value_display in self.value_view.ids.value_grid.children:
             value_display.value = self.get_value(value_display.color_space)
             value_display.update_inputs()
-        self.set_color_info()
-        self.make_schemes()
 
+    def get_bundle(self):
+        """Returns the cached `core.ColorBundle` for the current color."""
+        return self.bundle_cache.get(self.color, self.white_point,
+                                     self.scheme_mode, self.value_range)
+
+    def conversion_count(self):
+        """Returns the number of conversions run since the last reset.
+
+        Call `bundle_cache.reset_counters` before a color change to
+        count the conversions that the change caused.
+
+        """
+        return sum(self.bundle_cache.conversions.values())
+
+    def invalidate_cache(self):
+        """Discards cached values after a configuration change."""
+        self.bundle_cache.invalidate()
+
+    def load_name_index(self):
+        """Loads the index naming colors by their nearest named color.
+
+        It is loaded after the first frame, since it needs numpy.  A
+        precomputed index can be placed in the user data directory,
+        otherwise one is built from grapefruit's names.
+
+        """
+        try:
+            from core import names
+        except ImportError:
+            from colorstk.core import names
+        path = join(App.get_running_app().user_data_dir, 'color_names.npz')
+        self.bundle_cache.name_index = names.default_index(path)
+        self.invalidate_cache()
+        self.dirty.add('info')
+        self.trigger_refresh()
+
+    @tracer.traced()
     def get_value(self, color_space):
         """Returns the color value for the corresponding color space.
 
@@ -89,106 +199,199 @@ class LookupScreen(KNSpaceBehavior, BoxLayout, Screen):
             A list containing the value for the color.
 
         """
-        if color_space == 'Hex':
-            return [self.color.html]
-        elif color_space == 'sRGB':
-            if self.value_range == '0-255':
-                return list(self.color.ints)
-            elif self.value_range == '0-1':
-                return list(self.color.rgb)
-        elif color_space == 'HSL':
-            return list(self.color.hsl)
-        elif color_space == 'HSV':
-            return list(self.color.hsv)
-        elif color_space == 'YIQ':
-            return list(self.color.yiq)
-        elif color_space == 'YUV':
-            return list(self.color.yuv)
-        elif color_space == 'CIE-XYZ':
-            return list(self.color.xyz)
-        elif color_space == 'CIE-LAB':
-            return list(self.color.lab)
-        elif color_space == 'CMY':
-            return list(self.color.cmy)
-        elif color_space == 'CMYK':
-            return list(self.color.cmyk)
+        return self.get_bundle().get_value(color_space)
+
+    def convert_colors(self, values, from_space, to_space):
+        """Converts an array of colors using the current configuration.
+
+        The conversion is vectorized by `core.batch.convert`, using
+        the current white point and value range.
+
+        Args:
+            values: An array of colors in `from_space`.
+            from_space: The name of the color space of `values`.
+            to_space: The name of the color space to convert to.
+
+        Returns:
+            An array of the converted colors.
+
+        """
+        try:
+            from core import batch
+        except ImportError:
+            from colorstk.core import batch
+        return batch.convert(values, from_space, to_space,
+                             white_point=self.white_point,
+                             value_range=self.value_range)
+
+    def adapt_colors(self, xyz, white_point):
+        """Adapts an array of CIE-XYZ values to the current white point.
+
+        Uses the precomputed Bradford matrices of
+        `core.adaptation.ChromaticAdapter`, so the whole array is
+        adapted with a single matrix multiply.
+
+        Args:
+            xyz: An (N, 3) array of XYZ values relative to `white_point`.
+            white_point: The white point of `xyz`, as a (name, observer)
+                tuple or XYZ values.
+
+        Returns:
+            An (N, 3) array of XYZ values relative to `white_point`
+            of the screen.
+
+        """
+        try:
+            from core import adaptation
+        except ImportError:
+            from colorstk.core import adaptation
+        return adaptation.get_adapter().adapt_xyz(
+            xyz, white_point, self.white_point_key)
 
+    @tracer.traced()
     def set_color_info(self):
         """Sets color info properties for the current color."""
-        self.color_name = self.named_colors.get(self.color.html, 'N/A')
-        self.websafe_color = grapefruit.Color(
-            self.color.websafe, wref=self.white_point)
-        self.greyscale_color = grapefruit.Color(
-            self.color.greyscale, wref=self.white_point)
-        self.complementary_color = self.color.complementary_color()
-        self.ryb_hue = round(grapefruit.rgb_to_ryb(self.color.hsl_hue), 3)
+        info = self.get_bundle().info
+        self.color_name = info['color_name']
+        self.websafe_color = info['websafe_color']
+        self.greyscale_color = info['greyscale_color']
+        self.complementary_color = info['complementary_color']
+        self.ryb_hue = info['ryb_hue']
+        similar = self.find_similar()
+        # Left empty, which hides it, until the palettes are indexed
+        self.similar_palettes = '' if similar is None else ', '.join(
+            match.palette for match in similar) or 'None'
+
+    def find_similar(self, delta_e=None):
+        """Finds the saved palettes with colors similar to the color.
 
+        Args:
+            delta_e: The maximum CIE76 Delta-E of similar colors, or
+                None for `similar_delta_e`. Defaults to None.
+
+        Returns:
+            A list of `core.similarity.Match` tuples of the nearest
+            color of each palette, nearest first, or None if the
+            palettes are not loaded and indexed yet.
+
+        """
+        # Palettes are loaded after the first frame
+        palettes_screen = getattr(knspace, 'palettes_screen', None)
+        if palettes_screen is None:
+            return None
+        color_index = palettes_screen.get_color_index()
+        if color_index is None:
+            return None
+        if delta_e is None:
+            delta_e = self.similar_delta_e
+        return color_index.palettes_near(self.color.rgb, delta_e)
+
+    @tracer.traced()
     def make_schemes(self):
         """Makes color schemes and displays the colors."""
-        for color_box, color in zip(
-                self.schemes_tab.ids.monochrome_grid.children,
-                self.color.make_monochrome_scheme()):
-            color_box.color = color
-
-        for color_box, color in zip(
-                self.schemes_tab.ids.triadic_grid.children,
-                self.color.make_triadic_scheme(mode=self.scheme_mode)):
-            color_box.color = color
-
-        for color_box, color in zip(
-                self.schemes_tab.ids.tetradic_grid.children,
-                self.color.make_tetradic_scheme(mode=self.scheme_mode)):
-            color_box.color = color
-
-        for color_box, color in zip(
-                self.schemes_tab.ids.analogous_grid.children,
-                self.color.make_analogous_scheme(mode=self.scheme_mode)):
-            color_box.color = color
+        schemes = self.get_bundle().schemes
+        for scheme in core.SCHEMES:
+            # The first color of a scheme is shown last
+            self.schemes_tab.ids[scheme + '_grid'].set_colors(
+                schemes[scheme][::-1])
 
     def on_value_range(self, instance, value_range):
-        """Reloads the sRGB `ValueDisplay`."""
+        """Reloads the sRGB `ValueDisplay`, or marks values dirty."""
+        tracer.count('dispatch: value_range')
+        if 'values' not in self.visible_sections():
+            self.dirty.add('values')
+            return
         for value_display in self.value_view.ids.value_grid.children:
             if value_display.color_space == 'sRGB':
                 value_display.value = self.get_value(value_display.color_space)
                 value_display.update_inputs()
 
     def on_color_spaces(self, instance, color_spaces):
-        """Removes `ValueDisplay` widgets and reloads them."""
-        self.value_view.ids.value_grid.clear_widgets()
+        """Updates the `ValueDisplay` widgets to the color spaces."""
+        tracer.count('dispatch: color_spaces')
         self.load_value_displays()
 
     def load_value_displays(self):
-        """Loads `ValueDisplay` widgets based on configuration."""
-        for color_space in self.color_spaces:
-            self.value_view.ids.value_grid.add_widget(
-                ValueDisplay(color_space))
+        """Reconciles the `ValueDisplay` widgets with configuration.
+
+        Displays of color spaces that are no longer shown are detached
+        but kept, so that showing them again reuses their inputs.  Only
+        displays of color spaces never shown before are built, and the
+        others are moved to their new places.
+
+        """
+        value_grid = self.value_view.ids.value_grid
+        shown = set(self.color_spaces)
+        for value_display in value_grid.children[:]:
+            if value_display.color_space not in shown:
+                value_grid.remove_widget(value_display)
+
+        reattached = []
+        for position, color_space in enumerate(self.color_spaces):
+            value_display = self.value_displays.get(color_space)
+            if value_display is None:
+                value_display = ValueDisplay(color_space)
+                self.value_displays[color_space] = value_display
+            elif value_display.parent is None:
+                reattached.append(value_display)
+            # Children are in the reverse order of display
+            children = value_grid.children
+            index = len(children) - 1 - position
+            if 0 <= index < len(children) and (
+                    children[index] is value_display):
+                continue
+            if value_display.parent is value_grid:
+                value_grid.remove_widget(value_display)
+            value_grid.add_widget(value_display,
+                                  len(value_grid.children) - position)
+
+        # Detached displays are not updated with the color
+        if 'values' in self.visible_sections():
+            for value_display in reattached:
+                value_display.value = self.get_value(value_display.color_space)
+                value_display.update_inputs()
+        elif reattached:
+            self.dirty.add('values')
 
     def on_detach_values(self, instance, detach_values):
-        """Clears content and reloads it."""
-        self.tabbed_panel.clear_widgets()
-        self.tabbed_panel.clear_tabs()
-        self.ids.content.clear_widgets()
-        self.load_content()
+        """Moves the `ValueView` and refreshes it if it is shown."""
+        tracer.count('dispatch: detach_values')
+        self.place_value_view()
+        self.trigger_refresh()
 
     def load_content(self):
-        """Loads the `TabbedPanel` based on configuration."""
-        if not self.detach_values:
-            self.value_view.background_color[3] = 0
-            values_tab = TabbedPanelItem(
-                text='Values', content=self.value_view)
-            self.tabbed_panel.add_widget(values_tab)
-            self.tabbed_panel.switch_to(values_tab)
-
+        """Loads the `TabbedPanel` and places the `ValueView`."""
         self.tabbed_panel.add_widget(self.info_tab)
         self.tabbed_panel.add_widget(self.schemes_tab)
         self.tabbed_panel.add_widget(self.tools_tab)
+        self.ids.content.add_widget(self.tabbed_panel)
+        self.place_value_view()
 
+    def place_value_view(self):
+        """Places the `ValueView` in the values tab or above the tabs.
+
+        The view keeps its `ValueDisplay` widgets when it is moved.
+
+        """
+        content = self.ids.content
         if self.detach_values:
-            self.value_view.background_color[3] = 1
-            self.ids.content.add_widget(self.value_view)
+            # Switching away from the values tab takes the view out of
+            # the tabbed panel
             self.tabbed_panel.switch_to(self.info_tab)
-
-        self.ids.content.add_widget(self.tabbed_panel)
+            if self.values_tab in self.tabbed_panel.tab_list:
+                self.tabbed_panel.remove_widget(self.values_tab)
+            if self.value_view.parent is None:
+                self.value_view.background_color[3] = 1
+                # Shown before the tabbed panel
+                content.add_widget(self.value_view, len(content.children))
+        else:
+            content.remove_widget(self.value_view)
+            self.value_view.background_color[3] = 0
+            if self.values_tab not in self.tabbed_panel.tab_list:
+                # Shown as the first tab
+                self.tabbed_panel.add_widget(
+                    self.values_tab, len(self.tabbed_panel.tab_list))
+            self.tabbed_panel.switch_to(self.values_tab)
 
     def set_color(self, value):
         """Sets the color from RGB values."""
@@ -203,29 +406,30 @@ class LookupScreen(KNSpaceBehavior, BoxLayout, Screen):
             observer: The observer angle of the white point.
 
         """
-        if observer == 'CIE 1931':
-            name = 'std_' + name
-        elif observer == 'CIE 1964':
-            name = 'sup_' + name
-        self.white_point = grapefruit.WHITE_REFERENCE[name]
+        # Names the white point for `core.adaptation`
+        self.white_point_key = (name, observer)
+        self.white_point = core.get_white_point(name, observer)
 
     def random_color(self):
         self.add_to_history(self.color)
-        self.color = grapefruit.Color(tuple(random.random() for _ in range(3)))
+        self.color = grapefruit.Color(
+            tuple(random.random() for _ in range(3)), wref=self.white_point)
 
     def blend_colors(self):
         """Blends stored colors together and switches to the color."""
-        blend_color1 = self.tools_tab.ids.color_select1.color
-        blend_color2 = self.tools_tab.ids.color_select2.color
+        blend_color = core.blend_colors(
+            self.tools_tab.ids.color_select1.color,
+            self.tools_tab.ids.color_select2.color)
         # Only blend if both colors are visible.
-        if blend_color1.alpha and blend_color2.alpha:
+        if blend_color is not None:
             self.add_to_history(self.color)
-            self.color = blend_color1.blend(blend_color2)
+            self.color = blend_color
 
     def add_to_palette(self):
         """Opens the `PalettesScreen` in add mode."""
-        knspace.palettes_screen.mode = 'add'
-        App.get_running_app().root.current = 'palettes'
+        app = App.get_running_app()
+        app.load_screen('palettes').mode = 'add'
+        app.root.current = 'palettes'
 
     def add_to_history(self, color, next_disable=True):
         """Appends the current color to history.
@@ -277,6 +481,7 @@ class ValueDisplay(GridLayout):
 
         """
         super(ValueDisplay, self).__init__(**kwargs)
+        tracer.count('rebuild: ValueDisplay')
         self.color_space = color_space
         self.value = knspace.lookup_screen.get_value(color_space)
 
@@ -289,6 +494,7 @@ class ValueDisplay(GridLayout):
             self.add_widget(value_input)
             self.value_inputs.append(value_input)
 
+    @tracer.traced()
     def update_inputs(self):
         """Updates each `ValueInput` in turn."""
         for value_input in self.value_inputs:
@@ -299,42 +505,10 @@ class ValueDisplay(GridLayout):
     def update_color(self):
         """Updates color with a new color from the value property."""
         lookup_screen = knspace.lookup_screen
-        white_point = lookup_screen.white_point
         lookup_screen.add_to_history(lookup_screen.color, next_disable=False)
-
-        if self.color_space == 'Hex':
-            lookup_screen.color = grapefruit.Color.from_html(
-                *self.value, wref=white_point)
-        elif self.color_space == 'sRGB':
-            if lookup_screen.value_range == '0-255':
-                # Convert RGB values from range 0-255 to range 0-1
-                self.value = [val / 255 for val in self.value]
-            lookup_screen.color = grapefruit.Color.from_rgb(
-                *self.value, wref=white_point)
-        elif self.color_space == 'HSL':
-            lookup_screen.color = grapefruit.Color.from_hsl(
-                *self.value, wref=white_point)
-        elif self.color_space == 'HSV':
-            lookup_screen.color = grapefruit.Color.from_hsv(
-                *self.value, wref=white_point)
-        elif self.color_space == 'YIQ':
-            lookup_screen.color = grapefruit.Color.from_yiq(
-                *self.value, wref=white_point)
-        elif self.color_space == 'YUV':
-            lookup_screen.color = grapefruit.Color.from_yuv(
-                *self.value, wref=white_point)
-        elif self.color_space == 'CIE-XYZ':
-            lookup_screen.color = grapefruit.Color.from_xyz(
-                *self.value, wref=white_point)
-        elif self.color_space == 'CIE-LAB':
-            lookup_screen.color = grapefruit.Color.from_lab(
-                *self.value, wref=white_point)
-        elif self.color_space == 'CMY':
-            lookup_screen.color = grapefruit.Color.from_cmy(
-                *self.value, wref=white_point)
-        elif self.color_space == 'CMYK':
-            lookup_screen.color = grapefruit.Color.from_cmyk(
-                *self.value, wref=white_point)
+        lookup_screen.color = core.make_color(
+            self.color_space, self.value,
+            lookup_screen.white_point, lookup_screen.value_range)
 
         # Disabling next is held off until new color is set to check if
         # it is legal. Revert to previous color if not legal.
@@ -511,11 +685,98 @@ class ColorBox(Widget):
     def on_touch_down(self, touch):
         """Switches to the color."""
         if self.collide_point(*touch.pos):
+            tracer.begin('touch to frame')
             lookup_screen = knspace.lookup_screen
             lookup_screen.add_to_history(lookup_screen.color)
             lookup_screen.color = self.color
 
 
+class ColorBoxRow(Widget):
+    """Displays a row of colors like `ColorBox`es, drawn as one `Mesh`.
+
+    The mesh has a quad for the border and one for the color of each
+    box, sampling a texture with a texel per color and one for the
+    border.  Changing the colors only updates the texture, instead of a
+    property and the canvas instructions of a widget per color.
+
+    """
+
+    count = NumericProperty(1)
+
+    def __init__(self, **kwargs):
+        self.colors = []
+        self.texture = None
+        super(ColorBoxRow, self).__init__(**kwargs)
+        with self.canvas:
+            Color(1, 1, 1, 1)
+            self.mesh = Mesh(mode='triangles')
+        self.bind(pos=self.update_mesh, size=self.update_mesh,
+                  count=self.update_mesh)
+        self.update_mesh()
+
+    def set_colors(self, colors):
+        """Displays colors in the boxes from the left.
+
+        Args:
+            colors: A sequence of up to `count` `grapefruit.Color`s.
+                Boxes without a color are empty.
+
+        """
+        self.colors = list(colors)[:int(self.count)]
+        pixels = bytearray()
+        for index in range(int(self.count)):
+            color = (tuple(self.colors[index]) if index < len(self.colors)
+                     else (0, 0, 0, 0))
+            pixels.extend(int(round(min(max(val, 0.0), 1.0) * 255))
+                          for val in color)
+        pixels.extend((26, 26, 26, 255))
+        self.texture.blit_buffer(bytes(pixels), colorfmt='rgba',
+                                 bufferfmt='ubyte')
+        self.canvas.ask_update()
+
+    def update_mesh(self, *args):
+        """Lays out a square box for each color along the row."""
+        tracer.count('rebuild: scheme mesh')
+        count = int(self.count)
+        if self.texture is None or self.texture.width != count + 1:
+            tracer.count('rebuild: scheme texture')
+            self.texture = Texture.create(size=(count + 1, 1),
+                                          colorfmt='rgba')
+            self.texture.mag_filter = 'nearest'
+            self.texture.min_filter = 'nearest'
+            self.mesh.texture = self.texture
+            self.set_colors(self.colors)
+        vertices = []
+        indices = []
+        size = self.height
+        border = dp(2)
+        for index in range(count):
+            left = self.x + index * size
+            for texel, inset in ((count, 0), (index, border)):
+                # All corners of a quad sample the middle of its texel
+                u = (texel + 0.5) / (count + 1)
+                first = len(vertices) // 4
+                vertices.extend((
+                    left + inset, self.y + inset, u, 0.5,
+                    left + size - inset, self.y + inset, u, 0.5,
+                    left + size - inset, self.top - inset, u, 0.5,
+                    left + inset, self.top - inset, u, 0.5))
+                indices.extend((first, first + 1, first + 2,
+                                first + 2, first + 3, first))
+        self.mesh.vertices = vertices
+        self.mesh.indices = indices
+
+    def on_touch_down(self, touch):
+        """Switches to the color of the touched box."""
+        if self.collide_point(*touch.pos):
+            index = int((touch.x - self.x) // self.height)
+            if index < len(self.colors):
+                tracer.begin('touch to frame')
+                lookup_screen = knspace.lookup_screen
+                lookup_screen.add_to_history(lookup_screen.color)
+                lookup_screen.color = self.colors[index]
+
+
 class ColorSelectBox(Widget):
     """Sets and holds a color object that can be used later."""
 
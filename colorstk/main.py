@@ -1,13 +1,17 @@
 #!/usr/bin/env python
 
+import importlib
 import json
 from os.path import dirname, join
 import webbrowser
 
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.config import Config
+from kivy.core.window import Window
 from kivy.garden import iconfonts
 from kivy.lang.builder import Builder
+from kivy.logger import Logger
 from kivy.properties import (BooleanProperty,
                              ListProperty,
                              NumericProperty,
@@ -15,15 +19,31 @@ from kivy.properties import (BooleanProperty,
                              StringProperty)
 from kivy.uix.behaviors.knspace import knspace
 from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.label import Label
 from kivy.uix.modalview import ModalView
 from kivy.uix.screenmanager import NoTransition, ScreenManager
 from kivy.uix.settings import SettingItem, SettingsWithNoMenu
 from kivy.uix.togglebutton import ToggleButton
 
 try:
-    import lookup, palettes
+    from core.profiling import StartupProfiler, tracer
 except ImportError:
-    from colorstk import lookup, palettes
+    from colorstk.core.profiling import StartupProfiler, tracer
+
+# The module, class and kv file of each screen, which are only loaded
+# when the screen is first shown
+SCREENS = {
+    'lookup': ('lookup', 'LookupScreen', 'lookup.kv'),
+    'palettes': ('palettes', 'PalettesScreen', 'palettes.kv'),
+    'colors': ('palettes', 'ColorsScreen', 'palettes.kv')
+}
+
+# Seconds after the first frame to load the palettes, which the lookup
+# screen shows similar colors from
+DEFERRED_LOAD_DELAY = 0.5
+
+# Seconds between updates of the latencies shown while tracing
+TRACE_OVERLAY_INTERVAL = 1.0
 
 
 class PopupWithActionBar(BoxLayout, ModalView):
@@ -130,29 +150,138 @@ class SettingOptionsToggle(SettingItem):
         self.popup.open()
 
 
+class TraceOverlay(Label):
+    """A `Label` over the app showing latencies of traced spans."""
+
+    def update(self, dt):
+        self.text = tracer.report()
+
+
+class LazyScreenManager(ScreenManager):
+    """A `ScreenManager` that loads screens when they are first shown."""
+
+    def on_current(self, instance, value):
+        App.get_running_app().load_screen(value)
+        super(LazyScreenManager, self).on_current(instance, value)
+
+
 class ColorsTKApp(App):
     def build(self):
-        """Initializes `ColorsTKApp`."""
+        """Initializes `ColorsTKApp` with only the lookup screen.
+
+        The other screens and their kv files are loaded when they are
+        first shown, or for the palettes after the first frame.  The
+        time of each phase is written to startup.json in the user data
+        directory.
+
+        Tracing of hot paths is turned on by the debug setting or the
+        `core.profiling.TRACE_ENV` environment variable.
+
+        """
+        self.profiler = StartupProfiler()
         self.use_kivy_settings = False
         self.settings_cls = SettingsWithNoMenu
         self.pkg_dir = dirname(__file__)
         self.title = 'Colors Toolkit'
         self.icon = join(self.pkg_dir, 'data/app_icon-32.png')
+        self.loaded_kv = set()
 
         Config.set('kivy', 'exit_on_escape', '0')
 
-        iconfonts.register('colorstk',
-                           join(self.pkg_dir, 'data/icons'),
-                           join(self.pkg_dir, 'data/icons.fontd'))
-        Builder.load_file(join(self.pkg_dir, 'main.kv'))
-        Builder.load_file(join(self.pkg_dir, 'lookup.kv'))
-        Builder.load_file(join(self.pkg_dir, 'palettes.kv'))
+        with self.profiler.phase('icon registration'):
+            iconfonts.register('colorstk',
+                               join(self.pkg_dir, 'data/icons'),
+                               join(self.pkg_dir, 'data/icons.fontd'))
+        self.load_kv('main.kv')
+
+        self.screen_manager = LazyScreenManager(transition=NoTransition())
+        self.load_screen('lookup')
+        Window.bind(on_flip=self.on_first_frame)
+
+        self.trace_overlay = None
+        self.set_tracing(tracer.enabled or
+                         int(self.config.get('debug', 'trace')))
+        return self.screen_manager
+
+    def load_kv(self, file_name):
+        """Loads a kv file of the package once."""
+        if file_name not in self.loaded_kv:
+            with self.profiler.phase('kv parsing: ' + file_name):
+                Builder.load_file(join(self.pkg_dir, file_name))
+            self.loaded_kv.add(file_name)
+
+    def load_screen(self, name):
+        """Returns a screen, building it and loading its kv file first
+        if it was not shown before."""
+        if self.screen_manager.has_screen(name):
+            return self.screen_manager.get_screen(name)
+        module_name, class_name, file_name = SCREENS[name]
+        with self.profiler.phase('screen init: ' + name), tracer.span(
+                'screen load: ' + name):
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError:
+                module = importlib.import_module('colorstk.' + module_name)
+            self.load_kv(file_name)
+            screen = getattr(module, class_name)(name=name)
+            self.screen_manager.add_widget(screen)
+        return screen
+
+    def on_first_frame(self, window):
+        """Schedules loading the palettes after the first frame."""
+        window.unbind(on_flip=self.on_first_frame)
+        self.profiler.mark('first frame')
+        Clock.schedule_once(self.load_deferred, DEFERRED_LOAD_DELAY)
+
+    def load_deferred(self, dt):
+        """Loads the palettes and color names and writes the startup
+        profile."""
+        self.load_screen('palettes')
+        lookup_screen = knspace.lookup_screen
+        # Refreshes the info, which also starts indexing the palettes,
+        # whose colors similar to the color are shown once indexed
+        with self.profiler.phase('name index'):
+            lookup_screen.load_name_index()
+        Logger.info('Startup: phases\n' + self.profiler.report())
+        try:
+            self.profiler.write(join(self.user_data_dir, 'startup.json'))
+        except (IOError, OSError) as error:
+            Logger.warning('Startup: profile not written: {}'.format(error))
+
+    def set_tracing(self, enabled):
+        """Turns tracing of hot paths and its overlay on or off.
+
+        The trace is written to trace.json in the user data directory
+        when tracing is turned off, the app is paused, or it stops.
 
-        screen_manager = ScreenManager(transition=NoTransition())
-        screen_manager.add_widget(lookup.LookupScreen(name='lookup'))
-        screen_manager.add_widget(palettes.PalettesScreen(name='palettes'))
-        screen_manager.add_widget(palettes.ColorsScreen(name='colors'))
-        return screen_manager
+        """
+        enabled = bool(enabled)
+        if enabled == (self.trace_overlay is not None):
+            return
+        tracer.enabled = enabled
+        if enabled:
+            self.trace_overlay = TraceOverlay()
+            Window.add_widget(self.trace_overlay)
+            Window.bind(on_flip=self.on_trace_frame)
+            self.trace_event = Clock.schedule_interval(
+                self.trace_overlay.update, TRACE_OVERLAY_INTERVAL)
+        else:
+            self.trace_event.cancel()
+            Window.unbind(on_flip=self.on_trace_frame)
+            Window.remove_widget(self.trace_overlay)
+            self.trace_overlay = None
+            self.write_trace()
+
+    def on_trace_frame(self, window):
+        """Ends the interval from a touch to the next frame."""
+        tracer.end('touch to frame')
+
+    def write_trace(self):
+        """Writes the trace events to trace.json."""
+        try:
+            tracer.write(join(self.user_data_dir, 'trace.json'))
+        except (IOError, OSError) as error:
+            Logger.warning('Trace: trace not written: {}'.format(error))
 
     def build_config(self, config):
         """Sets default values in the configuration."""
@@ -167,6 +296,9 @@ class ColorsTKApp(App):
             'observer_angle': 'CIE 1931',
             'scheme_mode': 'RYB'
         })
+        config.setdefaults('debug', {
+            'trace': 0
+        })
 
     def build_settings(self, settings):
         """Adds the settings panel and creates the settings popup."""
@@ -215,7 +347,14 @@ class ColorsTKApp(App):
              'desc': 'Color wheel to use for schemes/complementary color',
              'section': 'color',
              'key': 'scheme_mode',
-             'options': ['RGB', 'RYB']}
+             'options': ['RGB', 'RYB']},
+            {'type': 'title',
+             'title': 'Debugging'},
+            {'type': 'toggle',
+             'title': 'Trace hot paths',
+             'desc': 'Show p50/p99 latencies and write trace.json',
+             'section': 'debug',
+             'key': 'trace'}
         ])
         settings.add_json_panel('', self.config, data=json_panel)
 
@@ -229,7 +368,11 @@ class ColorsTKApp(App):
 
     def on_config_change(self, config, section, key, value):
         """Sets the property for the corresponding config value."""
+        if section == 'debug':
+            self.set_tracing(int(value))
+            return
         lookup_screen = knspace.lookup_screen
+        lookup_screen.invalidate_cache()
         if key == 'detach_values':
             lookup_screen.detach_values = int(value)
         elif key == 'color_spaces':
@@ -245,6 +388,22 @@ class ColorsTKApp(App):
         elif key == 'scheme_mode':
             lookup_screen.scheme_mode = value.lower()
 
+    def on_pause(self):
+        """Waits for palette changes to be saved before pausing."""
+        if self.screen_manager.has_screen('palettes'):
+            knspace.palettes_screen.palettes.flush()
+        if tracer.enabled:
+            self.write_trace()
+        return super(ColorsTKApp, self).on_pause()
+
+    def on_stop(self):
+        """Saves palette changes, closes the palette store, and writes
+        the trace if tracing is on."""
+        if self.screen_manager.has_screen('palettes'):
+            knspace.palettes_screen.palettes.close()
+        if tracer.enabled:
+            self.write_trace()
+
     def get_application_config(self):
         """Returns the path to the application configuration file."""
         config_path = join(self.user_data_dir, '%(appname)s.ini')
@@ -1,30 +1,46 @@
 """Implements saving and loading colors."""
 
+from collections import deque, OrderedDict
+import functools
 from os.path import join
 
 from kivy.app import App
-from kivy.clock import Clock
+from kivy.clock import Clock, mainthread
 from kivy.factory import Factory
 from kivy.garden.iconfonts import icon
+from kivy.graphics.texture import Texture
+from kivy.logger import Logger
+from kivy.metrics import dp
 from kivy.properties import (BooleanProperty,
                              ListProperty,
+                             NumericProperty,
+                             ObjectProperty,
                              StringProperty)
-from kivy.storage.jsonstore import JsonStore
 from kivy.uix.actionbar import ActionButton
-from kivy.uix.behaviors.compoundselection import CompoundSelectionBehavior
 from kivy.uix.behaviors.knspace import knspace, KNSpaceBehavior
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.popup import Popup
+from kivy.uix.recyclegridlayout import RecycleGridLayout
+from kivy.uix.recycleview.layout import LayoutSelectionBehavior
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.uix.screenmanager import Screen
-from kivy.uix.stacklayout import StackLayout
 from kivy.uix.widget import Widget
 
+try:
+    from core import dedupe, packed, previews, similarity, store
+    from core.profiling import tracer
+except ImportError:
+    from colorstk.core import dedupe, packed, previews, similarity, store
+    from colorstk.core.profiling import tracer
+
 
 class PalettesScreen(KNSpaceBehavior, BoxLayout, Screen):
     """A `Screen` for creating and displaying color palettes."""
 
     mode = StringProperty()
+    # Number of preview textures kept for scrolling back
+    preview_textures = 256
 
     def __init__(self, **kwargs):
         """Initializes a `PalettesScreen` and loads saved palettes."""
@@ -36,12 +52,30 @@ class PalettesScreen(KNSpaceBehavior, BoxLayout, Screen):
             text='%s'%icon('icon_delete'),
             font_size='20dp', color=[1, 0, 0, 1],
             markup=True, on_release=self.delete_palette)
-        user_data_dir = App.get_running_app().user_data_dir
-        self.palettes = JsonStore(join(user_data_dir, 'palettes.json'))
-
-        for palette in self.palettes:
-            self.ids.palette_stack.add_widget(Palette(
-                name=palette, colors=self.palettes[palette]['colors']))
+        self.merge_button = ActionButton(
+            text='Merge', font_size='15dp',
+            on_release=lambda button: MergePalettesPopup(
+                names=self.selected_names()).open())
+        app = App.get_running_app()
+        user_data_dir = app.user_data_dir
+        # Palettes of older versions are migrated from palettes.json,
+        # and changes are saved on a writer thread
+        with app.profiler.phase('store load'):
+            self.palettes = store.open_store(user_data_dir, background=True)
+            summaries = self.palettes.summaries()
+        # Built on first use by a `ColorIndexBuilder`, then kept up to
+        # date with changes
+        self.color_index = None
+        self.index_builder = None
+        # Previews are rendered once and cached between runs
+        self.previews = previews.PreviewCache(
+            join(user_data_dir, 'previews'), int(dp(150)), int(dp(100)))
+        self.textures = OrderedDict()
+
+        # Only the visible palettes get a `Palette` view, and only
+        # their index entries are read
+        self.ids.palette_view.data = [
+            palette_data(summary) for summary in summaries]
 
     def on_mode(self, instance, mode):
         """Sets the action bar properties to match the mode."""
@@ -60,6 +94,7 @@ class PalettesScreen(KNSpaceBehavior, BoxLayout, Screen):
             action_previous.app_icon = ''
             action_previous.with_previous = True
             action_view.remove_widget(self.new_button)
+            action_view.add_widget(self.merge_button)
             action_view.add_widget(self.delete_button)
 
     def previous(self):
@@ -70,22 +105,293 @@ class PalettesScreen(KNSpaceBehavior, BoxLayout, Screen):
             App.get_running_app().root.current = 'lookup'
             self.mode = 'normal'
         elif self.mode == 'selection':
-            self.ids.palette_stack.clear_selection()
+            self.ids.palette_grid.clear_selection()
+            self.ids.action_view.remove_widget(self.merge_button)
             self.ids.action_view.remove_widget(self.delete_button)
             self.ids.action_view.add_widget(self.new_button)
             self.mode = 'normal'
 
+    def selected_names(self):
+        """Returns the names of the selected palettes, in order."""
+        data = self.ids.palette_view.data
+        return [data[index]['name']
+                for index in sorted(self.ids.palette_grid.selected_nodes)]
+
+    def get_color_index(self):
+        """Returns the `similarity.ColorIndex` of all palettes, or None
+        if it is not built yet.
+
+        The index is built by a `ColorIndexBuilder` on first use, and
+        again if the white point of the `LookupScreen` changed.  The
+        info tab of the `LookupScreen` is refreshed once it is ready.
+
+        """
+        white_point = tuple(float(val)
+                            for val in knspace.lookup_screen.white_point)
+        if (self.color_index is not None and
+                self.color_index.white_point == white_point):
+            return self.color_index
+        builder = self.index_builder
+        if builder is None or builder.white_point != white_point:
+            if builder is not None:
+                builder.cancel()
+            self.color_index = None
+            self.index_builder = ColorIndexBuilder(
+                self.palettes, white_point, self.color_index_built)
+            # Calls back at once if there are no colors to read
+            self.index_builder.start()
+        return self.color_index
+
+    def color_index_built(self, color_index):
+        """Keeps the index of the `ColorIndexBuilder`, or None if it
+        failed."""
+        self.index_builder = None
+        if color_index is None:
+            return
+        self.color_index = color_index
+        lookup_screen = knspace.lookup_screen
+        lookup_screen.dirty.add('info')
+        lookup_screen.trigger_refresh()
+
+    def update_color_index(self, method, *args):
+        """Calls a method of the `similarity.ColorIndex` to match a
+        change of the palettes, also while the index is built."""
+        if self.color_index is not None:
+            getattr(self.color_index, method)(*args)
+        elif self.index_builder is not None:
+            self.index_builder.change(method, *args)
+
+    def preview_texture(self, preview):
+        """Returns a texture of the preview of a palette.
+
+        Textures are keyed by the preview colors, so a preview is only
+        rendered again when its colors change, and kept while it is
+        among the most recently used.
+
+        """
+        key = self.previews.key(preview)
+        texture = self.textures.pop(key, None)
+        if texture is None:
+            tracer.count('rebuild: preview texture')
+            texture = Texture.create(
+                size=(self.previews.width, self.previews.height),
+                colorfmt='rgba')
+            texture.blit_buffer(self.previews.get(preview, key),
+                                colorfmt='rgba', bufferfmt='ubyte')
+        self.textures[key] = texture
+        while len(self.textures) > self.preview_textures:
+            self.textures.popitem(last=False)
+        return texture
+
+    def refresh_palette(self, name):
+        """Updates the view data of a palette after its colors changed."""
+        data = self.ids.palette_view.data
+        for index, palette in enumerate(data):
+            if palette['name'] == name:
+                data[index] = palette_data(self.palettes.summary(name))
+                break
+
+    @tracer.traced()
+    def add_palette(self, name):
+        """Creates an empty palette and adds it to the end."""
+        self.palettes.create(name)
+        self.ids.palette_view.data.append(
+            palette_data(self.palettes.summary(name)))
+
+    @tracer.traced()
+    def add_color(self, name, color):
+        """Adds a color to the end of a palette, saving only that color."""
+        self.palettes.append_colors(name, [color])
+        self.update_color_index('add', name, [color])
+        self.refresh_palette(name)
+
+    @tracer.traced()
+    def merge_palettes(self, names, target, dry_run=False):
+        """Merges palettes into one without near-duplicate colors.
+
+        Args:
+            names: The names of the palettes to merge.
+            target: The name of the palette to save the colors to, one
+                of `names` or a new palette.
+            dry_run: If True, only finds what the merge would change.
+                Defaults to False.
+
+        Returns:
+            The `dedupe.DedupeResult` of the merge.
+
+        Raises:
+            ValueError: If the target is a palette that is not merged.
+
+        """
+        result = dedupe.merge_palettes(
+            self.palettes, names, target, dry_run=dry_run,
+            white_point=knspace.lookup_screen.white_point)
+        if dry_run:
+            return result
+        # The selection holds indices of the data it replaces
+        self.previous()
+        palette_view = self.ids.palette_view
+        palette_view.data = [palette for palette in palette_view.data
+                             if palette['name'] not in result.merged]
+        if target in names:
+            self.refresh_palette(target)
+        else:
+            palette_view.data.append(
+                palette_data(self.palettes.summary(target)))
+        for name in result.merged:
+            self.update_color_index('remove_palette', name)
+        self.update_color_index('set_colors', target, result.colors)
+        return result
+
+    @tracer.traced()
     def delete_palette(self, button=None):
-        """Removes and deletes a `Palettes` and its colors."""
-        for palette in self.ids.palette_stack.selected_nodes:
-            self.ids.palette_stack.remove_widget(palette)
-            self.palettes.delete(palette.name)
-        self.ids.palette_stack.clear_selection()
+        """Removes and deletes the selected palettes and their colors."""
+        palette_view = self.ids.palette_view
+        selected = set(self.ids.palette_grid.selected_nodes)
+        self.ids.palette_grid.clear_selection()
+        with self.palettes.transaction():
+            for index in selected:
+                name = palette_view.data[index]['name']
+                self.palettes.delete(name)
+                self.update_color_index('remove_palette', name)
+        palette_view.data = [palette for index, palette
+                             in enumerate(palette_view.data)
+                             if index not in selected]
+        self.ids.action_view.remove_widget(self.merge_button)
         self.ids.action_view.remove_widget(self.delete_button)
         self.ids.action_view.add_widget(self.new_button)
         self.mode = 'normal'
 
 
+def palette_data(summary):
+    """Returns the view data of a `Palette` from a `PaletteSummary`."""
+    return {'name': summary.name, 'preview': summary.preview,
+            'color_count': summary.color_count}
+
+
+class ColorIndexBuilder(object):
+    """Builds a `similarity.ColorIndex` of all palettes of a store.
+
+    Colors are read and indexed on the writer thread of the store in
+    chunks of about `chunk_size` colors.  The next chunk is requested
+    from the UI thread once the last one is done, so other reads of the
+    store are answered in between.  Changes of the palettes made
+    meanwhile are passed to `change`, and applied to the index unless
+    the palette is read after them.
+
+    """
+
+    # Number of colors read at a time
+    chunk_size = 65536
+
+    def __init__(self, palettes, white_point, callback):
+        """Starts building an index.
+
+        Args:
+            palettes: The `store.PaletteStore` of the palettes.
+            white_point: The white reference for CIE-LAB.
+            callback: A callable called with the index once it is
+                built, or None if it failed.
+
+        """
+        self.palettes = palettes
+        self.index = similarity.ColorIndex(white_point)
+        self.white_point = self.index.white_point
+        self.callback = callback
+        self.cancelled = False
+        # Palettes not read yet, the palette partly read and the index
+        # of its next color, and whether it changed since
+        self._unread = deque(palettes.names())
+        self._partial = None
+        self._restart = False
+        self._changes = []
+
+    def start(self):
+        """Requests the first chunk of colors."""
+        self._request_chunk()
+
+    def change(self, method, *args):
+        """Records a call of a `similarity.ColorIndex` method matching a
+        change of the palette named by the first argument."""
+        name = args[0]
+        if self._partial is not None and self._partial[0] == name:
+            # Read again from the start
+            self._restart = True
+        elif name not in self._unread:
+            self._changes.append((method, args))
+
+    def cancel(self):
+        """Stops building the index."""
+        self.cancelled = True
+
+    def _request_chunk(self):
+        if self._restart:
+            name = self._partial[0]
+            self.index.remove_palette(name)
+            self._partial = (name, 0)
+            self._restart = False
+        segments = []
+        size = 0
+        while size < self.chunk_size and (self._partial or self._unread):
+            if self._partial is not None:
+                name, start = self._partial
+                self._partial = None
+            else:
+                name, start = self._unread.popleft(), 0
+            if name not in self.palettes:
+                continue
+            count = self.palettes.summary(name).color_count
+            stop = min(count, start + self.chunk_size - size)
+            segments.append((name, start, stop))
+            size += stop - start
+            if stop < count:
+                self._partial = (name, stop)
+        if not segments:
+            for method, args in self._changes:
+                getattr(self.index, method)(*args)
+            self.callback(self.index)
+            return
+        last = self._partial is None and not self._unread
+        self.palettes.read_later(
+            functools.partial(self._read, segments, last), self._chunk_read)
+
+    def _read(self, segments, last, backend):
+        """Indexes colors of palettes on the writer thread."""
+        for name, start, stop in segments:
+            self.index.add(name, list(backend.iter_colors(name, start,
+                                                          stop)))
+        if last:
+            # Builds the grid here instead of on the first query
+            self.index.update()
+
+    @mainthread
+    def _chunk_read(self, result, error):
+        if self.cancelled:
+            return
+        if error is not None:
+            Logger.warning('Palettes: color index not built: {}'.format(
+                error))
+            self.callback(None)
+            return
+        self._request_chunk()
+
+
+def color_texture(colors):
+    """Returns a texture with one texel per color, or None if the colors
+    do not fit in a texture."""
+    tracer.count('rebuild: color texture')
+    texels = previews.color_texels(colors)
+    rows, columns = texels.shape[:2]
+    if rows > previews.TEXEL_ROW:
+        return None
+    texture = Texture.create(size=(columns, rows), colorfmt='rgba')
+    # Views sample the middle of their texel
+    texture.mag_filter = 'nearest'
+    texture.min_filter = 'nearest'
+    texture.blit_buffer(texels.tobytes(), colorfmt='rgba', bufferfmt='ubyte')
+    return texture
+
+
 class ColorsScreen(KNSpaceBehavior, BoxLayout, Screen):
     """A `Screen` for displaying the colors in a `Palette`."""
 
@@ -93,6 +399,9 @@ class ColorsScreen(KNSpaceBehavior, BoxLayout, Screen):
 
     def __init__(self, **kwargs):
         super(ColorsScreen, self).__init__(**kwargs)
+        self.palette_name = None
+        self.colors = []
+        self.texture = None
         self.menu_icon = self.ids.action_previous.app_icon
         self.mode = 'normal'
         self.delete_button = ActionButton(
@@ -101,8 +410,10 @@ class ColorsScreen(KNSpaceBehavior, BoxLayout, Screen):
             markup=True, on_release=self.delete_color)
 
     def on_leave(self):
-        self.palette = None
-        self.ids.color_stack.clear_widgets()
+        self.palette_name = None
+        self.ids.color_view.data = []
+        self.colors = []
+        self.texture = None
 
     def on_mode(self, instance, mode):
         """Sets the action bar properties to match the mode."""
@@ -121,55 +432,103 @@ class ColorsScreen(KNSpaceBehavior, BoxLayout, Screen):
         if self.mode == 'normal':
             App.get_running_app().root.current = 'palettes'
         elif self.mode == 'selection':
-            self.ids.color_stack.clear_selection()
+            self.ids.color_grid.clear_selection()
             self.ids.action_view.remove_widget(self.delete_button)
             self.mode = 'normal'
 
-    def load_colors(self, palette):
-        """Loads the colors from a `Palette` to the screen.
+    @tracer.traced()
+    def load_colors(self, name):
+        """Loads the colors of a palette to the screen.
+
+        The colors are read from the palette store only when the
+        palette is opened, from a memory-mapped file for large palettes.
+        Only the visible colors get a `PaletteColor` view, which draws
+        its color from a texel of one texture of all colors.
 
         Args:
-            palette: A `Palette` to load colors from.
+            name: The name of the palette to load colors from.
 
         """
-        self.palette = palette
-        for color in palette.colors:
-            self.ids.color_stack.add_widget(PaletteColor(color=color))
-
+        self.palette_name = name
+        self.show_colors(
+            knspace.palettes_screen.palettes.packed_colors(name))
+
+    def show_colors(self, colors):
+        """Shows colors loaded with `load_colors`, or changed since."""
+        self.colors = colors
+        self.texture = color_texture(colors)
+        # Views read their color by index, so the data can share one
+        # empty dict instead of holding a dict per color
+        self.ids.color_view.data = [{}] * len(colors)
+
+    @tracer.traced()
     def delete_color(self, button=None):
-        """Deletes a color from its palette and removes it."""
-        color_stack = self.ids.color_stack
-        for color_widget in color_stack.selected_nodes:
-            color_stack.remove_widget(color_widget)
-            self.palette.colors.remove(color_widget.color)
-        color_stack.clear_selection()
+        """Deletes the selected colors from their palette.
+
+        The shown colors are changed in memory, while the store saves
+        the change in the background.
+
+        """
+        selected = sorted(self.ids.color_grid.selected_nodes)
+        self.ids.color_grid.clear_selection()
+        palettes_screen = knspace.palettes_screen
+        colors = [self.colors[index] for index in selected]
+        # Removed by index, since palettes may hold equal colors
+        palettes_screen.palettes.remove_indices(self.palette_name, selected)
+        palettes_screen.update_color_index('remove', self.palette_name,
+                                           colors)
+        palettes_screen.refresh_palette(self.palette_name)
+        if isinstance(self.colors, packed.PackedColors):
+            self.show_colors(self.colors.without(selected))
+        else:
+            removed = set(selected)
+            self.show_colors([color for index, color
+                              in enumerate(self.colors)
+                              if index not in removed])
         self.ids.action_view.remove_widget(self.delete_button)
         self.mode = 'normal'
 
 
-class SelectableStack(CompoundSelectionBehavior, StackLayout):
-    """A `StackLayout` that allows selecting its children."""
+class SelectableRecycleGrid(LayoutSelectionBehavior, RecycleGridLayout):
+    """A `RecycleGridLayout` that allows selecting its views.
+
+    Nodes are indexes in the data of the `RecycleView`, so selections
+    are kept for views that are scrolled out and recycled.
+
+    """
 
     drag_mode = StringProperty()
 
     def select_node(self, node):
-        node.selected = True
         self.drag_mode = 'select'
-        return super(SelectableStack, self).select_node(node)
+        return super(SelectableRecycleGrid, self).select_node(node)
 
     def deselect_node(self, node):
-        node.selected = False
         self.drag_mode = 'deselect'
-        super(SelectableStack, self).deselect_node(node)
+        super(SelectableRecycleGrid, self).deselect_node(node)
 
 
-class Palette(GridLayout):
-    """Stores colors and displays a preview of them."""
+class Palette(RecycleDataViewBehavior, GridLayout):
+    """Displays a palette with a preview of its first colors."""
 
+    index = NumericProperty()
     name = StringProperty()
-    colors = ListProperty()
+    preview = ListProperty()
+    color_count = NumericProperty()
+    texture = ObjectProperty(None, allownone=True)
     selected = BooleanProperty(False)
 
+    def refresh_view_attrs(self, rv, index, data):
+        """Keeps the index of the data the view is showing, and draws
+        the preview from a texture of its colors."""
+        self.index = index
+        self.texture = knspace.palettes_screen.preview_texture(
+            data['preview'])
+        return super(Palette, self).refresh_view_attrs(rv, index, data)
+
+    def apply_selection(self, rv, index, is_selected):
+        self.selected = is_selected
+
     def on_touch_down(self, touch):
         """Selects `self` if in selection mode."""
         if self.collide_point(*touch.pos):
@@ -178,7 +537,7 @@ class Palette(GridLayout):
                 clock_event = Clock.schedule_once(self.trigger_selection, 1)
                 touch.ud['trigger_selection'] = clock_event
             elif knspace.palettes_screen.mode == 'selection':
-                self.parent.select_with_touch(self, touch)
+                self.parent.select_with_touch(self.index, touch)
 
     def on_touch_move(self, touch):
         """Selects or deselects `self` when dragging."""
@@ -189,20 +548,21 @@ class Palette(GridLayout):
         if knspace.palettes_screen.mode == 'selection':
             if touch.grab_current is not self and self.collide_point(*touch.pos):
                 if not self.selected and self.parent.drag_mode == 'select':
-                    self.parent.select_with_touch(self, touch)
+                    self.parent.select_with_touch(self.index, touch)
                 elif self.selected and self.parent.drag_mode == 'deselect':
-                    self.parent.select_with_touch(self, touch)
+                    self.parent.select_with_touch(self.index, touch)
 
     def on_touch_up(self, touch):
         """Adds color if in add mode, or loads colors if in normal."""
         Clock.unschedule(touch.ud.get('trigger_selection'))
         if touch.grab_current is self and self.collide_point(*touch.pos):
             if knspace.palettes_screen.mode == 'normal':
-                screen_manager = App.get_running_app().root
-                knspace.colors_screen.load_colors(self)
-                screen_manager.current = 'colors'
+                app = App.get_running_app()
+                app.load_screen('colors').load_colors(self.name)
+                app.root.current = 'colors'
             elif knspace.palettes_screen.mode == 'add':
-                self.colors.append(list(knspace.lookup_screen.color.rgb))
+                knspace.palettes_screen.add_color(
+                    self.name, list(knspace.lookup_screen.color.rgb))
                 knspace.palettes_screen.mode = 'normal'
         # Return to normal mode if no palettes are selected
         elif knspace.palettes_screen.mode == 'selection':
@@ -210,9 +570,6 @@ class Palette(GridLayout):
                 knspace.palettes_screen.previous()
         touch.ungrab(self)
 
-    def on_colors(self, instance, colors):
-        knspace.palettes_screen.palettes.put(self.name, colors=colors)
-
     def on_selected(self, instance, selected):
         """Changes appearance based on selection status."""
         if selected:
@@ -223,15 +580,34 @@ class Palette(GridLayout):
     def trigger_selection(self, dt):
         """Triggers the `PalettesScreen` selection mode."""
         knspace.palettes_screen.mode = 'selection'
-        self.parent.select_with_touch(self)
+        self.parent.select_with_touch(self.index)
 
 
-class PaletteColor(Widget):
+class PaletteColor(RecycleDataViewBehavior, Widget):
     """Represents a color in a `Palette`."""
 
-    color = ListProperty()
+    index = NumericProperty()
+    color = ListProperty([0, 0, 0])
+    texture = ObjectProperty(None, allownone=True)
+    tex_coords = ListProperty([0, 0, 1, 0, 1, 1, 0, 1])
     selected = BooleanProperty(False)
 
+    def refresh_view_attrs(self, rv, index, data):
+        """Shows the texel of the color at the index in the texture of
+        the `ColorsScreen`, or reads the color if there is none."""
+        colors_screen = knspace.colors_screen
+        self.index = index
+        self.texture = colors_screen.texture
+        if self.texture is None:
+            self.color = colors_screen.colors[index]
+        else:
+            self.tex_coords = previews.texel_coords(index,
+                                                    *self.texture.size)
+        return super(PaletteColor, self).refresh_view_attrs(rv, index, data)
+
+    def apply_selection(self, rv, index, is_selected):
+        self.selected = is_selected
+
     def on_touch_down(self, touch):
         """Selects `self` if in selection mode."""
         if self.collide_point(*touch.pos):
@@ -240,7 +616,7 @@ class PaletteColor(Widget):
                 clock_event = Clock.schedule_once(self.trigger_selection, 1)
                 touch.ud['trigger_selection'] = clock_event
             elif knspace.colors_screen.mode == 'selection':
-                self.parent.select_with_touch(self, touch)
+                self.parent.select_with_touch(self.index, touch)
 
     def on_touch_move(self, touch):
         """Selects or deselects `self` when dragging."""
@@ -251,9 +627,9 @@ class PaletteColor(Widget):
         if knspace.colors_screen.mode == 'selection':
             if touch.grab_current is not self and self.collide_point(*touch.pos):
                 if not self.selected and self.parent.drag_mode == 'select':
-                    self.parent.select_with_touch(self, touch)
+                    self.parent.select_with_touch(self.index, touch)
                 elif self.selected and self.parent.drag_mode == 'deselect':
-                    self.parent.select_with_touch(self, touch)
+                    self.parent.select_with_touch(self.index, touch)
 
     def on_touch_up(self, touch):
         """Switches to the color if in normal mode."""
@@ -261,7 +637,8 @@ class PaletteColor(Widget):
         if touch.grab_current is self and self.collide_point(*touch.pos):
             if knspace.colors_screen.mode == 'normal':
                 screen_manager = App.get_running_app().root
-                knspace.lookup_screen.set_color(self.color)
+                knspace.lookup_screen.set_color(
+                    knspace.colors_screen.colors[self.index])
                 screen_manager.current = 'lookup'
         # Return to normal mode if no colors are selected
         elif knspace.colors_screen.mode == 'selection':
@@ -281,7 +658,7 @@ class PaletteColor(Widget):
     def trigger_selection(self, dt):
         """Triggers the `ColorsScreen` selection mode."""
         knspace.colors_screen.mode = 'selection'
-        self.parent.select_with_touch(self)
+        self.parent.select_with_touch(self.index)
 
 
 class NewPalettePopup(Popup):
@@ -296,11 +673,33 @@ class NewPalettePopup(Popup):
     def add_palette(self, name_input):
         """Creates and adds a new `Palette` to the `PalettesScreen`."""
         if name_input.text not in knspace.palettes_screen.palettes:
-            knspace.palettes_screen.palettes.put(
-                name_input.text, colors=[])
-            knspace.palettes_screen.ids.palette_stack.add_widget(
-                Palette(name=name_input.text))
+            knspace.palettes_screen.add_palette(name_input.text)
             self.dismiss()
         else:
             self.title = 'Palette already exists!'
             self.title_color = [1, 0, 0, 1]
+
+
+class MergePalettesPopup(Popup):
+    """A `Popup` that shows the near-duplicate colors that merging the
+    selected palettes removes, and merges them into a named palette."""
+
+    names = ListProperty()
+
+    def on_open(self):
+        """Finds what the merge would change with a dry run."""
+        self.ids.name_input.text = self.names[0]
+        result = knspace.palettes_screen.merge_palettes(
+            self.names, self.names[0], dry_run=True)
+        self.ids.report.text = dedupe.format_report([result])
+
+    def merge(self):
+        """Merges the palettes into the palette named in the input."""
+        try:
+            knspace.palettes_screen.merge_palettes(
+                self.names, self.ids.name_input.text)
+        except ValueError:
+            self.title = 'Palette already exists!'
+            self.title_color = [1, 0, 0, 1]
+        else:
+            self.dismiss()
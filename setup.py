@@ -49,11 +49,12 @@ setup(
     author_email='branpx@gmail.com',
     url='http://github.com/branpx/colorstk',
     license='MIT',
-    packages=['colorstk'],
+    packages=['colorstk', 'colorstk.core'],
     package_data={'colorstk': ['data/*', '*.kv']},
     exclude_package_data={'colorstk': ['data/svg/*']},
-    install_requires=['kivy', 'kivy-garden', 'grapefruit'],
+    install_requires=['kivy', 'kivy-garden', 'grapefruit', 'numpy'],
     dependency_links=['git+http://github.com/xav/grapefruit.git'],
-    entry_points={'gui_scripts': ['colorstk=colorstk.main:main']},
+    entry_points={'gui_scripts': ['colorstk=colorstk.main:main'],
+                  'console_scripts': ['colorstk-convert=colorstk.cli:main']},
     cmdclass={'develop': PostDevelop, 'install': PostInstall}
     )
@@ -0,0 +1,89 @@
+"""Tests removing near-duplicate colors."""
+
+from os.path import join
+
+import numpy as np
+import pytest
+
+from colorstk.core import dedupe, store
+from colorstk.core.batch import rgb_to_cielab
+
+
+def brute_force(rgb, alphas, tolerance):
+    """Returns the kept color each color duplicates, or -1."""
+    lab = rgb_to_cielab(rgb)
+    kept = []
+    originals = []
+    for index in range(len(lab)):
+        candidates = [other for other in kept
+                      if alphas[other] == alphas[index]]
+        if candidates:
+            dists = np.sqrt(((lab[candidates] - lab[index]) ** 2).sum(
+                axis=1))
+            nearest = int(dists.argmin())
+            if dists[nearest] <= tolerance:
+                originals.append(candidates[nearest])
+                continue
+        kept.append(index)
+        originals.append(-1)
+    return originals
+
+
+@pytest.fixture
+def palettes(tmp_path):
+    palette_store = store.SQLitePaletteStore(
+        join(str(tmp_path), store.DATABASE_NAME))
+    yield palette_store
+    palette_store.close()
+
+
+@pytest.mark.parametrize('tolerance', [0.0, 1.0, 2.3, 10.0])
+def test_find_duplicates_matches_brute_force(tolerance):
+    random = np.random.RandomState(0)
+    # Coarse values make equal and near colors likely
+    rgb = np.round(random.random_sample((3000, 3)) * 20) / 20
+    alphas = np.where(random.random_sample(3000) < 0.2, 0.5, np.nan)
+    colors = [list(color) + ([alpha] if alpha == alpha else [])
+              for color, alpha in zip(rgb.tolist(), alphas.tolist())]
+    originals, distances = dedupe.find_duplicates(colors, tolerance)
+    assert originals.tolist() == brute_force(
+        rgb, np.nan_to_num(alphas, nan=-1.0), tolerance)
+    assert (distances <= tolerance + 1e-9).all()
+    assert (distances[originals == -1] == 0).all()
+
+
+def test_find_duplicates_empty():
+    originals, distances = dedupe.find_duplicates([])
+    assert len(originals) == 0 and len(distances) == 0
+
+
+def test_dedupe_palettes(palettes):
+    palettes.create('a', [[1.0, 0.0, 0.0], [0.999, 0.0, 0.0],
+                          [0.0, 0.0, 1.0], [1.0, 0.0, 0.0, 0.5]])
+    palettes.create('b', [[0.0, 1.0, 0.0]])
+    results = dedupe.dedupe_palettes(palettes, dry_run=True)
+    assert palettes.summary('a').color_count == 4
+    assert [result.palette for result in results] == ['a']
+    duplicate, = results[0].duplicates
+    assert (duplicate.palette, duplicate.index, duplicate.original) == (
+        'a', 1, [1.0, 0.0, 0.0])
+    dedupe.dedupe_palettes(palettes)
+    assert palettes.get_colors('a') == [[1.0, 0.0, 0.0], [0.0, 0.0, 1.0],
+                                        [1.0, 0.0, 0.0, 0.5]]
+    assert palettes.get_colors('b') == [[0.0, 1.0, 0.0]]
+
+
+def test_merge_palettes(palettes):
+    palettes.create('a', [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+    palettes.create('b', [[0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+    palettes.create('c', [[1.0, 1.0, 1.0]])
+    with pytest.raises(ValueError):
+        dedupe.merge_palettes(palettes, ['a', 'b'], 'c')
+    result = dedupe.merge_palettes(palettes, ['a', 'b'], 'b')
+    assert result.merged == ['a']
+    assert palettes.names() == ['b', 'c']
+    assert palettes.get_colors('b') == [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0],
+                                        [0.0, 0.0, 1.0]]
+    dedupe.merge_palettes(palettes, ['b', 'c'], 'all')
+    assert palettes.names() == ['all']
+    assert palettes.summary('all').color_count == 4
@@ -0,0 +1,119 @@
+"""Tests the palette stores, their transactions and rollback."""
+
+from os.path import join
+
+import pytest
+
+from colorstk.core import store
+
+RED = [1.0, 0.0, 0.0]
+GREEN = [0.0, 1.0, 0.0]
+BLUE = [0.0, 0.0, 1.0]
+
+
+@pytest.fixture(params=['sqlite', 'background'])
+def palettes(request, tmp_path):
+    path = join(str(tmp_path), store.DATABASE_NAME)
+    if request.param == 'sqlite':
+        palette_store = store.SQLitePaletteStore(path)
+    else:
+        palette_store = store.BackgroundPaletteStore(
+            lambda: store.SQLitePaletteStore(path))
+    yield palette_store
+    palette_store.close()
+
+
+def saved(tmp_path):
+    """Returns the names and colors of the palettes in the database."""
+    palette_store = store.SQLitePaletteStore(
+        join(str(tmp_path), store.DATABASE_NAME))
+    try:
+        return {name: palette_store.get_colors(name)
+                for name in palette_store.names()}
+    finally:
+        palette_store.close()
+
+
+def test_changes(palettes):
+    palettes.create('a', [RED, GREEN])
+    palettes.append_colors('a', [BLUE, RED])
+    palettes.remove_colors('a', [RED])
+    assert palettes.get_colors('a') == [GREEN, BLUE, RED]
+    palettes.set_colors('a', [BLUE])
+    assert palettes.summary('a').color_count == 1
+    palettes.create('b')
+    assert palettes.names() == ['a', 'b']
+    palettes.delete('a')
+    assert 'a' not in palettes
+    with pytest.raises(KeyError):
+        palettes.get_colors('a')
+    with pytest.raises(ValueError):
+        palettes.create('b')
+
+
+def test_remove_indices(palettes):
+    palettes.create('a', [RED, GREEN, RED, BLUE, RED])
+    palettes.remove_indices('a', [4, 2, 2])
+    assert palettes.get_colors('a') == [RED, GREEN, BLUE]
+    assert list(palettes.iter_colors('a', 1, 2)) == [GREEN]
+    with pytest.raises(IndexError):
+        palettes.remove_indices('a', [3])
+    assert palettes.get_colors('a') == [RED, GREEN, BLUE]
+
+
+def test_transaction_saves_changes(palettes, tmp_path):
+    with palettes.transaction():
+        palettes.create('a', [RED])
+        palettes.append_colors('a', [GREEN])
+        palettes.create('b', [BLUE])
+    palettes.flush()
+    assert saved(tmp_path) == {'a': [RED, GREEN], 'b': [BLUE]}
+
+
+def test_transaction_rollback(palettes, tmp_path):
+    palettes.create('a', [RED])
+    with pytest.raises(RuntimeError):
+        with palettes.transaction():
+            palettes.append_colors('a', [GREEN])
+            palettes.delete('a')
+            palettes.create('b', [BLUE])
+            raise RuntimeError
+    assert palettes.names() == ['a']
+    assert palettes.get_colors('a') == [RED]
+    palettes.flush()
+    assert saved(tmp_path) == {'a': [RED]}
+
+
+def test_nested_transaction_rollback(palettes, tmp_path):
+    palettes.create('a', [RED])
+    with palettes.transaction():
+        palettes.append_colors('a', [GREEN])
+        with pytest.raises(RuntimeError):
+            with palettes.transaction():
+                palettes.remove_indices('a', [0])
+                palettes.create('b', [BLUE])
+                raise RuntimeError
+        palettes.create('c', [BLUE])
+    assert palettes.names() == ['a', 'c']
+    assert palettes.get_colors('a') == [RED, GREEN]
+    palettes.flush()
+    assert saved(tmp_path) == {'a': [RED, GREEN], 'c': [BLUE]}
+
+
+def test_background_read_later(tmp_path):
+    path = join(str(tmp_path), store.DATABASE_NAME)
+    palettes = store.BackgroundPaletteStore(
+        lambda: store.SQLitePaletteStore(path))
+    results = []
+    try:
+        palettes.create('a', [RED, GREEN])
+        palettes.read_later(lambda backend: backend.get_colors('a'),
+                            lambda *args: results.append(args))
+        palettes.read_later(lambda backend: backend.get_colors('b'),
+                            lambda *args: results.append(args))
+        palettes.flush()
+    finally:
+        palettes.close()
+    assert results[0] == ([RED, GREEN], None)
+    assert results[1][0] is None
+    assert isinstance(results[1][1], KeyError)
@@ -0,0 +1,146 @@
+"""Tests reading and writing swatch files."""
+
+import io
+from os.path import join
+import struct
+
+import pytest
+
+from colorstk.core import store, swatches
+
+
+def read(data, swatch_format, name='Imported'):
+    return list(swatches.read_swatches(io.BytesIO(data), swatch_format,
+                                       name))
+
+
+def approx(swatch_list):
+    return [(name, None if color is None else pytest.approx(color, abs=1e-3))
+            for name, color in swatch_list]
+
+
+def ase_block(block_type, data):
+    return struct.pack('>HI', block_type, len(data)) + data
+
+
+def ase_string(string):
+    return struct.pack('>H', len(string) + 1) + (
+        string + '\0').encode('utf-16-be')
+
+
+def test_gpl():
+    data = (b'GIMP Palette\nName: Warm\nColumns: 2\n#\n'
+            b'255   0   0\tred\n# comment\n\n  0 128 255\n')
+    assert read(data, 'gpl') == [
+        ('Warm', None), ('Warm', [1.0, 0.0, 0.0]),
+        ('Warm', [0.0, 128 / 255.0, 1.0])]
+
+
+def test_gpl_rgba_and_errors():
+    data = b'GIMP Palette\nChannels: RGBA\n255 255 255 0\n'
+    assert read(data, 'gpl') == [('Imported', None),
+                                 ('Imported', [1.0, 1.0, 1.0, 0.0])]
+    assert read(b'GIMP Palette\nName: Empty\n', 'gpl') == [('Empty', None)]
+    with pytest.raises(ValueError):
+        read(b'Not a palette\n', 'gpl')
+    with pytest.raises(ValueError):
+        read(b'GIMP Palette\n255 0\n', 'gpl')
+
+
+def test_ase():
+    blocks = [
+        ase_block(0xC001, ase_string('Group')),
+        ase_block(0x0001, ase_string('red') + b'RGB ' +
+                  struct.pack('>3fH', 1.0, 0.0, 0.0, 2)),
+        ase_block(0x0001, ase_string('gray') + b'Gray' +
+                  struct.pack('>fH', 0.5, 2)),
+        ase_block(0x0001, ase_string('white') + b'LAB ' +
+                  struct.pack('>3fH', 1.0, 0.0, 0.0, 2)),
+        ase_block(0xC002, b''),
+        ase_block(0x0001, ase_string('black') + b'CMYK' +
+                  struct.pack('>4fH', 0.0, 0.0, 0.0, 1.0, 2)),
+    ]
+    data = b'ASEF' + struct.pack('>HHI', 1, 0, len(blocks)) + b''.join(
+        blocks)
+    assert read(data, 'ase') == approx([
+        ('Group', None), ('Group', [1.0, 0.0, 0.0]),
+        ('Group', [0.5, 0.5, 0.5]), ('Group', [1.0, 1.0, 1.0]),
+        ('Imported', None), ('Imported', [0.0, 0.0, 0.0])])
+    with pytest.raises(ValueError):
+        read(data[:-4], 'ase')
+
+
+def test_aco():
+    colors = [(0, 65535, 0, 0, 0), (8, 5000, 0, 0, 0),
+              # CIE-LAB white, with a and b as signed values
+              (7, 10000, 0, 0, 0),
+              (7, 5000) + struct.unpack('>2H', struct.pack('>2h', -1, 1)) +
+              (0,)]
+    data = struct.pack('>HH', 1, len(colors)) + b''.join(
+        struct.pack('>5H', *color) for color in colors)
+    result = read(data, 'aco', 'Photo')
+    assert result[:4] == approx([
+        ('Photo', None), ('Photo', [1.0, 0.0, 0.0]),
+        ('Photo', [0.5, 0.5, 0.5]), ('Photo', [1.0, 1.0, 1.0])])
+    # Lightness 50 with a and b near 0 is a mid gray
+    gray = result[4][1]
+    assert max(gray) - min(gray) < 0.01
+    assert 0.4 < gray[0] < 0.5
+    with pytest.raises(ValueError):
+        read(struct.pack('>HH', 3, 0), 'aco')
+
+
+def test_css():
+    data = (b':root {\n  --red: #f00;\n  /* --skip: #000; */\n'
+            b'  --half: rgba(0, 255, 0, 50%);\n  --pct: rgb(100% 0% 0%);\n'
+            b'  --size: 12px;\n  color: #fff;\n  --alpha: #0000ff80;\n}\n')
+    assert read(data, 'css') == approx([
+        ('Imported', None), ('Imported', [1.0, 0.0, 0.0]),
+        ('Imported', [0.0, 1.0, 0.0, 0.5]), ('Imported', [1.0, 0.0, 0.0]),
+        ('Imported', [0.0, 0.0, 1.0, 128 / 255.0])])
+
+
+def test_css_split_across_chunks(monkeypatch):
+    monkeypatch.setattr(swatches, '_CHUNK_SIZE', 7)
+    data = b'/* long comment */ --a: #010203; --b: rgb(4, 5, 6)'
+    assert read(data, 'css') == approx([
+        ('Imported', None), ('Imported', [1 / 255.0, 2 / 255.0, 3 / 255.0]),
+        ('Imported', [4 / 255.0, 5 / 255.0, 6 / 255.0])])
+
+
+def test_json(monkeypatch):
+    monkeypatch.setattr(swatches, '_CHUNK_SIZE', 5)
+    data = (b'{"a": {"colors": [[1, 0, 0], [0, 0.5, 1, 0.25]]},'
+            b' "b": {"other": 1, "colors": []}}')
+    assert read(data, 'json') == [
+        ('a', None), ('a', [1.0, 0.0, 0.0]), ('a', [0.0, 0.5, 1.0, 0.25]),
+        ('b', None)]
+    with pytest.raises(ValueError):
+        read(b'{"a": {"colors": [[1, 0]]}}', 'json')
+
+
+@pytest.mark.parametrize('swatch_format', swatches.FORMATS)
+def test_round_trip(tmp_path, swatch_format):
+    palettes = store.SQLitePaletteStore(
+        join(str(tmp_path), store.DATABASE_NAME))
+    colors = [[1.0, 0.0, 0.0], [0.0, 128 / 255.0, 1.0], [0.2, 0.4, 0.6]]
+    palettes.create('Source', colors)
+    path = join(str(tmp_path), 'export.' + swatch_format)
+    swatches.export_palettes(palettes, ['Source'], path)
+    names = swatches.import_palettes(palettes, path)
+    assert len(names) == 1 and names[0] != 'Source'
+    assert palettes.get_colors(names[0]) == [
+        pytest.approx(color, abs=1 / 255.0) for color in colors]
+    palettes.close()
+
+
+def test_import_rollback(tmp_path):
+    palettes = store.SQLitePaletteStore(
+        join(str(tmp_path), store.DATABASE_NAME))
+    path = join(str(tmp_path), 'broken.gpl')
+    with open(path, 'wb') as swatch_file:
+        swatch_file.write(b'GIMP Palette\n255 0 0\n0 255\n')
+    with pytest.raises(ValueError):
+        swatches.import_palettes(palettes, path)
+    assert palettes.names() == []
+    palettes.close()